@@ -0,0 +1,226 @@
+"""班级答题数据分析
+
+答题记录只在加载时逐条解析一次，之后所有统计都基于 NumPy 数组向量化计算。
+"""
+from collections import Counter
+
+import numpy as np
+
+from matchers import normalize_text
+
+# 区分度计算中高分组、低分组各占的学生比例
+DISCRIMINATION_GROUP_RATIO = 0.27
+# 正确率分布直方图的分组数（0~100%）
+HISTOGRAM_BINS = 10
+# 用时统计的百分位
+TIME_PERCENTILES = (25, 50, 75, 90, 95)
+# 每个填空返回的最常见错误答案数
+TOP_WRONG_ANSWERS = 5
+
+
+class ClassData:
+    """一个班级（或一段时间内）答题记录的列式存储"""
+
+    def __init__(self, records):
+        student_index = {}
+        question_index = {}
+
+        record_student = []
+        record_question = []
+        record_correct = []
+        record_total = []
+        record_time = []
+        record_hint = []
+
+        blank_question = []
+        blank_position = []
+        blank_correct = []
+        wrong_answers = Counter()
+
+        for record in records:
+            s = student_index.setdefault(record["student_id"], len(student_index))
+            q = question_index.setdefault(record["question_id"], len(question_index))
+            record_student.append(s)
+            record_question.append(q)
+            record_correct.append(record["correct_count"] or 0)
+            record_total.append(record["total_count"] or 0)
+            time_used = record.get("time_used")
+            record_time.append(np.nan if time_used is None else time_used)
+            record_hint.append(bool(record.get("hint_used")))
+
+            for blank in record.get("answer_comparison") or []:
+                blank_question.append(q)
+                blank_position.append(blank["index"])
+                blank_correct.append(bool(blank["is_correct"]))
+                if not blank["is_correct"]:
+                    # 与题目统计相同，按 text 匹配的规范化方式归并错误答案
+                    answer = normalize_text(blank.get("student_answer"))
+                    wrong_answers[(q, blank["index"], answer)] += 1
+
+        self.student_ids = list(student_index)
+        self.question_ids = list(question_index)
+
+        self.student = np.array(record_student, dtype=np.int64)
+        self.question = np.array(record_question, dtype=np.int64)
+        self.correct = np.array(record_correct, dtype=np.float64)
+        self.total = np.array(record_total, dtype=np.float64)
+        self.time_used = np.array(record_time, dtype=np.float64)
+        self.hint_used = np.array(record_hint, dtype=bool)
+
+        self.blank_question = np.array(blank_question, dtype=np.int64)
+        self.blank_position = np.array(blank_position, dtype=np.int64)
+        self.blank_correct = np.array(blank_correct, dtype=bool)
+        self.wrong_answers = wrong_answers
+
+    @property
+    def record_count(self):
+        return len(self.student)
+
+
+def _ratio(numerator, denominator):
+    """逐元素相除，分母为 0 时结果为 nan"""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(denominator > 0, numerator / denominator, np.nan)
+
+
+def _to_list(array, digits=2):
+    """转换为可 JSON 序列化的列表，nan 转为 None"""
+    return [None if np.isnan(v) else round(float(v), digits) for v in array]
+
+
+def student_scores(data):
+    """每个学生的总体正确率（0~1）"""
+    n = len(data.student_ids)
+    correct = np.bincount(data.student, weights=data.correct, minlength=n)
+    total = np.bincount(data.student, weights=data.total, minlength=n)
+    return _ratio(correct, total)
+
+
+def discrimination_index(data, scores):
+    """每道题的区分度：高分组正确率 - 低分组正确率"""
+    n_students = len(data.student_ids)
+    n_questions = len(data.question_ids)
+    group_size = max(1, int(round(n_students * DISCRIMINATION_GROUP_RATIO)))
+    if n_students < 2:
+        return np.full(n_questions, np.nan)
+
+    ranked = np.argsort(np.nan_to_num(scores, nan=-1.0), kind="stable")
+    is_lower = np.zeros(n_students, dtype=bool)
+    is_upper = np.zeros(n_students, dtype=bool)
+    is_lower[ranked[:group_size]] = True
+    is_upper[ranked[-group_size:]] = True
+
+    def group_difficulty(mask):
+        record_mask = mask[data.student]
+        q = data.question[record_mask]
+        correct = np.bincount(q, weights=data.correct[record_mask], minlength=n_questions)
+        total = np.bincount(q, weights=data.total[record_mask], minlength=n_questions)
+        return _ratio(correct, total)
+
+    return group_difficulty(is_upper) - group_difficulty(is_lower)
+
+
+def question_time_percentiles(data):
+    """每道题用时的百分位数，返回 (题目数, 百分位数) 的数组"""
+    n_questions = len(data.question_ids)
+    result = np.full((n_questions, len(TIME_PERCENTILES)), np.nan)
+    if data.record_count == 0:
+        return result
+
+    order = np.argsort(data.question, kind="stable")
+    counts = np.bincount(data.question, minlength=n_questions)
+    groups = np.split(data.time_used[order], np.cumsum(counts)[:-1])
+    for q, times in enumerate(groups):
+        if len(times) and not np.all(np.isnan(times)):
+            result[q] = np.nanpercentile(times, TIME_PERCENTILES)
+    return result
+
+
+def blank_statistics(data):
+    """每道题每个填空的作答次数与难度（正确率），附最常见的错误答案"""
+    n_questions = len(data.question_ids)
+    if len(data.blank_question) == 0:
+        return [[] for _ in range(n_questions)]
+
+    width = int(data.blank_position.max()) + 1
+    key = data.blank_question * width + data.blank_position
+    attempts = np.bincount(key, minlength=n_questions * width).reshape(n_questions, width)
+    correct = np.bincount(key, weights=data.blank_correct, minlength=n_questions * width).reshape(n_questions, width)
+    difficulty = _ratio(correct, attempts)
+
+    top_wrong = {}
+    for (q, position, answer), count in data.wrong_answers.most_common():
+        answers = top_wrong.setdefault((q, position), [])
+        if len(answers) < TOP_WRONG_ANSWERS:
+            answers.append({"answer": answer, "count": count})
+
+    result = []
+    for q in range(n_questions):
+        blanks = []
+        for position in np.nonzero(attempts[q])[0]:
+            blanks.append({
+                "index": int(position),
+                "attempts": int(attempts[q, position]),
+                "difficulty": _to_list([difficulty[q, position]], 3)[0],
+                "common_wrong_answers": top_wrong.get((q, int(position)), [])
+            })
+        result.append(blanks)
+    return result
+
+
+def analyze_class(records, question_titles=None):
+    """计算班级整体分析结果
+
+    records 为答题记录的可迭代对象，需包含 student_id、question_id、correct_count、
+    total_count、time_used、hint_used、answer_comparison 字段。
+    """
+    question_titles = question_titles or {}
+    data = ClassData(records)
+    n_questions = len(data.question_ids)
+
+    scores = student_scores(data)
+    record_accuracy = _ratio(data.correct, data.total) * 100
+
+    attempts = np.bincount(data.question, minlength=n_questions)
+    correct = np.bincount(data.question, weights=data.correct, minlength=n_questions)
+    total = np.bincount(data.question, weights=data.total, minlength=n_questions)
+    hints = np.bincount(data.question, weights=data.hint_used, minlength=n_questions)
+    difficulty = _ratio(correct, total)
+    discrimination = discrimination_index(data, scores)
+    time_percentiles = question_time_percentiles(data)
+    blanks = blank_statistics(data)
+
+    questions = []
+    for q, question_id in enumerate(data.question_ids):
+        questions.append({
+            "question_id": question_id,
+            "title": question_titles.get(question_id),
+            "attempts": int(attempts[q]),
+            "difficulty": _to_list([difficulty[q]], 3)[0],
+            "discrimination": _to_list([discrimination[q]], 3)[0],
+            "hint_rate": _to_list([hints[q] / attempts[q] if attempts[q] else np.nan], 3)[0],
+            "time_percentiles": dict(zip(map(str, TIME_PERCENTILES), _to_list(time_percentiles[q]))),
+            "blanks": blanks[q]
+        })
+
+    valid_accuracy = record_accuracy[~np.isnan(record_accuracy)]
+    valid_scores = scores[~np.isnan(scores)] * 100
+    valid_time = data.time_used[~np.isnan(data.time_used)]
+    bin_edges = np.linspace(0, 100, HISTOGRAM_BINS + 1)
+
+    return {
+        "record_count": data.record_count,
+        "student_count": len(data.student_ids),
+        "question_count": n_questions,
+        "accuracy_histogram": {
+            "bin_edges": bin_edges.tolist(),
+            "records": np.histogram(valid_accuracy, bins=bin_edges)[0].tolist(),
+            "students": np.histogram(valid_scores, bins=bin_edges)[0].tolist()
+        },
+        "time_percentiles": dict(zip(
+            map(str, TIME_PERCENTILES),
+            _to_list(np.percentile(valid_time, TIME_PERCENTILES)) if len(valid_time) else
+            [None] * len(TIME_PERCENTILES)
+        )),
+        "questions": sorted(questions, key=lambda item: (item["difficulty"] is None, item["difficulty"]))
+    }
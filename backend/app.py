@@ -1,23 +1,48 @@
 import os
 import hashlib
+import hmac
+import random
 import uuid
 import json
 import sys
+import time
+import threading
+import atexit
+import functools
+import contextvars
 import statistics
+import math
+import base64
+import csv
+import io
+import logging
 from datetime import datetime
-from flask import Flask, request, jsonify
+import click
+from flask import Flask, Response, abort, g, request, jsonify
 from flask_cors import CORS
-from supabase import create_client, Client
 from dotenv import load_dotenv
-from collections import Counter
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 from flask import send_from_directory
 from pathlib import Path
+import auth
+from live import EventHub, format_sse
+import images
+import logging_setup
+import matchers
+import metrics
+import ratelimit
+import static_assets
+import trends
+from storage import IMAGE_CACHE_MAX_AGE, DuplicateRecord, Storage, create_storage, records_scope_filters
 # ==================== 配置初始化 ====================
 
 # 如果环境变量不存在，直接设置默认值
 # ==================== 修复结束 ====================
 load_dotenv()
 
+logger = logging_setup.setup_logging()
+
 app = Flask(__name__)
 CORS(app, resources={r"/*": {"origins": "*"}})
 
@@ -25,43 +50,184 @@ current_dir = Path(__file__).parent
 frontend_dir = current_dir.parent / 'frontend'
 if frontend_dir.exists():
     sys.path.append(str(frontend_dir))
-# Supabase 配置
+# 存储配置：STORAGE_BACKEND=supabase（默认）或 sqlite（本地离线使用，数据保存在 SQLITE_PATH）
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "supabase")
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
-
-# 教师账号配置
+SQLITE_PATH = os.getenv("SQLITE_PATH", str(current_dir / "quiz.db"))
+LOCAL_UPLOAD_DIR = os.getenv("LOCAL_UPLOAD_DIR", str(current_dir / "uploads"))
+storage = metrics.instrument_storage(create_storage(
+    STORAGE_BACKEND,
+    supabase_url=SUPABASE_URL,
+    supabase_key=SUPABASE_KEY,
+    sqlite_path=SQLITE_PATH,
+    upload_dir=LOCAL_UPLOAD_DIR
+), Storage)
+
+# 教师账号配置：TEACHER_PASSWORD_HASH 为 PBKDF2 哈希（flask --app app hash-password 生成），
+# 未设置时兼容明文的 TEACHER_PASSWORD
 TEACHER_USERNAME = os.getenv("TEACHER_USERNAME")
 TEACHER_PASSWORD = os.getenv("TEACHER_PASSWORD")
+TEACHER_PASSWORD_HASH = os.getenv("TEACHER_PASSWORD_HASH")
+# 教师令牌签名密钥与有效期（秒），可选：未设置时由教师密码的 PBKDF2 哈希派生；
+# 设置时多实例部署的各实例需配置相同的值（Vercel 上在项目的环境变量中添加）
+TEACHER_TOKEN_SECRET = os.getenv("TEACHER_TOKEN_SECRET")
+TEACHER_TOKEN_TTL = int(os.getenv("TEACHER_TOKEN_TTL", str(12 * 3600)))
+
+# 查询配置
+PAGE_SIZE = 1000  # 与 Supabase 默认的单次最大返回行数一致
+RECENT_RECORDS_LIMIT = 10  # 计算进步情况时每个学生取最近的记录数
+MAX_PAGE_LIMIT = PAGE_SIZE  # 分页接口单页最大条数，也是未指定 limit 时的默认值
+
+# 各表允许通过 fields= 参数返回的字段
+QUESTION_FIELDS = {"id", "title", "answers", "answer_types", "image_url", "created_at"}
+OVERALL_RECORD_FIELDS = {"id", "student_id", "student_name", "total_correct", "total_questions",
+                         "total_time", "accuracy", "last_submitted_at", "created_at"}
+DETAIL_RECORD_FIELDS = {"id", "student_id", "student_name", "question_id", "correct_count", "total_count",
+                        "accuracy", "time_used", "hint_used", "answer_comparison", "submitted_at", "session_id"}
+# 场次列表返回的字段（不含题目快照）
+SESSION_FIELDS = ["id", "title", "question_ids", "shuffle", "status", "created_at", "started_at", "ended_at"]
+# 场次快照中每道题保存的字段，学生端返回时去掉 answers、answer_types
+SNAPSHOT_QUESTION_FIELDS = ("id", "title", "answers", "answer_types", "image_url")
+
+# 学生答题趋势：默认窗口（条）与上限；序列缓存的学生数上限，
+# 以及全量重新加载的间隔（秒），用于反映其他实例上的清空操作
+STUDENT_TREND_WINDOW = 10
+MAX_TREND_WINDOW = 200
+STUDENT_TREND_CACHE_MAX = int(os.getenv("STUDENT_TREND_CACHE_MAX", "1000"))
+STUDENT_TREND_REBUILD_INTERVAL = int(os.getenv("STUDENT_TREND_REBUILD_INTERVAL", "600"))
+# 增量加载时从最新提交时间往前重新读取的秒数，覆盖缓冲写入和并发提交造成的写入延迟
+STUDENT_TREND_OVERLAP = int(os.getenv("STUDENT_TREND_OVERLAP", "120"))
+
+# 题目缓存配置（秒），多实例部署时各实例的缓存最多滞后这么久
+QUESTION_CACHE_TTL = int(os.getenv("QUESTION_CACHE_TTL", "300"))
+# 请求的题目不在缓存中时（可能是其他实例新增的），距上次加载超过该秒数才重新加载；
+# 重新加载后仍不存在的题目ID在 QUESTION_NEGATIVE_TTL 秒内直接返回不存在
+QUESTION_MISS_RELOAD_INTERVAL = float(os.getenv("QUESTION_MISS_RELOAD_INTERVAL", "5"))
+QUESTION_NEGATIVE_TTL = float(os.getenv("QUESTION_NEGATIVE_TTL", "30"))
+# 场次缓存（秒）：快照开始后不再变化，只有场次状态（结束）在多实例间最多滞后这么久
+SESSION_CACHE_TTL = int(os.getenv("SESSION_CACHE_TTL", "30"))
+
+# 缓冲写入配置：开启后答题详细记录先进入内存队列，由后台线程批量写入 records 表
+# 仅适用于常驻进程部署（如 gunicorn），Serverless 环境请保持关闭
+SUBMIT_BUFFERED = os.getenv("SUBMIT_BUFFERED", "false").lower() == "true"
+SUBMIT_QUEUE_MAX = int(os.getenv("SUBMIT_QUEUE_MAX", "5000"))  # 队列上限，超出时改为同步写入
+SUBMIT_FLUSH_SIZE = int(os.getenv("SUBMIT_FLUSH_SIZE", "200"))  # 每批写入条数
+SUBMIT_FLUSH_INTERVAL = float(os.getenv("SUBMIT_FLUSH_INTERVAL", "1.0"))  # 最长写入间隔（秒）
+# 同一批连续写入失败该次数后改为逐条写入，找出写不进去的记录，避免一条坏记录堵住整个队列
+SUBMIT_FLUSH_MAX_RETRIES = int(os.getenv("SUBMIT_FLUSH_MAX_RETRIES", "3"))
+# 逐条写入仍失败的记录追加到该 JSONL 文件（死信），同时记录错误日志；不设置时只记日志
+SUBMIT_DEAD_LETTER_PATH = os.getenv("SUBMIT_DEAD_LETTER_PATH")
+
+# 重复提交去重：带 attempt 的提交按 (学生, 题目, attempt) 去重，
+# 批改结果在内存中保留 SUBMIT_DEDUP_TTL 秒、最多 SUBMIT_DEDUP_MAX 条，重试时直接返回
+SUBMIT_DEDUP_TTL = int(os.getenv("SUBMIT_DEDUP_TTL", "600"))
+SUBMIT_DEDUP_MAX = int(os.getenv("SUBMIT_DEDUP_MAX", "10000"))
+
+# 题目统计增量写入间隔（秒），小于等于 0 时每次提交后立即写入（适用于 Serverless）
+QUESTION_STATS_FLUSH_INTERVAL = float(os.getenv("QUESTION_STATS_FLUSH_INTERVAL", "5"))
+# 题目统计中每个填空返回的常见错误答案数
+TOP_WRONG_ANSWERS = 5
+
+# 实时推送配置：gunicorn 多 worker 部署时设置 EVENT_BUS_PATH（SQLite 文件路径）在 worker 间共享事件，
+# 且需使用 gthread/gevent 等支持长连接的 worker
+EVENT_BUS_PATH = os.getenv("EVENT_BUS_PATH")
+LIVE_HEARTBEAT_INTERVAL = 15  # 无事件时发送心跳的间隔（秒），防止代理断开空闲连接
+
+# 后台清空任务（background=true）：任务在本进程的后台线程中运行、进度保存在本进程内存中，
+# 只适用于 gunicorn 等常驻进程；Serverless 环境（Vercel 会设置 VERCEL 环境变量）默认关闭，返回 501
+CLEAR_BACKGROUND_ENABLED = os.getenv("CLEAR_BACKGROUND_ENABLED",
+                                     "false" if os.getenv("VERCEL") else "true").lower() == "true"
+# 后台清空任务每批删除的记录数（按提交时间分批，删除条件在服务端求值，URL 长度与批大小无关）
+CLEAR_CHUNK_SIZE = int(os.getenv("CLEAR_CHUNK_SIZE", "500"))
+
+# 导出时每攒够多少行向客户端输出一次（Parquet 为一个 row group）
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", "1000"))
+
+# 并发查询：一个请求内互不依赖的存储查询并行执行的线程数（所有请求共用）
+FETCH_WORKERS = int(os.getenv("FETCH_WORKERS", "8"))
+
+# 指标接口：设置 METRICS_TOKEN 后抓取 /api/metrics 需携带 Authorization: Bearer <METRICS_TOKEN>
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+# 前端静态文件：默认使用 Vite 构建产物 frontend/dist，未构建时使用 frontend 源文件
+FRONTEND_DIR = os.getenv("FRONTEND_DIR") or str(
+    frontend_dir / "dist" if (frontend_dir / "dist").exists() else frontend_dir)
+# 页面文件允许 CDN/反向代理缓存的秒数（浏览器每次重新验证），全班同时打开页面时由代理直接响应
+STATIC_SHARED_MAX_AGE = int(os.getenv("STATIC_SHARED_MAX_AGE", "60"))
+frontend_assets = static_assets.StaticAssets(FRONTEND_DIR, shared_max_age=STATIC_SHARED_MAX_AGE)
+
+# 启动预热：WARM_UP_ON_START=true 时进程启动后在后台线程中创建数据库客户端、加载题目缓存，
+# 适用于 gunicorn 等常驻进程；Serverless 环境可由平台的定时请求调用 /api/warmup
+WARM_UP_ON_START = os.getenv("WARM_UP_ON_START", "false").lower() == "true"
+
+# 限流：各路由的默认限额，RATE_LIMITS 按路由覆盖（格式见 ratelimit.py），RATE_LIMIT_ENABLED=false 关闭。
+# 全班通常共用一个出口 IP，ip 维度的限额按整个教室估算；student 维度按单个学生ID。
+# gunicorn 多 worker 部署时设置 RATE_LIMIT_PATH（SQLite 文件路径）在 worker 间共享限额；
+# 经过反向代理时 TRUSTED_PROXY_COUNT 为可信代理的层数，从 X-Forwarded-For 中取客户端 IP
+DEFAULT_RATE_LIMITS = ("/api/student/login=ip:300/60,"
+                       "/api/student/submit=student:120/60;ip:6000/60,"
+                       "/api/student/submit-batch=student:10/60;ip:1200/60,"
+                       "/api/teacher/login=ip:10/60,"
+                       "/api/test=ip:30/60")
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+RATE_LIMITS = {**ratelimit.parse_limits(DEFAULT_RATE_LIMITS), **ratelimit.parse_limits(os.getenv("RATE_LIMITS"))}
+RATE_LIMIT_PATH = os.getenv("RATE_LIMIT_PATH")
+TRUSTED_PROXY_COUNT = int(os.getenv("TRUSTED_PROXY_COUNT", "0"))
+
+# 题目图片大小上限（字节），超出时返回 413
+MAX_IMAGE_SIZE = int(os.getenv("MAX_IMAGE_SIZE", str(10 * 1024 * 1024)))
 
 
 
 # ==================== 工具函数 ====================
-def hash_password(password):
-    """密码加密"""
-    return hashlib.md5(password.encode("utf-8")).hexdigest()
+def teacher_signing_key():
+    """当前教师凭据对应的令牌签名密钥，修改账号或密码后旧令牌失效
+
+    未设置 TEACHER_TOKEN_SECRET 时由密码哈希派生；只有明文密码时由它的 PBKDF2 哈希派生，
+    返回的是派生函数，第一次签发或验证令牌时才计算。没有配置密码时返回 None，不签发令牌。
+    """
+    if TEACHER_TOKEN_SECRET:
+        return auth.derive_signing_key(TEACHER_TOKEN_SECRET, TEACHER_USERNAME,
+                                       TEACHER_PASSWORD_HASH or TEACHER_PASSWORD)
+    if TEACHER_PASSWORD_HASH:
+        return auth.derive_signing_key(None, TEACHER_USERNAME, TEACHER_PASSWORD_HASH)
+    if TEACHER_PASSWORD:
+        return functools.partial(auth.derive_password_signing_key, TEACHER_USERNAME, TEACHER_PASSWORD)
+    return None
+
+
+teacher_tokens = auth.TokenManager(teacher_signing_key(), TEACHER_TOKEN_TTL)
+if not TEACHER_TOKEN_SECRET:
+    if TEACHER_PASSWORD_HASH:
+        logger.info("未设置 TEACHER_TOKEN_SECRET，教师令牌的签名密钥由教师账号和密码哈希派生")
+    elif TEACHER_PASSWORD:
+        logger.info("未设置 TEACHER_TOKEN_SECRET，教师令牌的签名密钥由明文 TEACHER_PASSWORD 的 PBKDF2 哈希派生；"
+                    "建议设置 TEACHER_TOKEN_SECRET，或用 flask --app app hash-password 生成密码哈希")
 
 
 def generate_teacher_token():
-    """生成教师认证令牌"""
-    return hash_password(f"{TEACHER_USERNAME}-{TEACHER_PASSWORD}-{datetime.now().timestamp()}")
+    """签发教师令牌"""
+    return teacher_tokens.issue(TEACHER_USERNAME)
 
 
 def verify_teacher(username, password):
-    """验证教师身份"""
-    return username == TEACHER_USERNAME and hash_password(password) == hash_password(TEACHER_PASSWORD)
+    """验证教师身份：配置了密码哈希时按 PBKDF2 验证，否则与明文密码做常量时间比较"""
+    if not username or not password or username != TEACHER_USERNAME:
+        return False
+    if TEACHER_PASSWORD_HASH:
+        return auth.check_password(password, TEACHER_PASSWORD_HASH)
+    return bool(TEACHER_PASSWORD) and hmac.compare_digest(password.encode("utf-8"), TEACHER_PASSWORD.encode("utf-8"))
 
 
 def verify_teacher_token(token):
-    """验证教师令牌"""
-    return token is not None
+    """验证教师令牌：校验签名、有效期和吊销列表，不访问数据库"""
+    return teacher_tokens.verify(token) is not None
 
 
-def normalize_answer(answer):
-    """规范化答案比较（去除首尾空格，忽略大小写）"""
-    if not answer:
-        return ""
-    return answer.strip().lower()
+def is_answer_list(answers):
+    """提交的答案必须是非空的字符串列表，其他类型在写入任何数据之前拒绝"""
+    return isinstance(answers, list) and bool(answers) and all(isinstance(a, str) for a in answers)
 
 
 def format_time_display(seconds):
@@ -70,17 +236,281 @@ def format_time_display(seconds):
     secs = seconds % 60
     return f"{mins:02d}:{secs:02d}"
 
-from flask import send_from_directory
+
+# ==================== 分页与字段筛选 ====================
+def parse_fields(allowed, required=()):
+    """解析 fields= 参数，返回字段列表；未指定时返回 None 表示全部字段
+
+    required 中的字段（如分页游标用到的列）总会包含在结果中。
+    """
+    raw = request.args.get("fields")
+    if not raw:
+        return None
+    fields = [f.strip() for f in raw.split(",") if f.strip()]
+    unknown = [f for f in fields if f not in allowed]
+    if unknown:
+        raise ValueError(f"不支持的字段: {', '.join(unknown)}")
+    for field in required:
+        if field not in fields:
+            fields.append(field)
+    return fields
+
+
+def parse_limit():
+    """解析 limit= 参数，限制在 1 ~ MAX_PAGE_LIMIT 之间"""
+    limit = request.args.get("limit", MAX_PAGE_LIMIT, type=int)
+    return max(1, min(limit, MAX_PAGE_LIMIT))
+
+
+def encode_cursor(row, order_column):
+    """将一页最后一行的排序列和ID编码为游标"""
+    raw = json.dumps([row[order_column], row["id"]], default=str)
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor):
+    """解析 after= 游标，返回 (排序列的值, ID)"""
+    try:
+        value, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return str(value), str(row_id)
+    except (ValueError, TypeError, UnicodeError):
+        raise ValueError("after 游标无效")
+
+
+def fetch_page(table, fields, order_column, desc=False, limit=MAX_PAGE_LIMIT, after=None, filters=()):
+    """按 (排序列, id) 做游标分页查询，返回 (本页数据, 下一页游标)
+
+    游标分页不依赖 offset，翻到多深都只扫描一页的数据。
+    """
+    rows = storage.fetch_page(table, fields, order_column, desc, limit, after, filters)
+    next_cursor = encode_cursor(rows[-1], order_column) if len(rows) == limit else None
+    return rows, next_cursor
+
+
+def iter_rows(table, fields, order_column, desc=False, after=None, filters=()):
+    """逐页遍历查询结果，内存中只保留一页"""
+    while True:
+        rows, next_cursor = fetch_page(table, fields, order_column, desc, PAGE_SIZE, after, filters)
+        yield from rows
+        if not next_cursor:
+            return
+        after = decode_cursor(next_cursor)
+
+
+def ndjson_response(rows):
+    """将行迭代器以 NDJSON 流式返回（每行一个 JSON 对象）"""
+    def generate():
+        for row in rows:
+            yield json.dumps(row, ensure_ascii=False, default=str) + "\n"
+    return Response(generate(), mimetype="application/x-ndjson")
+
+
+def project(row, fields):
+    """只保留指定字段"""
+    return {k: row.get(k) for k in fields} if fields else row
+
+
+# ==================== 并发查询 ====================
+# Supabase 客户端内部复用同一个 httpx.Client，连接保持长连接并放在连接池中，
+# 多个线程同时查询时各自占用池中的连接，不会重新建立 TLS 连接
+_fetch_pool = ThreadPoolExecutor(max_workers=FETCH_WORKERS, thread_name_prefix="fetch")
+
+
+def fetch_concurrently(*calls):
+    """并行执行互不依赖的查询，按顺序返回结果；任一查询出错时抛出该异常
+
+    calls 为无参可调用对象。每个查询在复制的上下文中执行，存储调用仍计入当前请求的指标和日志。
+    查询内部不能再调用 fetch_concurrently，否则可能占满线程池而互相等待。
+    """
+    futures = [_fetch_pool.submit(contextvars.copy_context().run, call) for call in calls]
+    return [future.result() for future in futures]
+
+
+# ==================== 题目缓存 ====================
+_question_cache = {
+    "questions": None,  # 全部题目列表
+    "by_id": {},        # 题目ID -> 题目
+    "matchers": {},     # 题目ID -> 编译好的各填空匹配器，批改时按需编译
+    "missing": {},      # 重新加载后确认不存在的题目ID -> 确认时间
+    "etag": None,
+    "version": 0,       # 每次失效自增，防止失效前发起的加载覆盖新数据
+    "loaded_at": 0.0
+}
+_question_cache_lock = threading.Lock()
+# 同一时刻只有一个线程从存储加载题目，其他线程等待后直接使用加载结果（上课开始时大量请求同时到达）
+_question_load_lock = threading.Lock()
+
+
+def compute_etag(payload):
+    """根据数据内容计算 ETag"""
+    raw = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def _question_cache_fresh():
+    return (_question_cache["questions"] is not None
+            and time.monotonic() - _question_cache["loaded_at"] < QUESTION_CACHE_TTL)
+
+
+def _reload_questions():
+    """从存储加载全部题目并更新缓存，调用方需持有 _question_load_lock
+
+    内容未变的题目沿用原来的对象，已编译的匹配器继续有效。
+    """
+    with _question_cache_lock:
+        version = _question_cache["version"]
+
+    questions = storage.list_questions()
+    etag = compute_etag(questions)
+
+    with _question_cache_lock:
+        if _question_cache["version"] == version:
+            previous = _question_cache["by_id"]
+            questions = [previous[q["id"]] if previous.get(q["id"]) == q else q for q in questions]
+            by_id = {q["id"]: q for q in questions}
+            _question_cache.update({
+                "questions": questions,
+                "by_id": by_id,
+                "matchers": {qid: compiled for qid, compiled in _question_cache["matchers"].items()
+                             if by_id.get(qid) is previous.get(qid)},
+                "missing": {},
+                "etag": etag,
+                "loaded_at": time.monotonic()
+            })
+    return questions, etag
+
+
+def load_questions():
+    """获取全部题目（优先读缓存），返回 (题目列表, ETag)"""
+    with _question_cache_lock:
+        if _question_cache_fresh():
+            return _question_cache["questions"], _question_cache["etag"]
+
+    with _question_load_lock:
+        # 等待期间其他线程可能已经加载完成
+        with _question_cache_lock:
+            if _question_cache_fresh():
+                return _question_cache["questions"], _question_cache["etag"]
+        return _reload_questions()
+
+
+def get_questions(question_ids):
+    """按ID批量获取题目（优先读缓存），返回 {题目ID: 题目}，不存在的ID不在结果中
+
+    缓存中没有的题目可能是其他实例新增的：距上次加载超过 QUESTION_MISS_RELOAD_INTERVAL 时
+    重新加载一次（不清空缓存，同一时刻只有一个线程加载），仍不存在的ID记为不存在，
+    QUESTION_NEGATIVE_TTL 内不再为它重新加载。
+    """
+    question_ids = set(question_ids)
+    load_questions()
+
+    with _question_cache_lock:
+        unknown = _questions_to_reload(question_ids)
+        if not unknown:
+            return {qid: _question_cache["by_id"][qid] for qid in question_ids if qid in _question_cache["by_id"]}
+
+    with _question_load_lock:
+        # 等待期间其他线程可能已经重新加载过
+        with _question_cache_lock:
+            unknown = _questions_to_reload(question_ids)
+        if unknown:
+            _reload_questions()
+
+        with _question_cache_lock:
+            by_id = _question_cache["by_id"]
+            # 加载期间缓存被清空时不记录，新增的题目可能正是要找的
+            if _question_cache_fresh():
+                now = time.monotonic()
+                for qid in unknown - by_id.keys():
+                    _question_cache["missing"][qid] = now
+            return {qid: by_id[qid] for qid in question_ids if qid in by_id}
+
+
+def _questions_to_reload(question_ids):
+    """缓存中没有、也未确认不存在的题目ID；距上次加载不足 QUESTION_MISS_RELOAD_INTERVAL 时返回空集合
+
+    调用方需持有 _question_cache_lock。
+    """
+    now = time.monotonic()
+    if now - _question_cache["loaded_at"] < QUESTION_MISS_RELOAD_INTERVAL:
+        return set()
+    by_id, missing = _question_cache["by_id"], _question_cache["missing"]
+    return {qid for qid in question_ids
+            if qid not in by_id and now - missing.get(qid, float("-inf")) >= QUESTION_NEGATIVE_TTL}
+
+
+def get_question(question_id):
+    """按ID获取题目（优先读缓存），不存在时返回 None"""
+    with _question_cache_lock:
+        if _question_cache_fresh() and question_id in _question_cache["by_id"]:
+            return _question_cache["by_id"][question_id]
+    return get_questions([question_id]).get(question_id)
+
+
+def compile_question_matchers(question):
+    """编译题目各填空的匹配器，answer_types 配置无效时退回默认匹配方式，不影响学生提交"""
+    try:
+        return matchers.compile_question(question)
+    except ValueError as e:
+        logger.warning("题目 %s 的 answer_types 无效，使用默认匹配方式: %s", question["id"], e)
+        return matchers.compile_question({"answers": question["answers"]})
+
+
+def get_question_matchers(question, session=None):
+    """获取题目各填空的匹配器，编译结果随题目缓存，题目变化时一起失效
+
+    按场次快照批改时传入 session，匹配器缓存在该场次的快照中。
+    """
+    if session is not None:
+        return get_session_matchers(session, question)
+
+    with _question_cache_lock:
+        compiled = _question_cache["matchers"].get(question["id"])
+    if compiled is not None:
+        return compiled
+
+    compiled = compile_question_matchers(question)
+
+    with _question_cache_lock:
+        if _question_cache["by_id"].get(question["id"]) is question:
+            _question_cache["matchers"][question["id"]] = compiled
+    return compiled
+
+
+def invalidate_question_cache():
+    """题目发生变化时清空缓存（新增、修改、删除题目或上传图片后调用）"""
+    with _question_cache_lock:
+        _question_cache.update({
+            "questions": None,
+            "by_id": {},
+            "matchers": {},
+            "missing": {},
+            "etag": None,
+            "loaded_at": 0.0
+        })
+        _question_cache["version"] += 1
+
 
 # 提供前端静态文件
 @app.route('/')
 def serve_frontend():
-    return send_from_directory('../frontend', 'index.html')
+    return serve_static_files('index.html')
+
+# 本地存储模式下上传的题目图片
+@app.route('/uploads/<path:filename>')
+def serve_uploaded_image(filename):
+    # 文件名由图片内容决定，同一地址的内容不会改变
+    response = send_from_directory(LOCAL_UPLOAD_DIR, filename, max_age=IMAGE_CACHE_MAX_AGE)
+    response.cache_control.immutable = True
+    return response
 
 # 提供前端静态资源（CSS、JS等）
 @app.route('/<path:path>')
 def serve_static_files(path):
-    return send_from_directory('../frontend', path)
+    response = frontend_assets.response(path)
+    if response is None:
+        abort(404)
+    return response
 
 
 
@@ -93,10 +523,17 @@ def teacher_login():
     password = data.get("password")
 
     if verify_teacher(username, password):
-        token = generate_teacher_token()
+        try:
+            token = generate_teacher_token()
+        except auth.SigningKeyMissing:
+            return jsonify({
+                "success": False,
+                "message": "服务端未配置教师密码，无法签发教师令牌"
+            }), 503
         return jsonify({
             "success": True,
             "token": token,
+            "expires_in": TEACHER_TOKEN_TTL,
             "message": "登录成功"
         }), 200
     else:
@@ -106,8 +543,8 @@ def teacher_login():
         }), 401
 
 
-def update_teacher_credentials(new_username, new_password):
-    """更新教师凭据到环境变量文件"""
+def update_teacher_credentials(new_username, password_hash):
+    """更新教师凭据到环境变量文件（只保存密码哈希，删除明文密码）"""
     try:
         env_path = '.env'
         if not os.path.exists(env_path):
@@ -122,31 +559,43 @@ def update_teacher_credentials(new_username, new_password):
             if line.startswith('TEACHER_USERNAME='):
                 new_lines.append(f'TEACHER_USERNAME={new_username}\n')
                 updated = True
-            elif line.startswith('TEACHER_PASSWORD='):
-                new_lines.append(f'TEACHER_PASSWORD={new_password}\n')
+            elif line.startswith('TEACHER_PASSWORD_HASH='):
+                new_lines.append(f'TEACHER_PASSWORD_HASH={password_hash}\n')
                 updated = True
-            else:
+            elif not line.startswith('TEACHER_PASSWORD='):
                 new_lines.append(line)
 
         if not updated:
             new_lines.append(f'TEACHER_USERNAME={new_username}\n')
-            new_lines.append(f'TEACHER_PASSWORD={new_password}\n')
+        if not any(line.startswith('TEACHER_PASSWORD_HASH=') for line in new_lines):
+            new_lines.append(f'TEACHER_PASSWORD_HASH={password_hash}\n')
 
         with open(env_path, 'w', encoding='utf-8') as f:
             f.writelines(new_lines)
 
         os.environ['TEACHER_USERNAME'] = new_username
-        os.environ['TEACHER_PASSWORD'] = new_password
+        os.environ['TEACHER_PASSWORD_HASH'] = password_hash
+        os.environ.pop('TEACHER_PASSWORD', None)
 
         return True, "更新成功"
     except Exception as e:
         return False, f"更新失败: {str(e)}"
 
 
+@app.route("/api/teacher/logout", methods=["POST"])
+def teacher_logout():
+    """退出登录：吊销当前令牌"""
+    claims = teacher_tokens.verify(request.headers.get("Authorization"))
+    if claims is None:
+        return jsonify({"error": "未授权访问"}), 401
+    teacher_tokens.revoke(claims)
+    return jsonify({"success": True, "message": "已退出登录"}), 200
+
+
 @app.route("/api/teacher/update-account", methods=["POST"])
 def update_teacher_account():
     """更新教师账号信息"""
-    global TEACHER_USERNAME, TEACHER_PASSWORD
+    global TEACHER_USERNAME, TEACHER_PASSWORD, TEACHER_PASSWORD_HASH
 
     token = request.headers.get("Authorization")
     if not token or not verify_teacher_token(token):
@@ -164,11 +613,15 @@ def update_teacher_account():
         return jsonify({"error": "当前密码错误"}), 401
 
     try:
-        success, message = update_teacher_credentials(new_username, new_password)
+        password_hash = auth.hash_password(new_password)
+        success, message = update_teacher_credentials(new_username, password_hash)
 
         if success:
             TEACHER_USERNAME = new_username
-            TEACHER_PASSWORD = new_password
+            TEACHER_PASSWORD = None
+            TEACHER_PASSWORD_HASH = password_hash
+            # 更换签名密钥，之前签发的令牌全部失效
+            teacher_tokens.set_key(teacher_signing_key())
 
             return jsonify({
                 "success": True,
@@ -178,7 +631,7 @@ def update_teacher_account():
             return jsonify({"error": message}), 500
 
     except Exception as e:
-        print(f"更新账号失败: {str(e)}")
+        logger.exception("更新账号失败")
         return jsonify({"error": f"更新账号失败：{str(e)}"}), 500
 
 
@@ -190,67 +643,64 @@ def upload_image():
     if not token or not verify_teacher_token(token):
         return jsonify({"error": "未授权访问"}), 401
 
-    print("=== 开始图片上传处理 ===")
+    # 在解析表单之前按 Content-Length 拒绝过大的请求（留出表单字段的余量）
+    if request.content_length and request.content_length > MAX_IMAGE_SIZE + 64 * 1024:
+        return jsonify({"error": f"图片不能超过 {MAX_IMAGE_SIZE // (1024 * 1024)}MB"}), 413
 
     if "image" not in request.files:
-        print("错误: 未找到image字段")
+        logger.info("图片上传失败：未找到 image 字段")
         return jsonify({"error": "未上传图片"}), 400
 
     file = request.files["image"]
     if file.filename == "":
-        print("错误: 文件名为空")
+        logger.info("图片上传失败：文件名为空")
         return jsonify({"error": "未选择图片"}), 400
 
-    print(f"接收文件: {file.filename}, 类型: {file.content_type}, 大小: {len(file.read())}")
-
-    file.seek(0)
-
-    allowed_extensions = {"png", "jpg", "jpeg", "gif"}
-    file_ext = file.filename.rsplit('.', 1)[-1].lower() if '.' in file.filename else ""
-
-    if file_ext not in allowed_extensions:
-        print(f"错误: 不支持的格式: {file_ext}")
-        return jsonify({"error": "仅支持png、jpg、jpeg、gif格式"}), 400
-
     try:
-        filename = f"{uuid.uuid4()}.{file_ext}"
-        file_data = file.read()
-
-        if len(file_data) == 0:
-            raise Exception("文件数据为空")
+        file_data, digest = images.read_limited(file.stream, MAX_IMAGE_SIZE)
+    except images.ImageTooLarge:
+        return jsonify({"error": f"图片不能超过 {MAX_IMAGE_SIZE // (1024 * 1024)}MB"}), 413
 
-        print(f"文件数据大小: {len(file_data)} 字节")
+    if len(file_data) == 0:
+        logger.info("图片上传失败：文件数据为空")
+        return jsonify({"error": "图片内容为空"}), 400
 
-        upload_response = supabase.storage.from_("question-images").upload(
-            file=file_data,
-            path=filename,
-            file_options={"content-type": file.content_type}
-        )
+    # 按文件内容判断格式，不信任扩展名和客户端提供的 Content-Type
+    image_format = images.detect_format(file_data)
+    if image_format is None:
+        logger.info("图片上传失败：不支持的格式", extra={"data": {"original_filename": file.filename}})
+        return jsonify({"error": "仅支持png、jpg、jpeg、gif、webp格式"}), 400
+    _, file_ext, content_type = image_format
 
-        if hasattr(upload_response, 'error') and upload_response.error:
-            raise Exception(f"图片上传失败: {upload_response.error}")
-
-        print("图片上传成功")
-
-        public_url_response = supabase.storage.from_("question-images").get_public_url(filename)
-
-        if hasattr(public_url_response, 'public_url'):
-            public_url = public_url_response.public_url
-        else:
-            public_url = f"{SUPABASE_URL}/storage/v1/object/public/question-images/{filename}"
+    try:
+        variant_urls = {}
+        for name, variant_format, variant_filename, variant_data, variant_type in images.build_variants(file_data, digest):
+            variant_urls.setdefault(name, {})[variant_format] = storage.upload_image(
+                variant_filename, variant_data, variant_type)
+        # 原图最后上传，各版本都已就绪后才返回地址
+        original_url = storage.upload_image(images.original_filename(digest, file_ext), file_data, content_type)
+
+        display = variant_urls.get(images.DISPLAY_VARIANT, {})
+        public_url = display.get("webp", original_url)
+        logger.info("图片上传成功", extra={"data": {
+            "original_filename": file.filename,
+            "content_type": content_type,
+            "size": len(file_data),
+            "variants": len(variant_urls),
+            "image_url": public_url
+        }})
 
-        print(f"生成的公开URL: {public_url}")
+        invalidate_question_cache()
 
         return jsonify({
             "success": True,
-            "image_url": public_url
+            "image_url": public_url,
+            "original_url": original_url,
+            "variants": variant_urls
         }), 200
 
     except Exception as e:
-        print(f"图片上传错误: {str(e)}")
-        import traceback
-        error_details = traceback.format_exc()
-        print(f"错误堆栈:\n{error_details}")
+        logger.exception("图片上传失败")
         return jsonify({"error": f"图片上传失败：{str(e)}"}), 500
 
 
@@ -265,23 +715,34 @@ def add_question():
     data = request.get_json()
     title = data.get("title")
     answers = data.get("answers")
+    answer_types = data.get("answer_types")
     image_url = data.get("image_url")
 
     if not title or not answers or not isinstance(answers, list) or len(answers) == 0:
         return jsonify({"error": "题目标题和答案不能为空"}), 400
 
+    question = {
+        "id": str(uuid.uuid4()),
+        "title": title,
+        "answers": answers,
+        "image_url": image_url,
+        "created_at": datetime.now().isoformat()
+    }
+    # 只在指定了匹配方式时写入 answer_types，未执行 sql/answer_types.sql 的数据库仍可添加普通题目
+    if answer_types:
+        question["answer_types"] = answer_types
+        try:
+            matchers.compile_question(question)
+        except ValueError as e:
+            return jsonify({"error": f"答案类型配置无效：{str(e)}"}), 400
+
     try:
-        response = supabase.table("questions").insert({
-            "id": str(uuid.uuid4()),
-            "title": title,
-            "answers": answers,
-            "image_url": image_url,
-            "created_at": datetime.now().isoformat()
-        }).execute()
+        question = storage.insert_question(question)
+        invalidate_question_cache()
         return jsonify({
             "success": True,
             "message": "题目添加成功",
-            "data": response.data[0]
+            "data": question
         }), 201
     except Exception as e:
         return jsonify({"error": f"添加失败：{str(e)}"}), 500
@@ -289,20 +750,256 @@ def add_question():
 
 
 
+# ==================== 答题场次 ====================
+# 场次ID -> 缓存项：session（场次信息）、questions（题目ID -> 冻结的题目）、order（场次的题目顺序）、
+# fragments（题目ID -> 去掉答案后序列化好的 JSON）、body（按场次顺序的完整响应）、matchers、etag、loaded_at
+_session_cache = {}
+_session_cache_lock = threading.Lock()
+
+
+def build_session_snapshot(questions):
+    """按场次顺序冻结题目，保留批改需要的答案和匹配方式"""
+    return [{key: question.get(key) for key in SNAPSHOT_QUESTION_FIELDS} for question in questions]
+
+
+def strip_answers(question):
+    """学生端返回的题目：去掉答案，只给出填空数量"""
+    return {
+        "id": question["id"],
+        "title": question["title"],
+        "image_url": question.get("image_url"),
+        "blank_count": len(question["answers"])
+    }
+
+
+def render_session_quiz(entry, order):
+    """拼接预先序列化好的题目，不在每个请求中重新序列化"""
+    header = json.dumps({"id": entry["session"]["id"], "title": entry["session"]["title"]}, ensure_ascii=False)
+    return f'{{"session": {header}, "data": [{", ".join(entry["fragments"][qid] for qid in order)}]}}'
+
+
+def _build_session_entry(row, previous=None):
+    session = {key: row.get(key) for key in SESSION_FIELDS}
+    if previous is not None and previous["etag"] is not None:
+        # 快照开始后不再变化，刷新时只更新场次状态
+        return {**previous, "session": session, "loaded_at": time.monotonic()}
+
+    snapshot = row.get("snapshot") or []
+    entry = {
+        "session": session,
+        "questions": {q["id"]: q for q in snapshot},
+        "order": [q["id"] for q in snapshot],
+        "fragments": {q["id"]: json.dumps(strip_answers(q), ensure_ascii=False) for q in snapshot},
+        "matchers": {},
+        "etag": compute_etag(snapshot) if snapshot else None,
+        "loaded_at": time.monotonic()
+    }
+    entry["body"] = render_session_quiz(entry, entry["order"])
+    return entry
+
+
+def load_session(session_id):
+    """获取场次及其题目快照（优先读缓存），不存在时返回 None"""
+    with _session_cache_lock:
+        entry = _session_cache.get(session_id)
+    if entry is not None and time.monotonic() - entry["loaded_at"] < SESSION_CACHE_TTL:
+        return entry
+
+    # 已缓存快照时只查询场次状态，不再读取快照
+    fields = SESSION_FIELDS if entry is not None and entry["etag"] is not None else None
+    rows = storage.select("quiz_sessions", fields, [("id", "eq", session_id)])
+    if not rows:
+        return None
+    entry = _build_session_entry(rows[0], entry)
+    with _session_cache_lock:
+        _session_cache[session_id] = entry
+    return entry
+
+
+def invalidate_session_cache(session_id):
+    with _session_cache_lock:
+        _session_cache.pop(session_id, None)
+
+
+def open_session(session_id):
+    """获取进行中的场次，返回 (场次, None)；场次不存在、未开始或已结束时返回 (None, 错误响应)"""
+    entry = load_session(session_id)
+    if entry is None:
+        return None, (jsonify({"error": "场次不存在"}), 404)
+    if entry["session"]["status"] != "active":
+        return None, (jsonify({"error": "场次未开始或已结束"}), 409)
+    return entry, None
+
+
+def session_question_order(entry, student_id):
+    """学生在场次中的题目顺序，打乱时以场次和学生ID为种子，同一学生刷新页面顺序不变"""
+    if not entry["session"]["shuffle"] or not student_id:
+        return entry["order"]
+    order = list(entry["order"])
+    random.Random(f"{entry['session']['id']}:{student_id}").shuffle(order)
+    return order
+
+
+def get_session_matchers(entry, question):
+    """场次快照中题目的匹配器，随快照缓存"""
+    compiled = entry["matchers"].get(question["id"])
+    if compiled is None:
+        compiled = compile_question_matchers(question)
+        entry["matchers"][question["id"]] = compiled
+    return compiled
+
+
+@app.route("/api/sessions", methods=["POST"])
+def create_session():
+    """创建答题场次（草稿）
+
+    请求体：title、question_ids（有序的题目ID列表）、shuffle（是否为每个学生打乱题目顺序，默认 false）。
+    """
+    token = request.headers.get("Authorization")
+    if not token or not verify_teacher_token(token):
+        return jsonify({"error": "未授权访问"}), 401
+
+    data = request.get_json(silent=True) or {}
+    title = data.get("title")
+    question_ids = data.get("question_ids")
+
+    if not title or not isinstance(question_ids, list) or not question_ids:
+        return jsonify({"error": "场次名称和题目列表不能为空"}), 400
+    if not all(isinstance(qid, str) for qid in question_ids) or len(set(question_ids)) != len(question_ids):
+        return jsonify({"error": "题目列表必须是不重复的题目ID"}), 400
+
+    try:
+        questions = get_questions(question_ids)
+        missing = [qid for qid in question_ids if qid not in questions]
+        if missing:
+            return jsonify({"error": "题目不存在", "question_ids": missing}), 404
+
+        session = storage.insert_session({
+            "id": str(uuid.uuid4()),
+            "title": title,
+            "question_ids": question_ids,
+            "shuffle": bool(data.get("shuffle", False)),
+            "status": "draft",
+            "created_at": datetime.now().isoformat()
+        })
+        return jsonify({"success": True, "data": project(session, SESSION_FIELDS)}), 201
+    except Exception as e:
+        logger.exception("创建场次失败")
+        return jsonify({"error": f"创建场次失败：{str(e)}"}), 500
+
+
+@app.route("/api/sessions", methods=["GET"])
+def list_sessions():
+    """获取全部场次（不含题目快照），最新创建的在前"""
+    token = request.headers.get("Authorization")
+    if not token or not verify_teacher_token(token):
+        return jsonify({"error": "未授权访问"}), 401
+
+    try:
+        sessions = storage.select("quiz_sessions", SESSION_FIELDS, order=[("created_at", True)])
+        return jsonify({"data": sessions}), 200
+    except Exception as e:
+        return jsonify({"error": f"获取场次失败：{str(e)}"}), 500
+
+
+@app.route("/api/sessions/<session_id>/start", methods=["POST"])
+def start_session(session_id):
+    """开始场次：冻结题目快照，之后修改或删除题目不影响进行中的场次"""
+    token = request.headers.get("Authorization")
+    if not token or not verify_teacher_token(token):
+        return jsonify({"error": "未授权访问"}), 401
+
+    try:
+        rows = storage.select("quiz_sessions", SESSION_FIELDS, [("id", "eq", session_id)])
+        if not rows:
+            return jsonify({"error": "场次不存在"}), 404
+        question_ids = rows[0]["question_ids"]
+
+        # 直接读取存储而不是题目缓存，快照以开始时数据库中的题目为准
+        questions = {q["id"]: q for q in storage.select("questions", filters=[("id", "in", question_ids)])}
+        missing = [qid for qid in question_ids if qid not in questions]
+        if missing:
+            return jsonify({"error": "场次中的题目已被删除", "question_ids": missing}), 409
+
+        session = storage.update_session(session_id, {
+            "status": "active",
+            "snapshot": build_session_snapshot(questions[qid] for qid in question_ids),
+            "started_at": datetime.now().isoformat()
+        }, status="draft")
+        if session is None:
+            return jsonify({"error": "场次已开始或已结束"}), 409
+
+        invalidate_session_cache(session_id)
+        logger.info("场次已开始", extra={"data": {"session_id": session_id, "questions": len(question_ids)}})
+        return jsonify({"success": True, "data": project(session, SESSION_FIELDS)}), 200
+    except Exception as e:
+        logger.exception("开始场次失败")
+        return jsonify({"error": f"开始场次失败：{str(e)}"}), 500
+
+
+@app.route("/api/sessions/<session_id>/end", methods=["POST"])
+def end_session(session_id):
+    """结束场次，之后不再接受该场次的提交"""
+    token = request.headers.get("Authorization")
+    if not token or not verify_teacher_token(token):
+        return jsonify({"error": "未授权访问"}), 401
+
+    try:
+        session = storage.update_session(session_id, {
+            "status": "ended",
+            "ended_at": datetime.now().isoformat()
+        }, status="active")
+        if session is None:
+            if not storage.select("quiz_sessions", ["id"], [("id", "eq", session_id)]):
+                return jsonify({"error": "场次不存在"}), 404
+            return jsonify({"error": "场次未开始或已结束"}), 409
+
+        invalidate_session_cache(session_id)
+        logger.info("场次已结束", extra={"data": {"session_id": session_id}})
+        return jsonify({"success": True, "data": project(session, SESSION_FIELDS)}), 200
+    except Exception as e:
+        logger.exception("结束场次失败")
+        return jsonify({"error": f"结束场次失败：{str(e)}"}), 500
+
+
+@app.route("/api/student/sessions/<session_id>/quiz", methods=["GET"])
+def get_session_quiz(session_id):
+    """获取进行中场次的题目（不含答案，每题给出 blank_count）
+
+    题目来自场次开始时冻结的快照，响应由缓存中序列化好的题目拼接而成，不查询题目表。
+    打乱顺序的场次需传 student_id，同一学生每次得到相同的顺序。
+    """
+    try:
+        session, error = open_session(session_id)
+        if error:
+            return error
+
+        order = session_question_order(session, request.args.get("student_id"))
+        etag = session["etag"] if order is session["order"] else compute_etag([session["etag"], order])
+
+        if request.if_none_match.contains(etag):
+            response = app.response_class(status=304)
+        else:
+            body = session["body"] if order is session["order"] else render_session_quiz(session, order)
+            response = app.response_class(body, mimetype="application/json")
+        response.set_etag(etag)
+        response.headers["Cache-Control"] = "no-cache"
+        return response
+    except Exception as e:
+        return jsonify({"error": f"获取题目失败：{str(e)}"}), 500
+
+
 # ==================== 学生答题模块 ====================
 @app.route("/api/student/login", methods=["POST"])
 def student_login():
     """学生登录"""
     try:
         data = request.get_json()
-        print(f"=== 学生登录请求 ===")
-        print(f"请求数据: {data}")
 
         if not data:
             return jsonify({"error": "请求数据为空"}), 400
 
         name = data.get("name")
-        print(f"获取到的姓名: {name}")
 
         if not name:
             return jsonify({"error": "请输入姓名"}), 400
@@ -313,24 +1010,39 @@ def student_login():
             "student_id": student_id,
             "name": name
         }
-        print(f"返回数据: {response_data}")
+        if logging_setup.is_enabled(logging.DEBUG):
+            logger.debug("学生登录", extra={"data": response_data})
         return jsonify(response_data), 200
 
     except Exception as e:
-        print(f"学生登录异常: {str(e)}")
-        import traceback
-        print(f"错误详情: {traceback.format_exc()}")
+        logger.exception("学生登录失败")
         return jsonify({"error": f"登录处理失败：{str(e)}"}), 500
 
 
 @app.route("/api/student/quiz", methods=["GET"])
 def get_quiz():
-    """获取所有题目用于答题"""
+    """获取所有题目用于答题，可通过 fields= 只返回部分字段"""
     try:
-        response = supabase.table("questions").select("*").execute()
-        if not response.data:
+        fields = parse_fields(QUESTION_FIELDS, required=["id"])
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        questions, etag = load_questions()
+        if not questions:
             return jsonify({"error": "暂无题目"}), 404
-        return jsonify({"data": response.data}), 200
+        if fields:
+            questions = [project(q, fields) for q in questions]
+            etag = compute_etag([etag, fields])
+
+        # 浏览器刷新时题目未变化则直接返回 304
+        if request.if_none_match.contains(etag):
+            response = app.response_class(status=304)
+        else:
+            response = jsonify({"data": questions})
+        response.set_etag(etag)
+        response.headers["Cache-Control"] = "no-cache"
+        return response
     except Exception as e:
         return jsonify({"error": f"获取题目失败：{str(e)}"}), 500
 
@@ -344,96 +1056,70 @@ def submit_answer():
     user_answers = data.get("answers")
     time_used = data.get("time_used")
     hint_used = data.get("hint_used", False)
+    session_id = data.get("session_id")
 
     if not all([student_id, student_name, question_id, user_answers]):
         return jsonify({"error": "提交数据不完整"}), 400
+    if not is_answer_list(user_answers):
+        return jsonify({"error": "answers 必须是字符串列表"}), 400
+    if not is_valid_time_used(time_used):
+        return jsonify({"error": "time_used 必须是非负数"}), 400
 
     try:
-        # 获取正确答案
-        question_response = supabase.table("questions").select("*").eq("id", question_id).execute()
-        if not question_response.data:
-            return jsonify({"error": "题目不存在"}), 404
-
-        question = question_response.data[0]
-        correct_answers = question["answers"]
-
-        # 计算正确数量并保存答案对比
-        correct_count = 0
-        answer_comparison = []  # 新增：存储每个答案的对比结果
-
-        for i, (user_answer, correct_answer) in enumerate(zip(user_answers, correct_answers)):
-            norm_user = normalize_answer(user_answer)
-            norm_correct = normalize_answer(correct_answer)
+        attempt = parse_attempt(data.get("attempt"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
-            is_correct = norm_user == norm_correct
-            if is_correct:
-                correct_count += 1
+    # 同一次作答的重试直接返回上次的批改结果，不再访问数据库
+    record_id = submission_record_id(student_id, question_id, attempt) if attempt else None
+    if record_id:
+        cached = get_submission_result(record_id)
+        if cached is not None:
+            return jsonify(cached), 200
 
-            answer_comparison.append({
-                "index": i,
-                "student_answer": user_answer,
-                "correct_answer": correct_answer,
-                "is_correct": is_correct
-            })
+    try:
+        # 获取正确答案：在场次中提交时使用场次开始时冻结的题目快照
+        session = None
+        if session_id:
+            session, error = open_session(session_id)
+            if error:
+                return error
+            question = session["questions"].get(question_id)
+        else:
+            question = get_question(question_id)
+        if not question:
+            return jsonify({"error": "题目不存在"}), 404
 
+        correct_answers = question["answers"]
+        correct_count, answer_comparison = grade_answers(user_answers, question, session)
         total_count = len(correct_answers)
         accuracy = (correct_count / total_count) * 100 if total_count > 0 else 0
 
-        print(f"答案比较详情:")
-        print(f"用户答案: {user_answers}")
-        print(f"正确答案: {correct_answers}")
-        print(f"正确数量: {correct_count}/{total_count}")
-        print(f"答案对比数据: {answer_comparison}")
-
-        # 检查是否已有该学生的总体记录
-        existing_record = supabase.table("student_overall_records").select("*").eq("student_id", student_id).execute()
-
-        if existing_record.data:
-            # 更新现有记录
-            record = existing_record.data[0]
-            new_total_correct = record["total_correct"] + correct_count
-            new_total_questions = record["total_questions"] + total_count
-            new_total_time = record["total_time"] + time_used
-
-            update_response = supabase.table("student_overall_records").update({
-                "total_correct": new_total_correct,
-                "total_questions": new_total_questions,
-                "total_time": new_total_time,
-                "accuracy": (new_total_correct / new_total_questions) * 100,
-                "last_submitted_at": datetime.now().isoformat()
-            }).eq("student_id", student_id).execute()
-        else:
-            # 创建新记录
-            new_record = {
-                "id": str(uuid.uuid4()),
+        if logging_setup.is_enabled(logging.DEBUG):
+            logger.debug("答案比较详情", extra={"data": {
                 "student_id": student_id,
-                "student_name": student_name,
-                "total_correct": correct_count,
-                "total_questions": total_count,
-                "total_time": time_used,
-                "accuracy": accuracy,
-                "last_submitted_at": datetime.now().isoformat(),
-                "created_at": datetime.now().isoformat()
-            }
-            supabase.table("student_overall_records").insert(new_record).execute()
-
-        # 同时保存详细答题记录，包含具体答案对比
-        detail_record = {
-            "id": str(uuid.uuid4()),
-            "student_id": student_id,
-            "student_name": student_name,
-            "question_id": question_id,
-            "correct_count": correct_count,
-            "total_count": total_count,
-            "accuracy": accuracy,
-            "time_used": time_used,
-            "hint_used": hint_used,
-            "answer_comparison": answer_comparison,  # 新增：存储答案对比详情
-            "submitted_at": datetime.now().isoformat()
-        }
-        supabase.table("records").insert(detail_record).execute()
+                "question_id": question_id,
+                "user_answers": user_answers,
+                "correct_answers": correct_answers,
+                "score": f"{correct_count}/{total_count}",
+                "answer_comparison": answer_comparison
+            }})
+
+        submitted_at = datetime.now().isoformat()
+        detail_record = build_detail_record(student_id, student_name, question_id, correct_count, total_count,
+                                            time_used, hint_used, answer_comparison, submitted_at, session_id,
+                                            record_id)
+        overall_record = build_overall_record(student_id, student_name, [detail_record], submitted_at)
+        try:
+            overall_record = save_attempt(detail_record, overall_record)
+        except DuplicateRecord:
+            # 已由其他实例写入，或本地去重缓存已过期：记录和统计都不再重复累加，批改结果与上次相同
+            logger.info("重复提交已忽略", extra={"data": {"student_id": student_id, "question_id": question_id}})
+        else:
+            record_question_stats(question_id, answer_comparison, time_used, hint_used)
+            publish_submission_event(detail_record, overall_record, question)
 
-        return jsonify({
+        result = {
             "success": True,
             "score": f"{correct_count}/{total_count}",
             "accuracy": f"{accuracy:.1f}%",
@@ -441,38 +1127,695 @@ def submit_answer():
             "answer_comparison": answer_comparison,  # 返回答案对比详情
             "debug_info": {
                 "user_answers": user_answers,
-                "normalized_user_answers": [normalize_answer(a) for a in user_answers],
-                "normalized_correct_answers": [normalize_answer(a) for a in correct_answers]
+                "normalized_user_answers": [matchers.normalize_text(a) for a in user_answers],
+                "normalized_correct_answers": [matchers.normalize_text(a) for a in correct_answers]
             }
-        }), 200
+        }
+        if record_id:
+            remember_submission_result(record_id, result)
+        return jsonify(result), 200
 
     except Exception as e:
-        print(f"提交失败: {str(e)}")
+        logger.exception("提交失败")
         return jsonify({"error": f"提交失败：{str(e)}"}), 500
 
 
+@app.route("/api/student/submit-batch", methods=["POST"])
+def submit_answers_batch():
+    """一次提交整份答卷
+
+    请求体：student_id、name、submissions（每项包含 question_id、answers、time_used、hint_used），
+    在场次中答题时另带 session_id，按场次的题目快照批改；带 attempt 时同一次作答的重试只写入一次。
+    题目从缓存中一次取出，在内存中批改，答题记录一次批量写入，学生总体统计只累加一次。
+    每题的返回结果与 /api/student/submit 相同；已不存在的题目不保存，题目ID列在 skipped 中，
+    全部题目都不存在时返回 404。
+    """
+    data = request.get_json(silent=True) or {}
+    student_id = data.get("student_id")
+    student_name = data.get("name")
+    submissions = data.get("submissions")
+    session_id = data.get("session_id")
+
+    if not all([student_id, student_name, submissions]) or not isinstance(submissions, list):
+        return jsonify({"error": "提交数据不完整"}), 400
+    if any(not isinstance(item, dict) or not item.get("question_id") or not item.get("answers")
+           for item in submissions):
+        return jsonify({"error": "提交数据不完整"}), 400
+    if not all(is_answer_list(item["answers"]) for item in submissions):
+        return jsonify({"error": "answers 必须是字符串列表"}), 400
+    if not all(is_valid_time_used(item.get("time_used")) for item in submissions):
+        return jsonify({"error": "time_used 必须是非负数"}), 400
+
+    try:
+        attempt = parse_attempt(data.get("attempt"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    record_ids = [None] * len(submissions)
+    batch_key = None
+    if attempt:
+        record_ids = [submission_record_id(student_id, item["question_id"], attempt) for item in submissions]
+        if len(set(record_ids)) != len(record_ids):
+            return jsonify({"error": "同一次提交中题目不能重复"}), 400
+        batch_key = compute_etag(record_ids)
+        cached = get_submission_result(batch_key)
+        if cached is not None:
+            return jsonify(cached), 200
+
+    try:
+        session = None
+        if session_id:
+            session, error = open_session(session_id)
+            if error:
+                return error
+            questions = session["questions"]
+        else:
+            questions = get_questions(item["question_id"] for item in submissions)
+        # 答题期间被删除的题目跳过，其余题目照常批改和保存，不让整份答卷作废
+        skipped = [item["question_id"] for item in submissions if item["question_id"] not in questions]
+        graded = [(item, record_id) for item, record_id in zip(submissions, record_ids)
+                  if item["question_id"] in questions]
+        if not graded:
+            return jsonify({"error": "题目不存在", "question_ids": skipped}), 404
+        if skipped:
+            logger.info("批量提交中的题目已不存在，已跳过",
+                        extra={"data": {"student_id": student_id, "question_ids": skipped}})
+
+        submitted_at = datetime.now().isoformat()
+        detail_records = []
+        results = []
+        for item, record_id in graded:
+            question = questions[item["question_id"]]
+            correct_answers = question["answers"]
+            correct_count, answer_comparison = grade_answers(item["answers"], question, session)
+            total_count = len(correct_answers)
+            accuracy = (correct_count / total_count) * 100 if total_count > 0 else 0
+
+            detail_records.append(build_detail_record(
+                student_id, student_name, item["question_id"], correct_count, total_count,
+                item.get("time_used"), item.get("hint_used", False), answer_comparison, submitted_at, session_id,
+                record_id
+            ))
+            results.append({
+                "question_id": item["question_id"],
+                "score": f"{correct_count}/{total_count}",
+                "accuracy": f"{accuracy:.1f}%",
+                "correct_answers": correct_answers,
+                "answer_comparison": answer_comparison
+            })
+
+        overall_record, saved_records = save_attempts_once(student_id, student_name, detail_records, submitted_at)
+        for detail_record in saved_records:
+            record_question_stats(detail_record["question_id"], detail_record["answer_comparison"],
+                                  detail_record["time_used"], detail_record["hint_used"])
+            publish_submission_event(detail_record, overall_record, questions[detail_record["question_id"]])
+
+        total_correct = sum(r["correct_count"] for r in detail_records)
+        total_count = sum(r["total_count"] for r in detail_records)
+        result = {
+            "success": True,
+            "score": f"{total_correct}/{total_count}",
+            "accuracy": f"{(total_correct / total_count) * 100 if total_count else 0:.1f}%",
+            "results": results,
+            "skipped": skipped
+        }
+        if batch_key:
+            remember_submission_result(batch_key, result)
+        return jsonify(result), 200
+
+    except Exception as e:
+        logger.exception("批量提交失败")
+        return jsonify({"error": f"提交失败：{str(e)}"}), 500
+
+
+def grade_answers(user_answers, question, session=None):
+    """按题目各填空的匹配方式逐空批改，返回 (正确数量, 答案对比列表)"""
+    correct_count = 0
+    answer_comparison = []
+
+    blank_matchers = get_question_matchers(question, session)
+    for i, (user_answer, correct_answer) in enumerate(zip(user_answers, question["answers"])):
+        is_correct, _ = blank_matchers[i].match(user_answer)
+        if is_correct:
+            correct_count += 1
+
+        answer_comparison.append({
+            "index": i,
+            "student_answer": user_answer,
+            "correct_answer": correct_answer,
+            "is_correct": is_correct
+        })
+    return correct_count, answer_comparison
+
+
+def build_detail_record(student_id, student_name, question_id, correct_count, total_count, time_used, hint_used,
+                        answer_comparison, submitted_at, session_id=None, record_id=None):
+    """详细答题记录，包含具体答案对比；record_id 为按作答标识生成的固定ID，未提供时随机生成"""
+    record = {
+        "id": record_id or str(uuid.uuid4()),
+        "student_id": student_id,
+        "student_name": student_name,
+        "question_id": question_id,
+        "correct_count": correct_count,
+        "total_count": total_count,
+        "accuracy": (correct_count / total_count) * 100 if total_count > 0 else 0,
+        "time_used": time_used,
+        "hint_used": hint_used,
+        "answer_comparison": answer_comparison,
+        "submitted_at": submitted_at
+    }
+    # 只在场次中提交时写入 session_id，未执行 sql/quiz_sessions.sql 的数据库仍可正常提交
+    if session_id:
+        record["session_id"] = session_id
+    return record
+
+
+def build_overall_record(student_id, student_name, detail_records, submitted_at):
+    """学生首次答题时的总体记录（合计 detail_records），已有记录则在数据库中累加"""
+    total_correct = sum(r["correct_count"] for r in detail_records)
+    total_questions = sum(r["total_count"] for r in detail_records)
+    return {
+        "id": str(uuid.uuid4()),
+        "student_id": student_id,
+        "student_name": student_name,
+        "total_correct": total_correct,
+        "total_questions": total_questions,
+        "total_time": sum(r["time_used"] or 0 for r in detail_records),
+        "accuracy": (total_correct / total_questions) * 100 if total_questions > 0 else 0,
+        "last_submitted_at": submitted_at,
+        "created_at": submitted_at
+    }
+
+
+# ==================== 实时推送 ====================
+event_hub = EventHub(EVENT_BUS_PATH)
+
+
+def publish_submission_event(detail_record, overall_record, question):
+    """推送一次提交事件：学生得分、学生累计统计和该题正确率的增量，推送失败不影响提交"""
+    try:
+        event_hub.publish("submission", {
+            "student_id": detail_record["student_id"],
+            "student_name": detail_record["student_name"],
+            "question_id": detail_record["question_id"],
+            "question_title": question.get("title"),
+            "session_id": detail_record.get("session_id"),
+            "score": f"{detail_record['correct_count']}/{detail_record['total_count']}",
+            "accuracy": detail_record["accuracy"],
+            "time_used": detail_record["time_used"],
+            "hint_used": detail_record["hint_used"],
+            "submitted_at": detail_record["submitted_at"],
+            "student_totals": {
+                "total_correct": overall_record.get("total_correct"),
+                "total_questions": overall_record.get("total_questions"),
+                "accuracy": overall_record.get("accuracy")
+            } if overall_record else None,
+            # 教师端将增量累加到该题的正确率上
+            "question_delta": {
+                "attempts": 1,
+                "correct_count": detail_record["correct_count"],
+                "total_count": detail_record["total_count"]
+            }
+        })
+    except Exception as e:
+        logger.warning("推送提交事件失败: %s", e)
+
+
+@app.route("/api/live/stream", methods=["GET"])
+def live_stream():
+    """课堂实时事件流（SSE）
+
+    EventSource 无法设置请求头，令牌也可通过查询参数 token= 传递。
+    """
+    token = request.headers.get("Authorization") or request.args.get("token")
+    if not token or not verify_teacher_token(token):
+        return jsonify({"error": "未授权访问"}), 401
+
+    def generate():
+        subscription = event_hub.subscribe()
+        try:
+            yield ": connected\n\n"
+            while True:
+                event = subscription.get(timeout=LIVE_HEARTBEAT_INTERVAL)
+                yield format_sse(event) if event else ": heartbeat\n\n"
+        finally:
+            subscription.close()
+
+    return Response(generate(), mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
+
+
+# ==================== 答题记录写入 ====================
+def save_attempt(detail_record, overall_record):
+    """保存答题记录并累加学生总体统计，返回累加后的总体记录
+
+    存储层在一次往返内原子完成（Supabase 见 sql/submit_attempt.sql），并发提交不会丢失累加。
+    开启缓冲写入时只同步累加总体统计，详细记录交给后台队列批量写入。
+    """
+    if SUBMIT_BUFFERED:
+        overall_record = storage.increment_overall(overall_record)
+        enqueue_detail_record(detail_record)
+        return overall_record
+
+    return storage.record_attempt(detail_record, overall_record)
+
+
+def save_attempts(detail_records, overall_record):
+    """保存一份答卷的全部答题记录并累加一次学生总体统计，返回累加后的总体记录"""
+    if SUBMIT_BUFFERED:
+        overall_record = storage.increment_overall(overall_record)
+        for detail_record in detail_records:
+            enqueue_detail_record(detail_record)
+        return overall_record
+
+    return storage.record_attempts(detail_records, overall_record)
+
+
+def save_attempts_once(student_id, student_name, detail_records, submitted_at):
+    """保存一份答卷，跳过已写入过的记录（重复提交），返回 (累加后的总体记录, 本次实际写入的记录)"""
+    overall_record = build_overall_record(student_id, student_name, detail_records, submitted_at)
+    try:
+        return save_attempts(detail_records, overall_record), detail_records
+    except DuplicateRecord:
+        pass
+
+    # 整批已回滚；查出已存在的记录后只保存其余的，总体统计只累加这些记录
+    existing = {row["id"] for row in storage.select(
+        "records", ["id"], [("id", "in", [r["id"] for r in detail_records])])}
+    new_records = [r for r in detail_records if r["id"] not in existing]
+    logger.info("重复提交已忽略", extra={"data": {"student_id": student_id, "duplicates": len(existing)}})
+    if not new_records:
+        return None, []
+    overall_record = build_overall_record(student_id, student_name, new_records, submitted_at)
+    return save_attempts(new_records, overall_record), new_records
+
+
+# ==================== 重复提交去重 ====================
+# 同一次作答（学生、题目、attempt 相同）的记录使用相同的 UUID5 作为ID，
+# 由 records 表的主键保证只写入一次；内存中的结果缓存让重试不必再访问数据库
+SUBMISSION_NAMESPACE = uuid.UUID("5b0f3a52-8d2e-4c1b-9f61-3a7e2c9d4b10")
+_submission_results = OrderedDict()  # 去重键 -> (过期时间, 返回结果)，按写入顺序即过期顺序排列
+_submission_results_lock = threading.Lock()
+
+
+def parse_attempt(value):
+    """作答标识：前端每次开始答题时生成，重试时保持不变；未提供时不去重"""
+    if value is None or value == "":
+        return None
+    if isinstance(value, bool) or not isinstance(value, (str, int)) or len(str(value)) > 64:
+        raise ValueError("attempt 必须是不超过 64 个字符的字符串或整数")
+    return str(value)
+
+
+def is_valid_time_used(value):
+    """用时（秒）必须是非负的有限数字或不提供，数字字符串等其他类型在写入任何数据之前拒绝"""
+    if value is None:
+        return True
+    return (not isinstance(value, bool) and isinstance(value, (int, float))
+            and math.isfinite(value) and value >= 0)
+
+
+def submission_record_id(student_id, question_id, attempt):
+    return str(uuid.uuid5(SUBMISSION_NAMESPACE, f"{student_id}\0{question_id}\0{attempt}"))
+
+
+def get_submission_result(key):
+    """已缓存的批改结果，不存在或已过期时返回 None"""
+    with _submission_results_lock:
+        cached = _submission_results.get(key)
+        if cached is None or cached[0] <= time.monotonic():
+            return None
+        return cached[1]
+
+
+def remember_submission_result(key, result):
+    """缓存批改结果，并淘汰已过期的和超出数量上限的最早结果"""
+    now = time.monotonic()
+    with _submission_results_lock:
+        _submission_results[key] = (now + SUBMIT_DEDUP_TTL, result)
+        _submission_results.move_to_end(key)
+        while _submission_results:
+            expires_at, _ = next(iter(_submission_results.values()))
+            if expires_at > now and len(_submission_results) <= SUBMIT_DEDUP_MAX:
+                break
+            _submission_results.popitem(last=False)
+
+
+# ==================== 缓冲写入队列 ====================
+_submit_queue = deque()
+_submit_queue_cond = threading.Condition()
+_submit_flush_lock = threading.Lock()
+_submit_worker = None
+_submit_queue_stats = {
+    "enqueued": 0,          # 进入队列的记录数
+    "flushed": 0,           # 已批量写入的记录数
+    "flushes": 0,           # 批量写入次数
+    "failed_flushes": 0,    # 失败的批量写入次数（记录会放回队列重试）
+    "consecutive_failures": 0,  # 队首这批记录连续失败的次数
+    "dead_letters": 0,      # 逐条写入仍失败、移入死信的记录数
+    "overflow_writes": 0,   # 队列已满时改为同步写入的记录数
+    "last_flush_ms": 0.0,
+    "max_flush_ms": 0.0,
+    "total_flush_ms": 0.0
+}
+
+
+def enqueue_detail_record(detail_record):
+    """将详细记录放入写入队列；队列已满时同步写入，避免内存无限增长"""
+    with _submit_queue_cond:
+        overflow = len(_submit_queue) >= SUBMIT_QUEUE_MAX
+        if overflow:
+            _submit_queue_stats["overflow_writes"] += 1
+        else:
+            _submit_queue.append(detail_record)
+            _submit_queue_stats["enqueued"] += 1
+            if len(_submit_queue) >= SUBMIT_FLUSH_SIZE:
+                _submit_queue_cond.notify()
+
+    if overflow:
+        storage.insert_records([detail_record], ignore_duplicates=True)
+    _ensure_submit_worker()
+
+
+def _ensure_submit_worker():
+    global _submit_worker
+    if _submit_worker is not None and _submit_worker.is_alive():
+        return
+    with _submit_queue_cond:
+        if _submit_worker is None or not _submit_worker.is_alive():
+            _submit_worker = threading.Thread(target=_submit_queue_worker, name="submit-queue", daemon=True)
+            _submit_worker.start()
+
+
+def _submit_queue_worker():
+    """后台线程：达到批量条数或等待超过写入间隔时写入一批"""
+    while True:
+        with _submit_queue_cond:
+            _submit_queue_cond.wait_for(lambda: len(_submit_queue) >= SUBMIT_FLUSH_SIZE,
+                                        timeout=SUBMIT_FLUSH_INTERVAL)
+        flush_submit_queue()
+
+
+def _insert_records_individually(batch):
+    """逐条写入一批记录，返回 (写入成功的记录, [(写入失败的记录, 异常)])"""
+    written, rejected = [], []
+    for record in batch:
+        try:
+            storage.insert_records([record], ignore_duplicates=True)
+            written.append(record)
+        except Exception as e:
+            rejected.append((record, e))
+    return written, rejected
+
+
+def _dead_letter(rejected):
+    """记录写不进 records 表的答题记录，不再放回队列"""
+    for record, error in rejected:
+        line = json.dumps({"record": record, "error": str(error), "failed_at": datetime.now().isoformat()},
+                          ensure_ascii=False, default=str)
+        logger.error("答题记录无法写入，已移入死信: %s", line)
+        if SUBMIT_DEAD_LETTER_PATH:
+            try:
+                with open(SUBMIT_DEAD_LETTER_PATH, "a", encoding="utf-8") as f:
+                    f.write(line + "\n")
+            except OSError as e:
+                logger.error("写入死信文件失败: %s", e)
+    with _submit_queue_cond:
+        _submit_queue_stats["dead_letters"] += len(rejected)
+
+
+def flush_submit_queue():
+    """将队列中的记录按批写入 records 表，返回写入条数
+
+    写入失败时整批放回队首稍后重试；同一批连续失败 SUBMIT_FLUSH_MAX_RETRIES 次后改为逐条写入：
+    有记录写入成功说明数据库可用，仍失败的记录是坏记录，移入死信，队列继续往下写；
+    全部失败时多半是数据库暂时不可用，整批放回继续重试。
+    """
+    flushed = 0
+    with _submit_flush_lock:
+        while True:
+            with _submit_queue_cond:
+                batch = [_submit_queue.popleft() for _ in range(min(len(_submit_queue), SUBMIT_FLUSH_SIZE))]
+            if not batch:
+                return flushed
+
+            start = time.perf_counter()
+            try:
+                # 同一次作答的重试已在累加前被去重缓存拦下，这里忽略漏网的重复记录，避免整批反复失败
+                storage.insert_records(batch, ignore_duplicates=True)
+            except Exception as e:
+                with _submit_queue_cond:
+                    _submit_queue_stats["failed_flushes"] += 1
+                    _submit_queue_stats["consecutive_failures"] += 1
+                    failures = _submit_queue_stats["consecutive_failures"]
+                written = []
+                if failures >= SUBMIT_FLUSH_MAX_RETRIES:
+                    written, rejected = _insert_records_individually(batch)
+                if not written:
+                    logger.warning("批量写入答题记录失败（%d 条，第 %d 次，稍后重试）: %s", len(batch), failures, e)
+                    with _submit_queue_cond:
+                        _submit_queue.extendleft(reversed(batch))
+                    return flushed
+                _dead_letter(rejected)
+                batch = written
+
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            flushed += len(batch)
+            with _submit_queue_cond:
+                _submit_queue_stats["consecutive_failures"] = 0
+                _submit_queue_stats["flushed"] += len(batch)
+                _submit_queue_stats["flushes"] += 1
+                _submit_queue_stats["last_flush_ms"] = elapsed_ms
+                _submit_queue_stats["max_flush_ms"] = max(_submit_queue_stats["max_flush_ms"], elapsed_ms)
+                _submit_queue_stats["total_flush_ms"] += elapsed_ms
+
+
+def get_submit_queue_stats():
+    """写入队列的深度和写入耗时统计"""
+    with _submit_queue_cond:
+        stats = dict(_submit_queue_stats)
+        stats["depth"] = len(_submit_queue)
+    stats["enabled"] = SUBMIT_BUFFERED
+    stats["avg_flush_ms"] = stats["total_flush_ms"] / stats["flushes"] if stats["flushes"] else 0.0
+    return stats
+
+
+# 进程退出前写入队列中剩余的记录（gunicorn 平滑重启、Ctrl+C 等）
+atexit.register(flush_submit_queue)
+
+
+# ==================== 题目统计预聚合 ====================
+_question_stats_deltas = {}  # 题目ID -> 尚未写入数据库的增量
+_question_stats_lock = threading.Lock()
+_question_stats_flush_lock = threading.Lock()
+_question_stats_worker = None
+
+
+def _new_question_delta():
+    return {
+        "attempts": 0,
+        "correct_count": 0,
+        "total_count": 0,
+        "time_sum": 0.0,
+        "time_sq_sum": 0.0,
+        "timed_attempts": 0,
+        "hint_count": 0,
+        "blanks": {}  # 填空序号 -> {"attempts", "correct_count", "wrong_answers": Counter}
+    }
+
+
+def _merge_question_delta(target, delta):
+    for key in ("attempts", "correct_count", "total_count", "time_sum", "time_sq_sum", "timed_attempts",
+                "hint_count"):
+        target[key] += delta[key]
+    for index, blank in delta["blanks"].items():
+        target_blank = target["blanks"].setdefault(
+            index, {"attempts": 0, "correct_count": 0, "wrong_answers": Counter()})
+        target_blank["attempts"] += blank["attempts"]
+        target_blank["correct_count"] += blank["correct_count"]
+        target_blank["wrong_answers"].update(blank["wrong_answers"])
+
+
+def record_question_stats(question_id, answer_comparison, time_used, hint_used):
+    """将一次答题计入题目统计增量（内存中累加，定期批量写入 question_stats / blank_stats）"""
+    delta = _new_question_delta()
+    delta["attempts"] = 1
+    delta["correct_count"] = sum(1 for c in answer_comparison if c["is_correct"])
+    delta["total_count"] = len(answer_comparison)
+    if time_used is not None:
+        delta["time_sum"] = float(time_used)
+        delta["time_sq_sum"] = float(time_used) ** 2
+        delta["timed_attempts"] = 1
+    delta["hint_count"] = 1 if hint_used else 0
+    for c in answer_comparison:
+        # 错误答案按 text 匹配的规范化方式归并，与全量重算（sql/question_stats.sql）和班级分析一致
+        wrong_answers = Counter() if c["is_correct"] else Counter([matchers.normalize_text(c["student_answer"])])
+        delta["blanks"][c["index"]] = {
+            "attempts": 1,
+            "correct_count": 1 if c["is_correct"] else 0,
+            "wrong_answers": wrong_answers
+        }
+
+    with _question_stats_lock:
+        _merge_question_delta(_question_stats_deltas.setdefault(question_id, _new_question_delta()), delta)
+
+    if QUESTION_STATS_FLUSH_INTERVAL <= 0:
+        flush_question_stats()
+    else:
+        _ensure_question_stats_worker()
+
+
+def _ensure_question_stats_worker():
+    global _question_stats_worker
+    if _question_stats_worker is not None and _question_stats_worker.is_alive():
+        return
+    with _question_stats_lock:
+        if _question_stats_worker is None or not _question_stats_worker.is_alive():
+            _question_stats_worker = threading.Thread(target=_question_stats_flush_loop, name="question-stats",
+                                                      daemon=True)
+            _question_stats_worker.start()
+
+
+def _question_stats_flush_loop():
+    while True:
+        time.sleep(QUESTION_STATS_FLUSH_INTERVAL)
+        flush_question_stats()
+
+
+def flush_question_stats():
+    """将内存中的统计增量写入数据库（见 sql/question_stats.sql），返回写入的题目数"""
+    with _question_stats_flush_lock:
+        with _question_stats_lock:
+            deltas = dict(_question_stats_deltas)
+            _question_stats_deltas.clear()
+        if not deltas:
+            return 0
+
+        payload = []
+        for question_id, delta in deltas.items():
+            item = {k: v for k, v in delta.items() if k != "blanks"}
+            item["question_id"] = question_id
+            item["blanks"] = [{
+                "blank_index": index,
+                "attempts": blank["attempts"],
+                "correct_count": blank["correct_count"],
+                "wrong_answers": dict(blank["wrong_answers"])
+            } for index, blank in delta["blanks"].items()]
+            payload.append(item)
+
+        try:
+            storage.apply_question_stats(payload)
+        except Exception as e:
+            logger.warning("写入题目统计失败（稍后重试）: %s", e)
+            with _question_stats_lock:
+                for question_id, delta in deltas.items():
+                    _merge_question_delta(_question_stats_deltas.setdefault(question_id, _new_question_delta()),
+                                          delta)
+            return 0
+        return len(payload)
+
+
+def rebuild_question_stats():
+    """根据 records 全量重算题目统计，返回重算的题目数和填空数"""
+    # 重算结果已包含所有已写入的记录，先写入缓冲队列，再丢弃内存中的增量
+    flush_submit_queue()
+    with _question_stats_flush_lock:
+        with _question_stats_lock:
+            _question_stats_deltas.clear()
+        return storage.rebuild_question_stats()
+
+
+@app.cli.command("import-quiz-data")
+def import_quiz_data_command():
+    """将旧版 quiz_data.json 中的题目导入当前存储：flask --app app import-quiz-data"""
+    with open(current_dir / "quiz_data.json", encoding="utf-8") as f:
+        legacy_questions = json.load(f).get("questions", {})
+
+    existing_titles = {q["title"] for q in storage.list_questions()}
+    imported = 0
+    for question in legacy_questions.values():
+        if question["title"] in existing_titles:
+            continue
+        storage.insert_question({
+            "id": str(uuid.uuid4()),
+            "title": question["title"],
+            "answers": question["answers"],
+            "image_url": None,
+            "created_at": datetime.strptime(question["created_at"], "%Y-%m-%d %H:%M:%S").isoformat()
+        })
+        imported += 1
+    invalidate_question_cache()
+    print(f"已导入 {imported} 道题目")
+
+
+@app.cli.command("hash-password")
+@click.argument("password")
+def hash_password_command(password):
+    """生成教师密码哈希，填入 TEACHER_PASSWORD_HASH：flask --app app hash-password <密码>"""
+    print(auth.hash_password(password))
+
+
+@app.cli.command("compress-static")
+def compress_static_command():
+    """为前端文件生成 .gz / .br 预压缩版本：flask --app app compress-static
+
+    Vite 构建后执行一次，之后的请求直接使用压缩好的文件；nginx 等也可通过 gzip_static 直接返回。
+    """
+    written = static_assets.precompress(FRONTEND_DIR)
+    print(f"已在 {FRONTEND_DIR} 生成 {written} 个预压缩文件")
+
+
+@app.cli.command("rebuild-question-stats")
+def rebuild_question_stats_command():
+    """命令行重算题目统计：flask --app app rebuild-question-stats"""
+    result = rebuild_question_stats()
+    print(f"已重算 {result['questions']} 道题目、{result['blanks']} 个填空的统计")
+
+
+# 进程退出前写入剩余的统计增量
+atexit.register(flush_question_stats)
+
+
 # ==================== 数据分析模块 ====================
 @app.route("/api/analysis/student/<student_id>", methods=["GET"])
 def get_student_analysis(student_id):
-    """获取学生详细分析数据"""
+    """获取学生详细分析数据
+
+    详细记录按提交时间分页（limit、after），可用 fields= 筛选详细记录字段，
+    format=ndjson 时流式返回该学生的全部详细记录。
+    """
     token = request.headers.get("Authorization")
     if not token or not verify_teacher_token(token):
         return jsonify({"error": "未授权访问"}), 401
 
     try:
-        overall_response = supabase.table("student_overall_records").select("*").eq("student_id", student_id).execute()
+        fields = parse_fields(DETAIL_RECORD_FIELDS, required=["id", "submitted_at"])
+        limit = parse_limit()
+        after = decode_cursor(request.args["after"]) if request.args.get("after") else None
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
-        if not overall_response.data:
-            return jsonify({"error": "学生记录不存在"}), 404
+    by_student = [("student_id", "eq", student_id)]
+
+    if request.args.get("format") == "ndjson":
+        return ndjson_response(iter_rows("records", fields, "submitted_at", after=after, filters=by_student))
 
-        overall_record = overall_response.data[0]
+    try:
+        # 总体记录、详细记录和题目互不依赖，并行查询
+        overall_record, (detail_records, next_cursor), (all_questions, _) = fetch_concurrently(
+            lambda: storage.get_overall(student_id),
+            lambda: fetch_page("records", fields, "submitted_at", limit=limit, after=after, filters=by_student),
+            load_questions
+        )
 
-        detail_response = supabase.table("records").select("*").eq("student_id", student_id).order(
-            "submitted_at").execute()
-        detail_records = detail_response.data
+        if not overall_record:
+            return jsonify({"error": "学生记录不存在"}), 404
 
-        questions_response = supabase.table("questions").select("*").execute()
-        questions = {q["id"]: q for q in questions_response.data}
+        # 只返回本页记录涉及的题目
+        answered_ids = {r["question_id"] for r in detail_records if r.get("question_id")}
+        questions = {q["id"]: q for q in all_questions if q["id"] in answered_ids}
 
         return jsonify({
             "success": True,
@@ -486,11 +1829,36 @@ def get_student_analysis(student_id):
                 "last_submission": overall_record["last_submitted_at"]
             },
             "detail_records": detail_records,
-            "questions": questions
+            "questions": questions,
+            "next_cursor": next_cursor
         }), 200
 
     except Exception as e:
-        print(f"学生分析失败: {str(e)}")
+        logger.exception("学生分析失败")
+        return jsonify({"error": f"分析失败：{str(e)}"}), 500
+
+
+@app.route("/api/analysis/student/<student_id>/trend", methods=["GET"])
+def get_student_trend(student_id):
+    """获取学生最近 window 次答题的趋势（移动平均、斜率、连对次数），不返回完整的答题记录"""
+    token = request.headers.get("Authorization")
+    if not token or not verify_teacher_token(token):
+        return jsonify({"error": "未授权访问"}), 401
+
+    window = request.args.get("window", STUDENT_TREND_WINDOW, type=int)
+    window = max(2, min(window, MAX_TREND_WINDOW))
+
+    try:
+        trend = get_student_trend_summary(student_id, window)
+        if trend is None:
+            return jsonify({"error": "学生记录不存在"}), 404
+
+        change = trend["accuracy"]["change"]
+        trend["improvement"] = "数据不足" if change is None else classify_improvement(change)
+        return jsonify({"success": True, "student_id": student_id, "data": trend}), 200
+
+    except Exception as e:
+        logger.exception("学生趋势分析失败")
         return jsonify({"error": f"分析失败：{str(e)}"}), 500
 
 
@@ -502,14 +1870,15 @@ def get_all_students_analysis():
         return jsonify({"error": "未授权访问"}), 401
 
     try:
-        overall_response = supabase.table("student_overall_records").select("*").order("accuracy", desc=True).execute()
-        students = overall_response.data
+        # 一次性批量拉取所有学生的最近记录，避免逐个学生查询（N+1），与总体记录并行查询
+        students, recent_records_map = fetch_concurrently(
+            lambda: fetch_all_rows("student_overall_records", order=[("accuracy", True), ("id", False)]),
+            lambda: fetch_recent_records_by_student(RECENT_RECORDS_LIMIT)
+        )
 
         analysis_data = []
         for student in students:
-            detail_response = supabase.table("records").select("*").eq("student_id", student["student_id"]).order(
-                "submitted_at", desc=True).limit(10).execute()
-            recent_records = detail_response.data
+            recent_records = recent_records_map.get(student["student_id"], [])
 
             improvement = calculate_student_improvement(recent_records)
 
@@ -530,10 +1899,131 @@ def get_all_students_analysis():
         }), 200
 
     except Exception as e:
-        print(f"学生分析概览失败: {str(e)}")
+        logger.exception("学生分析概览失败")
+        return jsonify({"error": f"分析失败：{str(e)}"}), 500
+
+
+@app.route("/api/analysis/class", methods=["GET"])
+def get_class_analysis():
+    """获取班级整体分析：每题/每空难度、区分度、正确率分布、用时分位数、常见错误答案
+
+    student_ids（逗号分隔）、since、until、session_id 限定统计范围。
+    """
+    token = request.headers.get("Authorization")
+    if not token or not verify_teacher_token(token):
+        return jsonify({"error": "未授权访问"}), 401
+
+    try:
+        scope = parse_records_scope_args()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        records = iter_rows(
+            "records",
+            ["id", "student_id", "question_id", "correct_count", "total_count", "time_used", "hint_used",
+             "answer_comparison", "submitted_at"],
+            "submitted_at",
+            filters=records_scope_filters(scope)
+        )
+        # 分析模块依赖 NumPy，导入较慢，只在用到时导入
+        from analytics import analyze_class
+
+        questions, _ = load_questions()
+        analysis = analyze_class(records, {q["id"]: q["title"] for q in questions})
+
+        return jsonify({"success": True, "data": analysis}), 200
+
+    except Exception as e:
+        logger.exception("班级分析失败")
         return jsonify({"error": f"分析失败：{str(e)}"}), 500
 
 
+@app.route("/api/analysis/questions", methods=["GET"])
+def get_question_stats():
+    """获取每道题、每个填空的预聚合统计（读取 O(题目数) 行，不扫描答题记录）"""
+    token = request.headers.get("Authorization")
+    if not token or not verify_teacher_token(token):
+        return jsonify({"error": "未授权访问"}), 401
+
+    try:
+        flush_question_stats()
+
+        question_rows, blank_rows, (questions, _) = fetch_concurrently(
+            lambda: fetch_all_rows("question_stats", order=[("question_id", False)]),
+            lambda: fetch_all_rows("blank_stats", order=[("question_id", False), ("blank_index", False)]),
+            load_questions
+        )
+        titles = {q["id"]: q["title"] for q in questions}
+
+        blanks = {}
+        for row in blank_rows:
+            wrong_answers = Counter(row["wrong_answers"] or {})
+            blanks.setdefault(row["question_id"], []).append({
+                "index": row["blank_index"],
+                "attempts": row["attempts"],
+                "difficulty": row["correct_count"] / row["attempts"] if row["attempts"] else None,
+                "common_wrong_answers": [{"answer": answer, "count": count}
+                                         for answer, count in wrong_answers.most_common(TOP_WRONG_ANSWERS)]
+            })
+
+        stats = []
+        for row in question_rows:
+            timed = row["timed_attempts"]
+            mean_time = row["time_sum"] / timed if timed else None
+            stats.append({
+                "question_id": row["question_id"],
+                "title": titles.get(row["question_id"]),
+                "attempts": row["attempts"],
+                "difficulty": row["correct_count"] / row["total_count"] if row["total_count"] else None,
+                "hint_rate": row["hint_count"] / row["attempts"] if row["attempts"] else None,
+                "mean_time": mean_time,
+                "time_stddev": math.sqrt(max(0.0, row["time_sq_sum"] / timed - mean_time ** 2)) if timed else None,
+                "blanks": blanks.get(row["question_id"], []),
+                "updated_at": row["updated_at"]
+            })
+
+        return jsonify({"success": True, "data": stats}), 200
+
+    except Exception as e:
+        logger.exception("题目统计查询失败")
+        return jsonify({"error": f"查询失败：{str(e)}"}), 500
+
+
+@app.route("/api/analysis/questions/rebuild", methods=["POST"])
+def rebuild_question_stats_route():
+    """根据答题记录重算题目统计"""
+    token = request.headers.get("Authorization")
+    if not token or not verify_teacher_token(token):
+        return jsonify({"error": "未授权访问"}), 401
+
+    try:
+        return jsonify({"success": True, "data": rebuild_question_stats()}), 200
+    except Exception as e:
+        logger.exception("重算题目统计失败")
+        return jsonify({"error": f"重算失败：{str(e)}"}), 500
+
+
+def fetch_all_rows(table, fields=None, filters=(), order=(), page_size=PAGE_SIZE):
+    """分页拉取查询的全部结果（PostgREST 单次返回行数有上限），order 需能唯一确定行的顺序"""
+    rows = []
+    offset = 0
+    while True:
+        page = storage.select(table, fields, filters, order, limit=page_size, offset=offset)
+        rows.extend(page)
+        if len(page) < page_size:
+            return rows
+        offset += page_size
+
+
+def fetch_recent_records_by_student(limit):
+    """批量获取每个学生最近 limit 条答题记录，按学生分组（新记录在前）
+
+    由存储用窗口函数按学生取前 limit 条，耗时不随学期内的总提交数增长。
+    """
+    return storage.recent_records_by_student(limit)
+
+
 def calculate_student_improvement(records):
     """计算学生进步情况"""
     if len(records) < 2:
@@ -542,8 +2032,11 @@ def calculate_student_improvement(records):
     recent_avg = statistics.mean([r["accuracy"] for r in records[:3]])
     older_avg = statistics.mean([r["accuracy"] for r in records[-3:]])
 
-    improvement = recent_avg - older_avg
+    return classify_improvement(recent_avg - older_avg)
+
 
+def classify_improvement(improvement):
+    """按正确率的变化（百分点）给出进步情况"""
     if improvement > 10:
         return "显著进步"
     elif improvement > 5:
@@ -556,88 +2049,603 @@ def calculate_student_improvement(records):
         return "明显下降"
 
 
+# ==================== 学生答题趋势 ====================
+# 学生ID -> 缓存项：series（trends.StudentSeries）、lock、loaded_at，按最近使用排序
+TREND_RECORD_FIELDS = ["id", "accuracy", "time_used", "hint_used", "submitted_at"]
+_trend_cache = OrderedDict()
+_trend_cache_lock = threading.Lock()
+
+
+def get_student_trend_summary(student_id, window):
+    """计算学生的答题趋势，没有答题记录时返回 None
+
+    首次访问时加载该学生的全部记录（只取趋势用到的列），之后每次只查询最新提交时间前
+    STUDENT_TREND_OVERLAP 秒以来的记录并按ID去重；超过 STUDENT_TREND_REBUILD_INTERVAL 后重新全量加载。
+    """
+    with _trend_cache_lock:
+        entry = _trend_cache.get(student_id)
+        if entry is None or time.monotonic() - entry["loaded_at"] >= STUDENT_TREND_REBUILD_INTERVAL:
+            entry = {"series": trends.StudentSeries(), "lock": threading.Lock(), "loaded_at": time.monotonic()}
+            _trend_cache[student_id] = entry
+        _trend_cache.move_to_end(student_id)
+        if len(_trend_cache) > STUDENT_TREND_CACHE_MAX:
+            _trend_cache.popitem(last=False)
+
+    # 同一学生的并发请求依次追加，避免重复加载同一批记录
+    with entry["lock"]:
+        series = entry["series"]
+        filters = [("student_id", "eq", student_id)]
+        since = series.since(STUDENT_TREND_OVERLAP)
+        if since is not None:
+            filters.append(("submitted_at", "gte", since))
+        new_records = iter_rows("records", TREND_RECORD_FIELDS, "submitted_at", filters=filters)
+        for record in new_records:
+            series.append(record)
+        return trends.summarize(series, window) if len(series) else None
+
+
+def invalidate_trend_cache():
+    """清空记录后丢弃所有学生的序列，下次访问时重新加载"""
+    with _trend_cache_lock:
+        _trend_cache.clear()
+
+
 # ==================== 记录管理模块 ====================
 @app.route("/api/records", methods=["GET"])
 def get_records():
-    """获取所有学生记录"""
+    """获取学生记录
+
+    按最近提交时间倒序分页（limit、after），可用 fields= 筛选字段，
+    format=ndjson 时流式返回全部记录。
+    """
     token = request.headers.get("Authorization")
     if not verify_teacher_token(token):
         return jsonify({"error": "未授权访问"}), 401
 
     try:
-        response = supabase.table("student_overall_records").select("*").order("last_submitted_at", desc=True).execute()
-        return jsonify({"data": response.data}), 200
+        fields = parse_fields(OVERALL_RECORD_FIELDS, required=["id", "last_submitted_at"])
+        limit = parse_limit()
+        after = decode_cursor(request.args["after"]) if request.args.get("after") else None
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    if request.args.get("format") == "ndjson":
+        return ndjson_response(iter_rows("student_overall_records", fields, "last_submitted_at", desc=True,
+                                         after=after))
+
+    try:
+        records, next_cursor = fetch_page("student_overall_records", fields, "last_submitted_at", desc=True,
+                                          limit=limit, after=after)
+        return jsonify({"data": records, "next_cursor": next_cursor}), 200
     except Exception as e:
         return jsonify({"error": f"查询失败：{str(e)}"}), 500
 
 
-@app.route("/api/records/clear", methods=["DELETE"])
-def clear_records():
-    """清空所有记录"""
+@app.route("/api/records/queue", methods=["GET"])
+def get_submit_queue_status():
+    """获取缓冲写入队列状态"""
     token = request.headers.get("Authorization")
     if not token or not verify_teacher_token(token):
         return jsonify({"error": "未授权访问"}), 401
 
-    print("=== 开始清空记录 ===")
+    return jsonify({"success": True, "data": get_submit_queue_stats()}), 200
+
+
+@app.route("/api/records/export", methods=["GET"])
+def export_records():
+    """导出答题记录（用于导入成绩册）
+
+    format=csv（默认）或 parquet，wide=true 时每个填空的作答展开为单独的列；
+    Parquet 需要可选依赖 pyarrow（见 requirements-parquet.txt），Vercel 部署不安装，返回 501。
+    student_ids（逗号分隔）、since、until、session_id 限定导出范围。
+    数据按页从数据库读取并边读边输出，内存占用与记录总数无关。
+    """
+    token = request.headers.get("Authorization")
+    if not token or not verify_teacher_token(token):
+        return jsonify({"error": "未授权访问"}), 401
+
+    export_format = request.args.get("format", "csv")
+    if export_format not in ("csv", "parquet"):
+        return jsonify({"error": "仅支持 csv、parquet 格式"}), 400
+    wide = request.args.get("wide", "false").lower() == "true"
 
     try:
-        print("清空 student_overall_records 表...")
-        records = supabase.table("student_overall_records").select("*").execute()
-        deleted_count = 0
+        scope = parse_records_scope_args()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        rows = iter_export_rows(scope, wide)
+        columns = export_columns(wide)
+        filename = f"records_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{export_format}"
+
+        if export_format == "parquet":
+            try:
+                body = generate_parquet(rows, columns)
+            except ImportError:
+                return jsonify({"error": "服务器未安装 pyarrow，无法导出 Parquet（Vercel 部署不支持），请使用 format=csv"}), 501
+            mimetype = "application/vnd.apache.parquet"
+        else:
+            body = generate_csv(rows, columns)
+            mimetype = "text/csv"
 
-        if records.data:
-            for record in records.data:
-                try:
-                    supabase.table("student_overall_records").delete().eq("id", record["id"]).execute()
-                    deleted_count += 1
-                except Exception as e:
-                    print(f"删除记录 {record['id']} 失败: {e}")
+        return Response(body, mimetype=mimetype, headers={
+            "Content-Disposition": f"attachment; filename={filename}"
+        })
+
+    except Exception as e:
+        logger.exception("导出记录失败")
+        return jsonify({"error": f"导出失败：{str(e)}"}), 500
+
+
+@app.route("/api/records/clear", methods=["DELETE"])
+def clear_records():
+    """清空答题记录
 
-            print(f"已删除 {deleted_count} 条总体记录")
+    请求体可选 student_ids、since、until、session_id 限定范围（不传则清空全部），
+    查询参数 background=true 时改为后台分批删除，通过任务接口查询进度；
+    后台任务只在常驻进程（gunicorn 等）中可用，Serverless 部署（Vercel）返回 501。
+    """
+    token = request.headers.get("Authorization")
+    if not token or not verify_teacher_token(token):
+        return jsonify({"error": "未授权访问"}), 401
 
-        print("清空 records 表...")
-        detail_records = supabase.table("records").select("*").execute()
-        detail_deleted_count = 0
+    try:
+        scope = parse_records_scope(request.get_json(silent=True) or {})
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
-        if detail_records.data:
-            for record in detail_records.data:
-                try:
-                    supabase.table("records").delete().eq("id", record["id"]).execute()
-                    detail_deleted_count += 1
-                except Exception as e:
-                    print(f"删除详细记录 {record['id']} 失败: {e}")
+    if request.args.get("background", "false").lower() == "true":
+        if not CLEAR_BACKGROUND_ENABLED:
+            return jsonify({"error": "当前部署不支持后台清空任务（需要 gunicorn 等常驻进程），请去掉 background=true"}), 501
+        job = start_clear_job(scope)
+        return jsonify({"success": True, "job": job}), 202
 
-            print(f"已删除 {detail_deleted_count} 条详细记录")
+    try:
+        result = storage.clear_records(scope)
+        logger.info("已清空记录", extra={"data": result})
+        rebuild_question_stats_after_clear()
+        invalidate_trend_cache()
 
         return jsonify({
             "success": True,
-            "message": f"所有答题记录已清空（总体记录: {deleted_count} 条，详细记录: {detail_deleted_count} 条）"
+            "message": f"答题记录已清空（总体记录: {result['overall_deleted']} 条，详细记录: {result['records_deleted']} 条）",
+            "data": result
         }), 200
 
     except Exception as e:
-        print(f"清空记录失败: {str(e)}")
-        import traceback
-        print(f"错误详情: {traceback.format_exc()}")
+        logger.exception("清空记录失败")
         return jsonify({"error": f"清空记录失败：{str(e)}"}), 500
 
 
+@app.route("/api/records/clear/jobs/<job_id>", methods=["GET"])
+def get_clear_job(job_id):
+    """查询后台清空任务进度"""
+    token = request.headers.get("Authorization")
+    if not token or not verify_teacher_token(token):
+        return jsonify({"error": "未授权访问"}), 401
+
+    with _clear_jobs_lock:
+        job = _clear_jobs.get(job_id)
+        job = dict(job) if job else None
+    if not job:
+        return jsonify({"error": "任务不存在"}), 404
+    return jsonify({"success": True, "job": job}), 200
+
+
+def parse_records_scope(data):
+    """解析记录范围：student_ids 学生ID列表，since/until 提交时间（ISO 格式，含 since 不含 until），
+    session_id 场次ID
+    """
+    student_ids = data.get("student_ids") or None
+    if student_ids is not None and (not isinstance(student_ids, list)
+                                    or not all(isinstance(i, str) for i in student_ids)):
+        raise ValueError("student_ids 必须是字符串列表")
+
+    scope = {"p_student_ids": student_ids, "p_since": None, "p_until": None}
+    for key in ("since", "until"):
+        value = data.get(key)
+        if value:
+            try:
+                datetime.fromisoformat(value)
+            except (TypeError, ValueError):
+                raise ValueError(f"{key} 时间格式错误")
+            scope[f"p_{key}"] = value
+
+    # 只在指定时加入，未部署新版 clear_records 函数的数据库不受影响
+    session_id = data.get("session_id")
+    if session_id:
+        if not isinstance(session_id, str):
+            raise ValueError("session_id 必须是字符串")
+        scope["p_session_id"] = session_id
+    return scope
+
+
+def parse_records_scope_args():
+    """从查询参数解析记录范围（student_ids 以逗号分隔）"""
+    student_ids = request.args.get("student_ids")
+    return parse_records_scope({
+        "student_ids": student_ids.split(",") if student_ids else None,
+        "since": request.args.get("since"),
+        "until": request.args.get("until"),
+        "session_id": request.args.get("session_id")
+    })
+
+
+def rebuild_question_stats_after_clear():
+    """清空记录后重算题目统计，失败不影响清空结果"""
+    try:
+        rebuild_question_stats()
+    except Exception as e:
+        logger.warning("清空记录后重算题目统计失败: %s", e)
+
+
+def is_unscoped(scope):
+    return not any(scope.values())
+
+
+# ==================== 记录导出 ====================
+# 导出列：(列名, Parquet 类型)
+EXPORT_BASE_COLUMNS = [
+    ("record_id", "string"),
+    ("student_id", "string"),
+    ("student_name", "string"),
+    ("question_id", "string"),
+    ("question_title", "string"),
+    ("correct_count", "int64"),
+    ("total_count", "int64"),
+    ("accuracy", "float64"),
+    ("time_used", "int64"),
+    ("hint_used", "bool"),
+    ("submitted_at", "string"),
+    ("overall_accuracy", "float64"),
+    ("overall_total_correct", "int64"),
+    ("overall_total_questions", "int64")
+]
+
+
+def export_blank_count():
+    """宽表格式需要展开的填空数（取题库中答案数最多的题目）"""
+    questions, _ = load_questions()
+    return max((len(q["answers"]) for q in questions), default=0)
+
+
+def export_columns(wide):
+    columns = list(EXPORT_BASE_COLUMNS)
+    if wide:
+        for i in range(1, export_blank_count() + 1):
+            columns += [
+                (f"blank_{i}_student_answer", "string"),
+                (f"blank_{i}_correct_answer", "string"),
+                (f"blank_{i}_is_correct", "bool")
+            ]
+    return columns
+
+
+def iter_export_rows(scope, wide):
+    """逐行生成扁平化的导出数据：答题记录 + 学生总体统计 + 题目标题"""
+    overall = {
+        r["student_id"]: r for r in fetch_all_rows(
+            "student_overall_records", ["student_id", "accuracy", "total_correct", "total_questions"],
+            order=[("student_id", False)])
+    }
+    questions, _ = load_questions()
+    titles = {q["id"]: q["title"] for q in questions}
+    blank_count = export_blank_count() if wide else 0
+
+    fields = ["id", "student_id", "student_name", "question_id", "correct_count", "total_count", "accuracy",
+              "time_used", "hint_used", "submitted_at"]
+    if wide:
+        fields.append("answer_comparison")
+
+    for record in iter_rows("records", fields, "submitted_at", filters=records_scope_filters(scope)):
+        student = overall.get(record["student_id"], {})
+        row = {
+            "record_id": record["id"],
+            "student_id": record["student_id"],
+            "student_name": record["student_name"],
+            "question_id": record["question_id"],
+            "question_title": titles.get(record["question_id"]),
+            "correct_count": record["correct_count"],
+            "total_count": record["total_count"],
+            "accuracy": record["accuracy"],
+            "time_used": record["time_used"],
+            "hint_used": record["hint_used"],
+            "submitted_at": record["submitted_at"],
+            "overall_accuracy": student.get("accuracy"),
+            "overall_total_correct": student.get("total_correct"),
+            "overall_total_questions": student.get("total_questions")
+        }
+        if wide:
+            comparison = {c["index"]: c for c in record.get("answer_comparison") or []}
+            for i in range(blank_count):
+                blank = comparison.get(i, {})
+                row[f"blank_{i + 1}_student_answer"] = blank.get("student_answer")
+                row[f"blank_{i + 1}_correct_answer"] = blank.get("correct_answer")
+                row[f"blank_{i + 1}_is_correct"] = blank.get("is_correct")
+        yield row
+
+
+def generate_csv(rows, columns):
+    """流式生成 CSV（带 BOM，Excel 可直接识别中文）"""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=[name for name, _ in columns])
+    buffer.write("\ufeff")
+    writer.writeheader()
+
+    count = 0
+    for row in rows:
+        writer.writerow(row)
+        count += 1
+        if count % EXPORT_CHUNK_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+class _ChunkSink(io.RawIOBase):
+    """供 ParquetWriter 写入的缓冲区，写入的数据可分段取走"""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def generate_parquet(rows, columns):
+    """流式生成 Parquet，每 EXPORT_CHUNK_SIZE 行写一个 row group（需要安装 pyarrow，见 requirements-parquet.txt）"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([(name, pa.type_for_alias(type_name)) for name, type_name in columns])
+
+    def generate():
+        sink = _ChunkSink()
+        writer = pq.ParquetWriter(sink, schema)
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= EXPORT_CHUNK_SIZE:
+                writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+                batch = []
+                yield sink.drain()
+        if batch:
+            writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+        writer.close()
+        yield sink.drain()
+
+    return generate()
+
+
+# ==================== 后台清空任务 ====================
+_clear_jobs = {}
+_clear_jobs_lock = threading.Lock()
+
+
+def start_clear_job(scope):
+    """启动后台清空任务，返回任务信息"""
+    job = {
+        "job_id": str(uuid.uuid4()),
+        "status": "running",
+        "scope": scope,
+        "total": None,
+        "records_deleted": 0,
+        "overall_deleted": 0,
+        "overall_rebuilt": 0,
+        "progress": 0.0,
+        "error": None,
+        "started_at": datetime.now().isoformat(),
+        "finished_at": None
+    }
+    with _clear_jobs_lock:
+        _clear_jobs[job["job_id"]] = job
+        snapshot = dict(job)
+    threading.Thread(target=_run_clear_job, args=(job, scope), daemon=True).start()
+    return snapshot
+
+
+def _update_clear_job(job, **fields):
+    with _clear_jobs_lock:
+        job.update(fields)
+        if job["total"]:
+            job["progress"] = round(min(job["records_deleted"] / job["total"], 1.0) * 100, 1)
+
+
+def _run_clear_job(job, scope):
+    """按提交时间分批删除 records，最后处理总体记录
+
+    每批取范围内最早的 CLEAR_CHUNK_SIZE 条，删除提交时间不晚于其中最后一条的记录。
+    删除条件是时间范围而不是ID列表，DELETE 请求的 URL 不会随批大小变长。
+    """
+    try:
+        filters = records_scope_filters(scope)
+        _update_clear_job(job, total=storage.count("records", filters))
+
+        records_deleted = 0
+        student_ids = set()
+        while True:
+            rows = storage.select("records", ["student_id", "submitted_at"], filters,
+                                  order=[("submitted_at", False)], limit=CLEAR_CHUNK_SIZE)
+            if not rows:
+                break
+            bound = rows[-1]["submitted_at"]
+            student_ids.update(r["student_id"] for r in rows)
+            if len(rows) == CLEAR_CHUNK_SIZE:
+                # 与最后一条同一时间提交、未被取到的记录也会被删除，需要一并重算它们的学生
+                tied = storage.select("records", ["student_id"], [*filters, ("submitted_at", "eq", bound)])
+                student_ids.update(r["student_id"] for r in tied)
+            deleted = storage.delete("records", [*filters, ("submitted_at", "lte", bound)])
+            if not deleted:
+                # 提交时间为空的记录无法按时间删除，避免反复查询同一批
+                raise Exception("部分答题记录缺少提交时间，无法分批删除")
+            records_deleted += deleted
+            _update_clear_job(job, records_deleted=records_deleted)
+
+        if is_unscoped(scope):
+            _update_clear_job(job, overall_deleted=storage.delete("student_overall_records"))
+        elif student_ids:
+            _update_clear_job(job, **storage.rebuild_student_overall(sorted(student_ids)))
+
+        rebuild_question_stats_after_clear()
+        invalidate_trend_cache()
+        _update_clear_job(job, status="completed", progress=100.0, finished_at=datetime.now().isoformat())
+        logger.info("后台清空任务完成", extra={"data": {"job_id": job["job_id"], "records_deleted": records_deleted}})
+    except Exception as e:
+        logger.exception("后台清空任务失败", extra={"data": {"job_id": job["job_id"]}})
+        _update_clear_job(job, status="failed", error=str(e), finished_at=datetime.now().isoformat())
+
+
+# ==================== 请求指标 ====================
+@app.before_request
+def start_request_metrics():
+    g.request_started_at = time.perf_counter()
+    metrics.tracker.begin()
+    logging_setup.bind_request(request.method, request.url_rule.rule if request.url_rule else "<unmatched>")
+
+
+@app.teardown_request
+def clear_request_logging(exc):
+    logging_setup.clear_request()
+
+
+@app.after_request
+def record_request_metrics(response):
+    """记录请求耗时、存储调用与响应大小，并通过 Server-Timing 头返回给浏览器开发者工具
+
+    流式响应（导出、实时推送）只统计到开始返回数据为止。
+    """
+    started_at = g.pop("request_started_at", None)
+    db_calls, db_time = metrics.tracker.end()
+    if started_at is None:
+        return response
+    duration = time.perf_counter() - started_at
+
+    labels = (request.method, request.url_rule.rule if request.url_rule else "<unmatched>")
+    metrics.request_duration.observe(duration, labels)
+    metrics.request_db_calls.observe(db_calls, labels)
+    metrics.request_db_duration.observe(db_time, labels)
+    metrics.requests_total.inc(labels + (str(response.status_code),))
+    if not response.is_streamed:
+        metrics.response_size.observe(response.calculate_content_length() or 0, labels)
+
+    response.headers.add("Server-Timing",
+                         f'app;dur={duration * 1000:.2f}, db;dur={db_time * 1000:.2f};desc="{db_calls} calls"')
+    return response
+
+
+@app.route("/api/metrics", methods=["GET"])
+def get_metrics():
+    """Prometheus 格式的请求指标"""
+    if METRICS_TOKEN and request.headers.get("Authorization") != f"Bearer {METRICS_TOKEN}":
+        return jsonify({"error": "未授权访问"}), 401
+    return Response(metrics.registry.render(), mimetype="text/plain; version=0.0.4")
+
+
+# ==================== 限流 ====================
+rate_limiter = ratelimit.create_limiter(RATE_LIMIT_PATH)
+
+
+def client_ip():
+    """客户端 IP；经过 TRUSTED_PROXY_COUNT 层可信代理时从 X-Forwarded-For 中取"""
+    if TRUSTED_PROXY_COUNT > 0:
+        forwarded = [ip.strip() for ip in request.headers.get("X-Forwarded-For", "").split(",") if ip.strip()]
+        if len(forwarded) >= TRUSTED_PROXY_COUNT:
+            return forwarded[-TRUSTED_PROXY_COUNT]
+    return request.remote_addr or "unknown"
+
+
+def request_student_id():
+    """请求中的学生ID（查询参数或 JSON 请求体），没有时返回 None"""
+    student_id = request.args.get("student_id")
+    if student_id is None and request.is_json:
+        data = request.get_json(silent=True)
+        student_id = data.get("student_id") if isinstance(data, dict) else None
+    return str(student_id)[:64] if student_id else None
+
+
+@app.before_request
+def check_rate_limit():
+    """按路由限额检查学生和客户端 IP 的令牌桶，超出时在进入路由（访问数据库）之前返回 429"""
+    if not RATE_LIMIT_ENABLED or request.url_rule is None:
+        return None
+    route = request.url_rule.rule
+    route_limits = RATE_LIMITS.get(route)
+    if not route_limits:
+        return None
+
+    try:
+        for scope, (capacity, period) in route_limits.items():
+            identity = request_student_id() if scope == "student" else client_ip()
+            if not identity:
+                continue
+            retry_after = rate_limiter.acquire(f"{route}|{scope}|{identity}", capacity, period)
+            if retry_after > 0:
+                retry_after = math.ceil(retry_after)
+                logger.info("请求被限流", extra={"data": {"scope": scope, "retry_after": retry_after}})
+                response = jsonify({"error": "请求过于频繁，请稍后再试", "retry_after": retry_after})
+                response.headers["Retry-After"] = str(retry_after)
+                return response, 429
+    except Exception as e:
+        # 限流存储不可用时放行，不影响正常答题
+        logger.warning("限流检查失败: %s", e)
+    return None
+
+
 # ==================== 系统工具接口 ====================
 @app.route("/api/debug/answer-comparison", methods=["POST"])
 def debug_answer_comparison():
-    """调试答案比较问题"""
+    """调试答案比较问题
+
+    可传 answer_type 指定匹配方式（同 answer_types 中的一项），
+    或传 question_id、index 使用该题该空配置的匹配方式和正确答案。
+    """
     data = request.get_json()
-    user_answer = data.get("user_answer", "")
-    correct_answer = data.get("correct_answer", "")
+    user_answer = str(data.get("user_answer") or "")
+    correct_answer = str(data.get("correct_answer") or "")
 
-    norm_user = normalize_answer(user_answer)
-    norm_correct = normalize_answer(correct_answer)
+    try:
+        if data.get("question_id") is not None:
+            question = get_question(data["question_id"])
+            if not question:
+                return jsonify({"error": "题目不存在"}), 404
+            index = int(data.get("index", 0))
+            if not 0 <= index < len(question["answers"]):
+                return jsonify({"error": "填空序号超出范围"}), 400
+            correct_answer = str(question["answers"][index])
+            matcher = get_question_matchers(question)[index]
+        else:
+            matcher = matchers.compile_matcher(correct_answer, data.get("answer_type"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    is_correct, matched = matcher.match(user_answer)
+    norm_user = matchers.normalize_text(user_answer)
+    norm_correct = matchers.normalize_text(correct_answer)
 
     return jsonify({
         "user_answer": user_answer,
         "correct_answer": correct_answer,
         "normalized_user": norm_user,
         "normalized_correct": norm_correct,
-        "are_equal": norm_user == norm_correct,
+        "are_equal": is_correct,
+        "matcher": matcher.type,
+        "matched": matched,
         "user_length": len(user_answer),
         "correct_length": len(correct_answer),
         "normalized_user_length": len(norm_user),
@@ -648,52 +2656,64 @@ def debug_answer_comparison():
 @app.route("/api/test", methods=["GET", "POST"])
 def test_endpoint():
     """测试接口"""
-    print("=== 测试端点被调用 ===")
-    print(f"方法: {request.method}")
-    print(f"头信息: {dict(request.headers)}")
-    if request.method == "POST":
-        data = request.get_json()
-        print(f"请求数据: {data}")
+    if logging_setup.is_enabled(logging.DEBUG):
+        # 不记录令牌等凭据
+        headers = {k: ("***" if k.lower() in ("authorization", "cookie") else v) for k, v in request.headers.items()}
+        logger.debug("测试端点被调用", extra={"data": {
+            "headers": headers,
+            "body": request.get_json(silent=True) if request.method == "POST" else None
+        }})
     return jsonify({"status": "ok", "message": "测试成功"})
 
 
-@app.route("/api/health", methods=["GET"])
-def health_check():
-    """健康检查接口"""
-    return jsonify({"status": "ok", "message": "服务正常运行"}), 200
+# ==================== 启动预热 ====================
+def warm_up():
+    """提前完成原本由首个请求触发的初始化，返回各步骤耗时（毫秒）"""
+    timings = {}
 
+    start = time.perf_counter()
+    storage.warm_up()
+    timings["storage"] = round((time.perf_counter() - start) * 1000, 1)
 
-# ==================== 启动配置 ====================
-def test_supabase_connection():
-    """测试Supabase连接"""
-    try:
-        print("=== 测试Supabase连接 ===")
+    start = time.perf_counter()
+    load_questions()
+    timings["questions"] = round((time.perf_counter() - start) * 1000, 1)
 
-        test_db = supabase.table("questions").select("id").limit(1).execute()
-        print(f"数据库连接测试: {len(test_db.data)} 条记录")
+    start = time.perf_counter()
+    import analytics  # noqa: F401
+    timings["analytics"] = round((time.perf_counter() - start) * 1000, 1)
+    return timings
 
-        try:
-            buckets = supabase.storage.list_buckets()
-            bucket_names = [bucket.name for bucket in buckets]
-            print(f"可用存储桶: {bucket_names}")
-
-            if "question-images" in bucket_names:
-                print("✓ question-images 存储桶存在")
-                try:
-                    files = supabase.storage.from_("question-images").list()
-                    print(f"存储桶文件数量: {len(files)}")
-                except Exception as bucket_error:
-                    print(f"存储桶访问测试失败: {bucket_error}")
-            else:
-                print("✗ question-images 存储桶不存在")
-
-        except Exception as storage_error:
-            print(f"存储桶列表获取失败: {storage_error}")
 
+def _warm_up_in_background():
+    try:
+        timings = warm_up()
+        logger.info("启动预热完成: %s", timings)
+    except Exception:
+        logger.exception("启动预热失败")
+
+
+@app.route("/api/warmup", methods=["GET"])
+def warm_up_endpoint():
+    """预热接口：部署后或定时调用，使后续请求不必承担初始化耗时"""
+    try:
+        return jsonify({"success": True, "timings": warm_up()}), 200
     except Exception as e:
-        print(f"Supabase连接测试失败: {e}")
+        logger.exception("预热失败")
+        return jsonify({"error": f"预热失败：{str(e)}"}), 500
+
 
+if WARM_UP_ON_START:
+    threading.Thread(target=_warm_up_in_background, name="warm-up", daemon=True).start()
 
+
+@app.route("/api/health", methods=["GET"])
+def health_check():
+    """健康检查接口"""
+    return jsonify({"status": "ok", "message": "服务正常运行"}), 200
+
+
+# ==================== 启动配置 ====================
 if __name__ == "__main__":
-    test_supabase_connection()
+    storage.check_connection()
     app.run(host="0.0.0.0", port=5000, debug=True)
@@ -0,0 +1,207 @@
+"""教师认证
+
+令牌为 HS256 签名的 JWT（header.payload.signature，各段为 base64url），声明包含 sub、iat、exp、jti：
+- 验证只需一次 HMAC 和常量时间比较，不访问数据库；解析过的声明按令牌缓存（LRU），
+  命中缓存时只检查过期时间和吊销列表
+- 退出登录的令牌按 jti 记入吊销列表（字典，O(1) 查询，过期后清理）；吊销列表只在本进程内有效，
+  多实例部署时修改密码会使所有实例上的旧令牌失效（签名密钥由密码派生）
+- 签名密钥不能直接由明文密码派生：否则拿到任意一个令牌即可按 HMAC 的速度离线穷举密码。
+  密钥由服务端密钥（TEACHER_TOKEN_SECRET）或 PBKDF2 密码哈希派生；只配置了明文密码时先计算密码的
+  PBKDF2 哈希（盐由账号确定，各实例得到相同的密钥），在第一次签发或验证令牌时才计算，不拖慢启动
+
+密码以 PBKDF2-SHA256 保存为 pbkdf2_sha256$迭代次数$盐$哈希，验证通过的结果会被缓存，
+重复登录不必再计算一遍数十万轮的哈希；验证失败不缓存。
+"""
+import base64
+import binascii
+import hashlib
+import hmac
+import json
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+PBKDF2_ITERATIONS = 260000
+TOKEN_CACHE_SIZE = 1024
+VERIFIED_CACHE_SIZE = 64
+
+_HEADER = base64.urlsafe_b64encode(b'{"alg":"HS256","typ":"JWT"}').rstrip(b"=").decode("ascii")
+
+# 验证通过的 (密码哈希, 密码) 组合的摘要
+_verified_passwords = set()
+_verified_lock = threading.Lock()
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+# ==================== 密码 ====================
+def hash_password(password, salt=None, iterations=PBKDF2_ITERATIONS):
+    """计算密码哈希，返回 pbkdf2_sha256$迭代次数$盐$哈希"""
+    salt = salt or secrets.token_hex(16)
+    digest = hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), salt.encode("utf-8"), iterations)
+    return f"pbkdf2_sha256${iterations}${salt}${_b64encode(digest)}"
+
+
+def check_password(password, encoded):
+    """验证密码是否与 hash_password 的结果一致"""
+    if not password or not encoded:
+        return False
+    cache_key = hashlib.sha256(f"{encoded}\0{password}".encode("utf-8")).digest()
+    if cache_key in _verified_passwords:
+        return True
+
+    try:
+        algorithm, iterations, salt, expected = encoded.split("$")
+        iterations = int(iterations)
+    except ValueError:
+        return False
+    if algorithm != "pbkdf2_sha256":
+        return False
+    digest = hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), salt.encode("utf-8"), iterations)
+    if not hmac.compare_digest(_b64encode(digest).encode("ascii"), expected.encode("utf-8")):
+        return False
+
+    with _verified_lock:
+        if len(_verified_passwords) >= VERIFIED_CACHE_SIZE:
+            _verified_passwords.clear()
+        _verified_passwords.add(cache_key)
+    return True
+
+
+def derive_signing_key(secret, username, credential):
+    """由配置的密钥和当前教师凭据派生令牌签名密钥，凭据变化后旧令牌全部失效
+
+    secret 为空时 credential 必须是 PBKDF2 哈希（不是明文密码）。
+    """
+    return hmac.new((secret or "").encode("utf-8"), f"teacher-token\0{username}\0{credential}".encode("utf-8"),
+                    hashlib.sha256).digest()
+
+
+def derive_password_signing_key(username, password, iterations=PBKDF2_ITERATIONS):
+    """只配置了明文密码时的签名密钥：由密码的 PBKDF2 哈希派生，离线穷举时每次猜测都要计算一遍 PBKDF2
+
+    盐由账号确定而不是随机生成，多个实例（Serverless、gunicorn 多 worker）派生出相同的密钥。
+    """
+    salt = hashlib.sha256(f"teacher-token-salt\0{username}".encode("utf-8")).hexdigest()[:32]
+    return derive_signing_key(None, username, hash_password(password, salt, iterations))
+
+
+# ==================== 令牌 ====================
+class SigningKeyMissing(Exception):
+    """没有可用的签名密钥，不能签发令牌"""
+
+
+class TokenManager:
+    """签发与验证教师令牌"""
+
+    def __init__(self, key, ttl, cache_size=TOKEN_CACHE_SIZE):
+        """key 为签名密钥，也可以是返回密钥的函数（派生耗时较长时），第一次使用时才调用"""
+        self.ttl = ttl
+        self.cache_size = cache_size
+        self._key = key
+        self._claims = OrderedDict()  # 令牌 -> 声明，按最近使用排序
+        self._revoked = {}  # jti -> 过期时间
+        self._lock = threading.Lock()
+        self._derive_lock = threading.Lock()
+
+    def set_key(self, key):
+        """更换签名密钥（修改密码后），之前签发的令牌全部失效"""
+        with self._lock:
+            self._key = key
+            self._claims.clear()
+
+    def _current_key(self):
+        """当前签名密钥，延迟派生的密钥只计算一次"""
+        key = self._key
+        if not callable(key):
+            return key
+        with self._derive_lock:
+            key = self._key
+            while callable(key):
+                derived = key()
+                with self._lock:
+                    # 计算期间更换了密钥时以新密钥为准
+                    if self._key is key:
+                        self._key = derived
+                    key = self._key
+            return key
+
+    def _sign(self, signing_input, key):
+        return _b64encode(hmac.new(key, signing_input.encode("ascii"), hashlib.sha256).digest())
+
+    def issue(self, subject):
+        """签发令牌，没有签名密钥时抛出 SigningKeyMissing"""
+        key = self._current_key()
+        if key is None:
+            raise SigningKeyMissing()
+        now = int(time.time())
+        claims = {"sub": subject, "iat": now, "exp": now + self.ttl, "jti": secrets.token_urlsafe(12)}
+        signing_input = f"{_HEADER}.{_b64encode(json.dumps(claims, separators=(',', ':')).encode('utf-8'))}"
+        return f"{signing_input}.{self._sign(signing_input, key)}"
+
+    def _decode(self, token, key):
+        parts = token.split(".")
+        if len(parts) != 3:
+            return None
+        signing_input = f"{parts[0]}.{parts[1]}"
+        try:
+            expected = self._sign(signing_input, key)
+        except UnicodeEncodeError:
+            return None
+        if not hmac.compare_digest(expected.encode("ascii"), parts[2].encode("utf-8")):
+            return None
+        try:
+            header = json.loads(_b64decode(parts[0]))
+            claims = json.loads(_b64decode(parts[1]))
+        except (ValueError, binascii.Error):
+            return None
+        if not isinstance(header, dict) or header.get("alg") != "HS256" or not isinstance(claims, dict):
+            return None
+        if not isinstance(claims.get("exp"), (int, float)) or not claims.get("jti"):
+            return None
+        return claims
+
+    def verify(self, token):
+        """返回令牌的声明；令牌无效、过期或已吊销时返回 None。支持 "Bearer " 前缀"""
+        if not token:
+            return None
+        if token.startswith("Bearer "):
+            token = token[7:]
+
+        key = self._current_key()
+        if key is None:
+            return None
+        with self._lock:
+            claims = self._claims.get(token)
+            if claims is not None:
+                self._claims.move_to_end(token)
+
+        if claims is None:
+            claims = self._decode(token, key)
+            if claims is None:
+                return None
+            with self._lock:
+                # 解析期间更换了密钥时不缓存
+                if self._key is key:
+                    self._claims[token] = claims
+                    if len(self._claims) > self.cache_size:
+                        self._claims.popitem(last=False)
+
+        if claims["exp"] <= time.time() or claims["jti"] in self._revoked:
+            return None
+        return claims
+
+    def revoke(self, claims):
+        """吊销令牌（退出登录），并清理已过期的吊销记录"""
+        now = time.time()
+        with self._lock:
+            for jti in [jti for jti, exp in self._revoked.items() if exp <= now]:
+                del self._revoked[jti]
+            self._revoked[claims["jti"]] = claims["exp"]
@@ -0,0 +1,429 @@
+"""全班同时答题的负载测试
+
+在进程内用 Flask 测试客户端模拟一个班级同时答题：每个学生登录、获取题目，
+答完后按前端的方式一次提交整份答卷（time_used 为平均每题用时，hint_used 为该题是否用过提示），
+--per-question 时改为逐题调用 /api/student/submit。
+存储使用 SQLite 内存库代替 Supabase，不需要网络和账号，结果可重复。
+
+所有学生同时开始，同一时刻最多处理 --workers 个请求（对应服务端的工作线程数），其余请求排队。
+统计每个接口的吞吐量、处理时间的 p50/p95/p99、排队时间的 p95 和每次请求的存储调用次数。
+排队时间取决于线程调度，只作参考；处理时间和存储调用次数可保存为基线，
+之后修改处理函数时与基线比较，超出容差即返回非 0。延迟与机器有关，基线应在同一台机器上生成。
+
+用法（在 backend 目录下）：
+    python bench/load_test.py --students 30 100 500
+    python bench/load_test.py --save-baseline bench/baseline.json
+    python bench/load_test.py --baseline bench/baseline.json
+"""
+import argparse
+import contextlib
+import functools
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime
+from pathlib import Path
+
+backend_dir = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(backend_dir))
+
+# 必须在导入 app 之前设置，app 导入时按环境变量创建存储
+os.environ["STORAGE_BACKEND"] = "sqlite"
+os.environ["SQLITE_PATH"] = ":memory:"
+os.environ.setdefault("LOCAL_UPLOAD_DIR", tempfile.mkdtemp(prefix="quiz-bench-"))
+# 所有模拟学生来自同一个 IP，按 IP 的限流会把压测变成限流测试
+os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+
+import app as quiz_app  # noqa: E402
+from storage import Storage, create_storage  # noqa: E402
+
+ENDPOINTS = ("login", "quiz", "submit", "submit-batch")
+PERCENTILES = (50, 95, 99)
+DEFAULT_STUDENTS = (30, 100, 500)
+
+
+# ==================== 存储调用计数 ====================
+class StorageCallCounter:
+    """统计每个请求中的存储调用次数
+
+    包装存储对象的公开方法，只统计最外层调用（如 clear_records 内部再调用其他方法不重复计数）。
+    测试客户端在调用线程内处理请求，因此按线程计数即可归属到请求；
+    后台线程（缓冲写入队列、统计增量写入）的调用单独计入 background。
+    """
+
+    def __init__(self, storage):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.background = 0
+        for name in dir(Storage):
+            if not name.startswith("_") and callable(getattr(Storage, name)):
+                setattr(storage, name, self._wrap(getattr(storage, name)))
+
+    def _wrap(self, method):
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            depth = getattr(self._local, "depth", 0)
+            if depth == 0:
+                if getattr(self._local, "active", False):
+                    self._local.calls += 1
+                else:
+                    with self._lock:
+                        self.background += 1
+            self._local.depth = depth + 1
+            try:
+                return method(*args, **kwargs)
+            finally:
+                self._local.depth = depth
+        return wrapper
+
+    @contextlib.contextmanager
+    def measure(self):
+        """统计 with 块内当前线程的存储调用次数，结果为 yield 的列表中的唯一元素"""
+        self._local.active = True
+        self._local.calls = 0
+        result = [0]
+        try:
+            yield result
+        finally:
+            result[0] = self._local.calls
+            self._local.active = False
+
+
+# ==================== 测试数据 ====================
+def seed_questions(storage, count, blanks):
+    """写入 count 道题目，每题 blanks 个填空，返回 {题目 id: 正确答案}"""
+    answer_key = {}
+    for i in range(count):
+        question_id = str(uuid.uuid4())
+        answers = [f"答案{i + 1}-{j + 1}" for j in range(blanks)]
+        storage.insert_question({
+            "id": question_id,
+            "title": f"压测题目 {i + 1}",
+            "answers": answers,
+            "image_url": None,
+            "created_at": datetime.now().isoformat()
+        })
+        answer_key[question_id] = answers
+    return answer_key
+
+
+def reset_app(question_count, blanks, cold_cache):
+    """为一轮测试换上全新的内存存储并清空进程内缓存与统计增量
+
+    默认先加载一次题目缓存（学生打开页面前题目早已发布），存储调用次数因此稳定可比；
+    cold_cache 时保留空缓存，用于观察所有学生同时触发加载的情况。
+    """
+    storage = create_storage("sqlite", sqlite_path=":memory:", upload_dir=os.environ["LOCAL_UPLOAD_DIR"])
+    quiz_app.storage = storage
+    answer_key = seed_questions(storage, question_count, blanks)
+    quiz_app.invalidate_question_cache()
+    if not cold_cache:
+        quiz_app.load_questions()
+    with quiz_app._question_stats_lock:
+        quiz_app._question_stats_deltas.clear()
+    return storage, answer_key
+
+
+# ==================== 学生会话 ====================
+class Results:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latency = defaultdict(list)
+        self.wait = defaultdict(list)
+        self.db_calls = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def add(self, endpoint, seconds, wait, calls, ok):
+        with self._lock:
+            self.latency[endpoint].append(seconds)
+            self.wait[endpoint].append(wait)
+            self.db_calls[endpoint].append(calls)
+            if not ok:
+                self.errors[endpoint] += 1
+
+
+def timed_request(client, counter, results, server, endpoint, method, url, **kwargs):
+    """发送请求，分别记录排队等待空闲工作线程的时间和处理时间"""
+    queued_at = time.perf_counter()
+    with server:
+        start = time.perf_counter()
+        with counter.measure() as calls:
+            response = getattr(client, method)(url, **kwargs)
+        elapsed = time.perf_counter() - start
+    ok = response.status_code < 400
+    results.add(endpoint, elapsed, start - queued_at, calls[0], ok)
+    return response if ok else None
+
+
+def student_session(index, answer_key, counter, results, server, barrier, rng, accuracy, hint_rate, think_time,
+                    per_question):
+    """一个学生的完整答题流程，与前端 index.html 的请求顺序一致"""
+    client = quiz_app.app.test_client()
+    barrier.wait()
+
+    response = timed_request(client, counter, results, server, "login", "post", "/api/student/login",
+                             json={"name": f"学生{index + 1:03d}"})
+    if response is None:
+        return
+    student = response.get_json()
+
+    response = timed_request(client, counter, results, server, "quiz", "get", "/api/student/quiz")
+    if response is None:
+        return
+    questions = response.get_json()["data"]
+
+    # 前端在最后一题答完后统一提交，time_used 取总用时按题数平均
+    duration = 0
+    submissions = []
+    for question in questions:
+        answers = []
+        for correct in answer_key[question["id"]]:
+            answers.append(correct if rng.random() < accuracy else "错误答案")
+        hint_used = rng.random() < hint_rate
+        submissions.append((question["id"], answers, hint_used))
+        duration += rng.randint(20, 120)
+        if think_time:
+            time.sleep(rng.uniform(0, think_time))
+
+    if not per_question:
+        timed_request(client, counter, results, server, "submit-batch", "post", "/api/student/submit-batch", json={
+            "student_id": student["student_id"],
+            "name": student["name"],
+            "submissions": [
+                {"question_id": question_id, "answers": answers, "time_used": duration // len(submissions),
+                 "hint_used": hint_used}
+                for question_id, answers, hint_used in submissions
+            ]
+        })
+        return
+
+    for question_id, answers, hint_used in submissions:
+        timed_request(client, counter, results, server, "submit", "post", "/api/student/submit", json={
+            "student_id": student["student_id"],
+            "name": student["name"],
+            "question_id": question_id,
+            "answers": answers,
+            "time_used": duration // len(submissions),
+            "hint_used": hint_used
+        })
+
+
+# ==================== 统计 ====================
+def percentile(values, p):
+    """线性插值百分位数"""
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    position = (len(ordered) - 1) * p / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def summarize(results, wall_time):
+    summary = {}
+    for endpoint in ENDPOINTS:
+        if endpoint not in results.latency:
+            continue
+        latency = results.latency.get(endpoint, [])
+        wait = results.wait.get(endpoint, [])
+        calls = results.db_calls.get(endpoint, [])
+        summary[endpoint] = {
+            "requests": len(latency),
+            "errors": results.errors.get(endpoint, 0),
+            "throughput": round(len(latency) / wall_time, 1) if wall_time else None,
+            **{f"p{p}_ms": round(percentile(latency, p) * 1000, 2) if latency else None for p in PERCENTILES},
+            "wait_p95_ms": round(percentile(wait, 95) * 1000, 2) if wait else None,
+            "db_calls_per_request": round(sum(calls) / len(calls), 2) if calls else None
+        }
+    return summary
+
+
+def run_scenario(students, args):
+    storage, answer_key = reset_app(args.questions, args.blanks, args.cold_cache)
+    counter = StorageCallCounter(storage)
+    results = Results()
+    # 同一时刻最多处理 workers 个请求，相当于服务端的工作线程数，其余请求排队
+    server = threading.BoundedSemaphore(args.workers)
+    barrier = threading.Barrier(students + 1)
+    rng = random.Random(args.seed)
+
+    threads = [
+        threading.Thread(target=student_session, args=(
+            i, answer_key, counter, results, server, barrier, random.Random(rng.random()),
+            args.accuracy, args.hint_rate, args.think_time, args.per_question
+        ))
+        for i in range(students)
+    ]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    quiz_app.flush_submit_queue()
+    wall_time = time.perf_counter() - start
+
+    total_requests = sum(len(v) for v in results.latency.values())
+    return {
+        "students": students,
+        "wall_time_s": round(wall_time, 3),
+        "throughput": round(total_requests / wall_time, 1) if wall_time else None,
+        "background_db_calls": counter.background,
+        "endpoints": summarize(results, wall_time)
+    }
+
+
+def median_result(runs):
+    """多次运行取每项指标的中位数，减少线程调度带来的抖动"""
+    def median(values):
+        values = [v for v in values if v is not None]
+        return percentile(values, 50) if values else None
+
+    result = {
+        "students": runs[0]["students"],
+        "runs": len(runs),
+        "wall_time_s": round(median([r["wall_time_s"] for r in runs]), 3),
+        "throughput": round(median([r["throughput"] for r in runs]), 1),
+        "background_db_calls": max(r["background_db_calls"] for r in runs),
+        "endpoints": {}
+    }
+    for endpoint, stats in runs[0]["endpoints"].items():
+        merged = {}
+        for key, value in stats.items():
+            values = [r["endpoints"][endpoint][key] for r in runs]
+            if key in ("requests", "errors"):
+                merged[key] = max(values)
+            else:
+                value = median(values)
+                merged[key] = round(value, 2) if value is not None else None
+        result["endpoints"][endpoint] = merged
+    return result
+
+
+def print_scenario(result):
+    print(f"\n学生数 {result['students']}（{result['runs']} 次取中位数）：用时 {result['wall_time_s']}s，"
+          f"总吞吐 {result['throughput']} 请求/秒，后台存储调用 {result['background_db_calls']} 次")
+    print(f"{'endpoint':<14}{'requests':>10}{'errors':>8}{'req/s':>10}{'p50(ms)':>10}{'p95(ms)':>10}"
+          f"{'p99(ms)':>10}{'wait95(ms)':>12}{'db/req':>8}")
+    for endpoint, stats in result["endpoints"].items():
+        print(f"{endpoint:<14}{stats['requests']:>10}{stats['errors']:>8}{stats['throughput']:>10}"
+              f"{stats['p50_ms']:>10}{stats['p95_ms']:>10}{stats['p99_ms']:>10}"
+              f"{stats['wait_p95_ms']:>12}{stats['db_calls_per_request']:>8}")
+
+
+# ==================== 基线比较 ====================
+def compare_with_baseline(results, config, baseline, latency_tolerance):
+    """与基线比较，返回回退项列表
+
+    p95 延迟超过基线 (1 + latency_tolerance) 倍、存储调用次数增加或出现错误都视为回退。
+    延迟与机器有关，基线应在同一台机器上生成。
+    """
+    if baseline.get("config") != config:
+        print(f"注意：本次测试参数与基线不同，基线参数为 {baseline.get('config')}")
+    regressions = []
+    baseline_by_students = {str(item["students"]): item for item in baseline["scenarios"]}
+    for result in results:
+        base = baseline_by_students.get(str(result["students"]))
+        if not base:
+            print(f"基线中没有 {result['students']} 名学生的结果，跳过比较")
+            continue
+        for endpoint, stats in result["endpoints"].items():
+            base_stats = base["endpoints"].get(endpoint)
+            if not base_stats or not stats["requests"]:
+                continue
+            label = f"{result['students']} 名学生 {endpoint}"
+            if stats["errors"]:
+                regressions.append(f"{label}：{stats['errors']} 个请求失败")
+            if base_stats["p95_ms"] and stats["p95_ms"] > base_stats["p95_ms"] * (1 + latency_tolerance):
+                regressions.append(f"{label}：p95 {stats['p95_ms']}ms，基线 {base_stats['p95_ms']}ms")
+            if (base_stats["db_calls_per_request"] is not None
+                    and stats["db_calls_per_request"] > base_stats["db_calls_per_request"]):
+                regressions.append(f"{label}：存储调用 {stats['db_calls_per_request']} 次/请求，"
+                                   f"基线 {base_stats['db_calls_per_request']} 次/请求")
+    return regressions
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="模拟全班同时答题的负载测试")
+    parser.add_argument("--students", type=int, nargs="+", default=list(DEFAULT_STUDENTS),
+                        help="同时答题的学生数，可指定多个，默认 30 100 500")
+    parser.add_argument("--workers", type=int, default=8,
+                        help="同时处理请求的线程数，对应 gunicorn 的 workers × threads，默认 8")
+    parser.add_argument("--questions", type=int, default=10, help="题目数，默认 10")
+    parser.add_argument("--blanks", type=int, default=3, help="每题填空数，默认 3")
+    parser.add_argument("--accuracy", type=float, default=0.7, help="每个填空答对的概率，默认 0.7")
+    parser.add_argument("--hint-rate", type=float, default=0.2, help="每题使用提示的概率，默认 0.2")
+    parser.add_argument("--think-time", type=float, default=0.0,
+                        help="每题最长思考时间（秒），默认 0 即所有提交集中在同一时刻")
+    parser.add_argument("--per-question", action="store_true",
+                        help="逐题调用 /api/student/submit（旧版前端的提交方式）")
+    parser.add_argument("--cold-cache", action="store_true", help="开始时题目缓存为空")
+    parser.add_argument("--repeat", type=int, default=3, help="每个学生数重复运行的次数，默认 3")
+    parser.add_argument("--seed", type=int, default=2024, help="随机种子，默认 2024")
+    parser.add_argument("--save-baseline", metavar="PATH", help="将本次结果保存为基线")
+    parser.add_argument("--baseline", metavar="PATH", help="与基线比较，出现回退时返回 1")
+    parser.add_argument("--latency-tolerance", type=float, default=1.0,
+                        help="p95 延迟允许超出基线的比例，默认 1.0 即不超过基线的 2 倍")
+    parser.add_argument("--output", metavar="PATH", help="将本次结果写入 JSON 文件")
+    parser.add_argument("--verbose", action="store_true", help="保留接口的调试输出")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    results = []
+    for students in args.students:
+        # 提交接口会打印调试信息，压测时默认丢弃
+        with open(os.devnull, "w") as devnull, \
+                contextlib.redirect_stdout(sys.stdout if args.verbose else devnull):
+            runs = [run_scenario(students, args) for _ in range(args.repeat)]
+        result = median_result(runs)
+        print_scenario(result)
+        results.append(result)
+
+    config = {
+        "workers": args.workers,
+        "questions": args.questions,
+        "blanks": args.blanks,
+        "accuracy": args.accuracy,
+        "hint_rate": args.hint_rate,
+        "think_time": args.think_time,
+        "seed": args.seed,
+        "cold_cache": args.cold_cache,
+        "per_question": args.per_question,
+        "repeat": args.repeat,
+        "submit_buffered": quiz_app.SUBMIT_BUFFERED
+    }
+    report = {
+        "generated_at": datetime.now().isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "config": config,
+        "scenarios": results
+    }
+    for path in filter(None, (args.output, args.save_baseline)):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n结果已写入 {path}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare_with_baseline(results, config, baseline, args.latency_tolerance)
+        if regressions:
+            print("\n与基线相比出现回退：")
+            for item in regressions:
+                print(f"  - {item}")
+            return 1
+        print("\n与基线相比没有回退")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,208 @@
+"""启动耗时测试
+
+Serverless 冷启动和 gunicorn worker 重启时，第一个请求要等进程导入 app 并完成各种首次初始化。
+每次运行启动一个新的 Python 进程，测量：
+- 进程启动到开始导入 app 的耗时（解释器启动）
+- 导入 app 的耗时
+- 每个路径的第一个请求从发出到收到第一个字节（TTFB）的耗时，以及紧接着的第二个请求的耗时
+- 从启动进程到第一个请求收到第一个字节的总耗时
+
+--warm-up 时在第一个请求之前调用 app.warm_up()，单独统计预热耗时，对比预热后首个请求的耗时。
+--top 时用 python -X importtime 列出导入耗时最多的模块。
+默认使用 SQLite 内存库，导入后写入 --questions 道题目（不计入耗时），结果可重复；
+--storage supabase 时使用 .env 中的 Supabase 配置，包含 SDK 导入、客户端创建和网络往返的耗时。
+
+用法（在 backend 目录下）：
+    python bench/startup.py
+    python bench/startup.py --repeat 10 --paths /api/health /api/student/quiz
+    python bench/startup.py --warm-up --top 15
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+backend_dir = Path(__file__).resolve().parent.parent
+
+DEFAULT_PATHS = ("/api/health", "/api/student/quiz", "/")
+
+
+# ==================== 子进程 ====================
+def _ms(seconds):
+    return round(seconds * 1000, 2)
+
+
+def seed_questions(storage, count):
+    for i in range(count):
+        storage.insert_question({
+            "id": str(uuid.uuid4()),
+            "title": f"启动测试题目 {i + 1}",
+            "answers": [f"答案{i + 1}-{j + 1}" for j in range(3)],
+            "image_url": None,
+            "created_at": datetime.now().isoformat()
+        })
+
+
+def run_child(paths, warm_up, spawned_at, questions):
+    """在新进程中导入 app 并发出第一批请求，结果以 JSON 输出到标准输出"""
+    started_at = time.time()
+    sys.path.insert(0, str(backend_dir))
+
+    start = time.perf_counter()
+    import app as quiz_app
+    result = {"interpreter_ms": _ms(started_at - spawned_at), "import_ms": _ms(time.perf_counter() - start)}
+
+    # 写入题目的耗时从总耗时中扣除
+    seed_start = time.time()
+    seed_questions(quiz_app.storage, questions)
+    spawned_at += time.time() - seed_start
+
+    if warm_up:
+        start = time.perf_counter()
+        quiz_app.warm_up()
+        result["warm_up_ms"] = _ms(time.perf_counter() - start)
+
+    client = quiz_app.app.test_client()
+    result["requests"] = {}
+    for path in paths:
+        timings = []
+        for _ in range(2):
+            start = time.perf_counter()
+            response = client.get(path, buffered=False)
+            next(iter(response.response), b"")
+            timings.append(time.perf_counter() - start)
+            if "first_byte_at" not in result:
+                result["first_byte_at"] = time.time()
+            response.close()
+        result["requests"][path] = {"status": response.status_code, "first_ms": _ms(timings[0]),
+                                    "second_ms": _ms(timings[1])}
+
+    result["total_ms"] = _ms(result.pop("first_byte_at") - spawned_at) if paths else None
+    print(json.dumps(result))
+
+
+def child_env(storage):
+    env = dict(os.environ)
+    if storage == "sqlite":
+        env["STORAGE_BACKEND"] = "sqlite"
+        env["SQLITE_PATH"] = ":memory:"
+        env.setdefault("LOCAL_UPLOAD_DIR", tempfile.mkdtemp(prefix="quiz-bench-"))
+    env.setdefault("LOG_LEVEL", "WARNING")
+    env.setdefault("RATE_LIMIT_ENABLED", "false")
+    # 预热由 --warm-up 控制，不使用后台线程
+    env["WARM_UP_ON_START"] = "false"
+    return env
+
+
+def spawn(args):
+    questions = args.questions if args.storage == "sqlite" else 0
+    command = [sys.executable, __file__, "--child", "--spawned-at", str(time.time()),
+               "--questions", str(questions), "--paths", *args.paths]
+    if args.warm_up:
+        command.append("--warm-up")
+    completed = subprocess.run(command, cwd=backend_dir, env=child_env(args.storage),
+                               capture_output=True, text=True)
+    if completed.returncode != 0:
+        raise RuntimeError(f"子进程失败：\n{completed.stderr}")
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+# ==================== 导入耗时明细 ====================
+def slowest_imports(storage, top):
+    """用 -X importtime 导入 app，返回累计耗时最多的 top 个模块 [(模块, 毫秒)]"""
+    completed = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app"], cwd=backend_dir,
+                               env=child_env(storage), capture_output=True, text=True)
+    modules = {}
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        # 同一模块只计一次，缩进表示被哪个模块导入，只取本项目直接导入的（顶层和第一层）
+        depth = (len(name) - len(name.lstrip())) // 2
+        if depth <= 1:
+            modules[name.strip()] = max(modules.get(name.strip(), 0), int(cumulative) / 1000)
+    return sorted(modules.items(), key=lambda item: item[1], reverse=True)[:top]
+
+
+# ==================== 汇总 ====================
+def median_result(results):
+    def median(values):
+        values = [value for value in values if value is not None]
+        return round(statistics.median(values), 2) if values else None
+
+    summary = {key: median([r.get(key) for r in results])
+               for key in ("interpreter_ms", "import_ms", "warm_up_ms", "total_ms")}
+    summary["requests"] = {
+        path: {
+            "status": results[-1]["requests"][path]["status"],
+            "first_ms": median([r["requests"][path]["first_ms"] for r in results]),
+            "second_ms": median([r["requests"][path]["second_ms"] for r in results]),
+        }
+        for path in results[0]["requests"]
+    }
+    return summary
+
+
+def print_summary(summary, runs):
+    print(f"\n启动耗时（{runs} 次取中位数）：")
+    print(f"  解释器启动      {summary['interpreter_ms']:>10} ms")
+    print(f"  导入 app        {summary['import_ms']:>10} ms")
+    if summary["warm_up_ms"] is not None:
+        print(f"  预热            {summary['warm_up_ms']:>10} ms")
+    if summary["total_ms"] is not None:
+        print(f"  启动到首字节    {summary['total_ms']:>10} ms")
+
+    print(f"\n{'path':<28}{'status':>8}{'first(ms)':>12}{'second(ms)':>12}")
+    for path, stats in summary["requests"].items():
+        print(f"{path:<28}{stats['status']:>8}{stats['first_ms']:>12}{stats['second_ms']:>12}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="测量导入 app 的耗时和首个请求的首字节时间")
+    parser.add_argument("--paths", nargs="+", default=list(DEFAULT_PATHS),
+                        help=f"依次请求的路径，默认 {' '.join(DEFAULT_PATHS)}")
+    parser.add_argument("--repeat", type=int, default=5, help="启动进程的次数，默认 5")
+    parser.add_argument("--storage", choices=("sqlite", "supabase"), default="sqlite",
+                        help="存储后端，默认 sqlite（内存库）；supabase 使用 .env 中的配置")
+    parser.add_argument("--questions", type=int, default=10, help="SQLite 内存库中的题目数，默认 10")
+    parser.add_argument("--warm-up", action="store_true", help="第一个请求之前调用 app.warm_up()")
+    parser.add_argument("--top", type=int, default=0, help="列出导入耗时最多的 N 个模块")
+    parser.add_argument("--output", metavar="PATH", help="将本次结果写入 JSON 文件")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--spawned-at", type=float, help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.child:
+        run_child(args.paths, args.warm_up, args.spawned_at, args.questions)
+        return 0
+
+    results = [spawn(args) for _ in range(args.repeat)]
+    summary = median_result(results)
+    print_summary(summary, len(results))
+
+    if args.top:
+        summary["slowest_imports"] = slowest_imports(args.storage, args.top)
+        print(f"\n导入耗时最多的 {args.top} 个模块（累计）：")
+        for name, elapsed in summary["slowest_imports"]:
+            print(f"  {name:<40}{elapsed:>10.1f} ms")
+
+    if args.output:
+        path = Path(args.output)
+        path.write_text(json.dumps({"config": vars(args), "result": summary}, ensure_ascii=False, indent=2),
+                        encoding="utf-8")
+        print(f"\n结果已写入 {path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,112 @@
+"""题目图片处理
+
+上传的图片按内容的 SHA-256 命名，同一张图片重复上传只保存一份。
+安装了 Pillow 时为每张图片生成不同宽度的 WebP 和 JPEG（带透明通道的图片为 PNG）版本，
+学生端默认加载缩小后的 WebP，避免在教室网络下下载原始的手机照片；
+未安装 Pillow（见 requirements.txt）时只保存原图并记录警告。文件名随内容变化，可以长期缓存。
+"""
+import hashlib
+import io
+import logging
+
+# 各版本的最大宽度（像素），原图更窄时不放大
+VARIANT_WIDTHS = {"large": 1280, "medium": 640, "thumb": 200}
+# 学生端默认显示的版本
+DISPLAY_VARIANT = "large"
+WEBP_QUALITY = 80
+JPEG_QUALITY = 82
+# 解码前允许的最大像素数，防止超大尺寸的图片耗尽内存
+MAX_IMAGE_PIXELS = 50_000_000
+READ_CHUNK_SIZE = 64 * 1024
+
+logger = logging.getLogger("quiz.images")
+
+# 文件头 -> (格式, 扩展名, Content-Type)
+_SIGNATURES = (
+    (b"\x89PNG\r\n\x1a\n", ("png", "png", "image/png")),
+    (b"\xff\xd8\xff", ("jpeg", "jpg", "image/jpeg")),
+    (b"GIF87a", ("gif", "gif", "image/gif")),
+    (b"GIF89a", ("gif", "gif", "image/gif")),
+)
+
+
+class ImageTooLarge(Exception):
+    pass
+
+
+def read_limited(stream, max_size):
+    """分块读取上传内容并同时计算 SHA-256，超过 max_size 字节时抛出 ImageTooLarge"""
+    buffer = io.BytesIO()
+    digest = hashlib.sha256()
+    while True:
+        chunk = stream.read(READ_CHUNK_SIZE)
+        if not chunk:
+            break
+        if buffer.tell() + len(chunk) > max_size:
+            raise ImageTooLarge(max_size)
+        buffer.write(chunk)
+        digest.update(chunk)
+    return buffer.getvalue(), digest.hexdigest()
+
+
+def detect_format(data):
+    """根据文件头判断图片格式，返回 (格式, 扩展名, Content-Type)，不是支持的图片时返回 None"""
+    for signature, result in _SIGNATURES:
+        if data.startswith(signature):
+            return result
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "webp", "webp", "image/webp"
+    return None
+
+
+def original_filename(digest, extension):
+    return f"{digest[:32]}.{extension}"
+
+
+def variant_filename(digest, name, extension):
+    return f"{digest[:32]}-{name}.{extension}"
+
+
+def build_variants(data, digest):
+    """生成缩放后的各版本，返回 [(版本名, 格式, 文件名, 数据, Content-Type)]
+
+    未安装 Pillow、动图或无法解码的图片返回空列表，只使用原图。
+    """
+    try:
+        from PIL import Image, ImageOps
+    except ImportError:
+        logger.warning("未安装 Pillow，图片 %s 不生成缩放版本，学生端将加载原图", digest[:12])
+        return []
+
+    Image.MAX_IMAGE_PIXELS = MAX_IMAGE_PIXELS
+    try:
+        image = Image.open(io.BytesIO(data))
+        if getattr(image, "is_animated", False):
+            logger.warning("图片 %s 为动图，不生成缩放版本", digest[:12])
+            return []
+        # 手机照片的方向记录在 EXIF 中，缩放前先转正
+        image = ImageOps.exif_transpose(image)
+        has_alpha = image.mode in ("RGBA", "LA", "PA") or (image.mode == "P" and "transparency" in image.info)
+        image = image.convert("RGBA" if has_alpha else "RGB")
+    except Exception as e:
+        logger.warning("图片 %s 无法解码，不生成缩放版本: %s", digest[:12], e)
+        return []
+
+    variants = []
+    for name, width in VARIANT_WIDTHS.items():
+        resized = image.copy()
+        resized.thumbnail((width, width * 4), Image.LANCZOS)
+
+        webp = io.BytesIO()
+        resized.save(webp, "WEBP", quality=WEBP_QUALITY, method=4)
+        variants.append((name, "webp", variant_filename(digest, name, "webp"), webp.getvalue(), "image/webp"))
+
+        fallback = io.BytesIO()
+        if has_alpha:
+            resized.save(fallback, "PNG", optimize=True)
+            variants.append((name, "png", variant_filename(digest, name, "png"), fallback.getvalue(), "image/png"))
+        else:
+            resized.save(fallback, "JPEG", quality=JPEG_QUALITY, optimize=True, progressive=True)
+            variants.append((name, "jpeg", variant_filename(digest, name, "jpg"), fallback.getvalue(), "image/jpeg"))
+    return variants
+
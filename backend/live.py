@@ -0,0 +1,154 @@
+"""课堂实时事件推送
+
+EventHub 把一次提交产生的事件分发给所有连接中的教师端（SSE）。
+单进程部署时事件直接在内存中分发；gunicorn 多 worker 部署时设置 EVENT_BUS_PATH，
+事件写入共享的 SQLite 文件，每个 worker 只用一个线程读取新事件再分发给本进程的订阅者，
+因此不论有多少教师端连接，每个事件都只写一次。
+"""
+import json
+import queue
+import sqlite3
+import threading
+import time
+
+# 每个订阅者最多积压的事件数，超出后丢弃最旧的事件（教师端网络慢时不拖累其他人）
+SUBSCRIBER_QUEUE_SIZE = 1000
+# 共享事件表的轮询间隔（秒）
+BUS_POLL_INTERVAL = 0.2
+# 共享事件表中事件的保留时间（秒）
+BUS_RETENTION = 300
+
+
+class Subscription:
+    """一个教师端连接的事件队列"""
+
+    def __init__(self, hub):
+        self.hub = hub
+        self.queue = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+
+    def put(self, event):
+        while True:
+            try:
+                self.queue.put_nowait(event)
+                return
+            except queue.Full:
+                try:
+                    self.queue.get_nowait()
+                except queue.Empty:
+                    pass
+
+    def get(self, timeout):
+        """等待下一个事件，超时返回 None"""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.hub.unsubscribe(self)
+
+
+class EventHub:
+    """事件发布/订阅中心"""
+
+    def __init__(self, bus_path=None):
+        self.bus_path = bus_path
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._sequence = 0
+        self._reader = None
+        self._local = threading.local()
+        if bus_path:
+            self._init_bus()
+
+    # ---------- 订阅 ----------
+    def subscribe(self):
+        subscription = Subscription(self)
+        with self._lock:
+            self._subscribers.add(subscription)
+        if self.bus_path:
+            self._ensure_reader()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    @property
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subscribers)
+
+    # ---------- 发布 ----------
+    def publish(self, event_type, data):
+        """发布事件；多 worker 模式下写入共享事件表，由各 worker 的读取线程分发"""
+        if self.bus_path:
+            payload = json.dumps(data, ensure_ascii=False, default=str)
+            connection = self._connection()
+            with connection:
+                connection.execute("INSERT INTO events (type, data, created_at) VALUES (?, ?, ?)",
+                                   (event_type, payload, time.time()))
+            return
+
+        with self._lock:
+            self._sequence += 1
+            event = {"id": self._sequence, "type": event_type, "data": data}
+        self._dispatch(event)
+
+    def _dispatch(self, event):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            subscription.put(event)
+
+    # ---------- SQLite 共享事件表 ----------
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.bus_path, timeout=5)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def _init_bus(self):
+        connection = self._connection()
+        with connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS events ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, type TEXT NOT NULL, data TEXT NOT NULL, "
+                "created_at REAL NOT NULL)"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS events_created_at ON events (created_at)")
+
+    def _ensure_reader(self):
+        with self._lock:
+            if self._reader is None or not self._reader.is_alive():
+                self._reader = threading.Thread(target=self._read_bus, name="event-bus", daemon=True)
+                self._reader.start()
+
+    def _read_bus(self):
+        """读取共享事件表中的新事件并分发给本进程的订阅者（只分发订阅之后的事件）"""
+        connection = self._connection()
+        last_id = connection.execute("SELECT COALESCE(MAX(id), 0) FROM events").fetchone()[0]
+        last_prune = time.monotonic()
+
+        while True:
+            rows = connection.execute("SELECT id, type, data FROM events WHERE id > ? ORDER BY id",
+                                      (last_id,)).fetchall()
+            for event_id, event_type, data in rows:
+                self._dispatch({"id": event_id, "type": event_type, "data": json.loads(data)})
+                last_id = event_id
+
+            if time.monotonic() - last_prune > BUS_RETENTION:
+                with connection:
+                    connection.execute("DELETE FROM events WHERE created_at < ?", (time.time() - BUS_RETENTION,))
+                last_prune = time.monotonic()
+
+            time.sleep(BUS_POLL_INTERVAL)
+
+
+def format_sse(event):
+    """格式化为 SSE 消息"""
+    data = json.dumps(event["data"], ensure_ascii=False, default=str)
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {data}\n\n"
@@ -0,0 +1,165 @@
+"""结构化日志
+
+日志写入内存队列，由单独的线程格式化并输出，请求线程不等待 stdout。
+- LOG_LEVEL：全局日志级别，默认 INFO
+- LOG_ROUTE_LEVELS：按路由覆盖级别，如 "/api/student/submit=DEBUG,/api/test=WARNING"
+- LOG_SAMPLE_RATE：INFO 及以下日志的采样比例（0~1），WARNING 及以上总是输出，默认 1
+- LOG_FORMAT：json（默认，每行一个 JSON 对象）或 text
+
+热点路径在拼装日志参数前用 is_enabled() 判断，未开启调试时几乎没有开销。
+"""
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+from datetime import datetime
+
+LOGGER_NAME = "quiz"
+
+# 当前请求的路由和该路由生效的日志级别
+_request_context = contextvars.ContextVar("log_request_context", default=None)
+_base_level = logging.INFO
+_route_levels = {}
+_listener = None
+
+
+def _parse_level(value, default=logging.INFO):
+    level = logging.getLevelName(str(value).strip().upper())
+    return level if isinstance(level, int) else default
+
+
+def parse_route_levels(value):
+    """解析 "路由=级别,路由=级别" 格式的配置"""
+    levels = {}
+    for item in (value or "").split(","):
+        if "=" in item:
+            route, level = item.rsplit("=", 1)
+            levels[route.strip()] = _parse_level(level)
+    return levels
+
+
+def current_level():
+    context = _request_context.get()
+    return context[2] if context else _base_level
+
+
+def is_enabled(level):
+    """当前请求是否输出该级别的日志，用于在拼装开销较大的日志参数前判断"""
+    return level >= current_level()
+
+
+def bind_request(method, route):
+    """记录当前请求的方法和路由，决定本请求的日志级别"""
+    _request_context.set((method, route, _route_levels.get(route, _base_level)))
+
+
+def clear_request():
+    _request_context.set(None)
+
+
+class RequestContextFilter(logging.Filter):
+    """按路由级别过滤，并在请求线程内把方法、路由附加到日志记录上"""
+
+    def filter(self, record):
+        context = _request_context.get()
+        if context:
+            record.method, record.route, level = context
+        else:
+            level = _base_level
+        return record.levelno >= level
+
+
+class SamplingFilter(logging.Filter):
+    """按比例采样 INFO 及以下的日志，WARNING 及以上总是保留"""
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return record.levelno >= logging.WARNING or self.rate >= 1 or random.random() < self.rate
+
+
+class JsonFormatter(logging.Formatter):
+    """每条日志输出为一行 JSON，extra={"data": {...}} 中的字段原样附加"""
+
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage()
+        }
+        for key in ("method", "route"):
+            if hasattr(record, key):
+                entry[key] = getattr(record, key)
+        if isinstance(getattr(record, "data", None), dict):
+            entry.update(record.data)
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    def format(self, record):
+        text = super().format(record)
+        if isinstance(getattr(record, "data", None), dict):
+            text += " " + json.dumps(record.data, ensure_ascii=False, default=str)
+        return text
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """只把记录放入队列，格式化留给输出线程
+
+    标准 QueueHandler 会在调用线程中先格式化消息；这里只合并参数并丢弃无法跨线程的对象。
+    """
+
+    def prepare(self, record):
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def setup_logging():
+    """配置 quiz 日志，重复调用无副作用，返回 quiz 根日志对象"""
+    global _base_level, _route_levels, _listener
+
+    logger = logging.getLogger(LOGGER_NAME)
+    if _listener is not None:
+        return logger
+
+    _base_level = _parse_level(os.getenv("LOG_LEVEL", "INFO"))
+    _route_levels = parse_route_levels(os.getenv("LOG_ROUTE_LEVELS"))
+    sample_rate = float(os.getenv("LOG_SAMPLE_RATE", "1"))
+
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(TextFormatter() if os.getenv("LOG_FORMAT", "json") == "text" else JsonFormatter())
+
+    handler = _QueueHandler(queue.SimpleQueue())
+    handler.addFilter(RequestContextFilter())
+    if sample_rate < 1:
+        handler.addFilter(SamplingFilter(sample_rate))
+
+    # 日志对象的级别取全局和各路由中最低的，其余由 RequestContextFilter 按路由过滤
+    logger.setLevel(min([_base_level, *_route_levels.values()]))
+    logger.addHandler(handler)
+    logger.propagate = False
+
+    _listener = logging.handlers.QueueListener(handler.queue, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+    return logger
+
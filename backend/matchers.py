@@ -0,0 +1,228 @@
+"""答案匹配
+
+题目的 answer_types 字段与 answers 一一对应，指定每个填空的匹配方式，缺省或为 null 时使用 text：
+- text：Unicode 规范化（NFKC，全角转半角）、忽略大小写、合并连续空白后比较；ignore_spaces 为 true 时忽略所有空白
+- exact：只去掉首尾空白，区分大小写
+- numeric：按数值比较，支持小数、分数（1/2）、百分数（50%）和科学计数法；
+  tolerance 为允许误差（默认 1e-9），relative 为 true 时按相对误差；value 缺省取 answers 中的答案
+- regex：pattern 完整匹配规范化后的答案，ignore_case 默认 true
+- alternatives：values 中任一答案（按 text 方式比较）都算正确，answers 中的答案本身也算
+- fuzzy：按 text 方式规范化后编辑距离不超过 max_distance（默认 1）
+
+每项可以是类型名字符串，也可以是 {"type": ..., 其他参数} 对象。
+匹配器按题目编译一次后缓存，批改时每个填空只需一次线性扫描，不会在每个请求中重新编译正则。
+"""
+import math
+import re
+import unicodedata
+from fractions import Fraction
+
+DEFAULT_TYPE = "text"
+DEFAULT_TOLERANCE = 1e-9
+DEFAULT_MAX_DISTANCE = 1
+
+# NFKC 不会转换的常见减号和小数点写法
+_CHAR_FIXES = str.maketrans({"−": "-", "–": "-", "—": "-", "。": "."})
+_THOUSANDS = re.compile(r"^[+-]?\d{1,3}(,\d{3})+(\.\d+)?$")
+
+
+def normalize_unicode(answer):
+    """NFKC 规范化（全角字母数字、全角空格等转为半角）并去掉首尾空白"""
+    return unicodedata.normalize("NFKC", "" if answer is None else str(answer)).translate(_CHAR_FIXES).strip()
+
+
+def normalize_text(answer, ignore_spaces=False):
+    """text 匹配使用的规范化：NFKC、忽略大小写、合并连续空白"""
+    text = normalize_unicode(answer).casefold()
+    return "".join(text.split()) if ignore_spaces else " ".join(text.split())
+
+
+def parse_number(answer):
+    """解析数值答案，无法解析时返回 None"""
+    text = normalize_unicode(answer).replace(" ", "")
+    if not text:
+        return None
+    if _THOUSANDS.match(text):
+        text = text.replace(",", "")
+
+    scale = 1
+    if text.endswith("%"):
+        text, scale = text[:-1], Fraction(1, 100)
+    try:
+        if "/" in text:
+            numerator, denominator = text.split("/", 1)
+            value = Fraction(int(numerator), int(denominator))
+        else:
+            value = Fraction(text)
+        # 超出浮点数范围的答案（如 1e400）视为无法解析
+        number = float(value * scale)
+    except (ValueError, ZeroDivisionError, OverflowError):
+        return None
+    return number if math.isfinite(number) else None
+
+
+def within_distance(a, b, max_distance):
+    """a、b 的编辑距离是否不超过 max_distance
+
+    只计算对角线附近宽为 2 * max_distance + 1 的带状区域，复杂度 O(len × max_distance)。
+    """
+    if abs(len(a) - len(b)) > max_distance:
+        return False
+    if max_distance == 0:
+        return a == b
+
+    infinity = max_distance + 1
+    previous = [j if j <= max_distance else infinity for j in range(len(b) + 1)]
+    for i in range(1, len(a) + 1):
+        start = max(1, i - max_distance)
+        end = min(len(b), i + max_distance)
+        current = [infinity] * (len(b) + 1)
+        current[0] = i if i <= max_distance else infinity
+        row_min = current[0]
+        for j in range(start, end + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost, infinity)
+            row_min = min(row_min, current[j])
+        if row_min > max_distance:
+            return False
+        previous = current
+    return previous[len(b)] <= max_distance
+
+
+# ==================== 匹配器 ====================
+class Matcher:
+    """一个填空的匹配器，match 返回 (是否正确, 命中说明)"""
+
+    type = None
+
+    def match(self, answer):
+        raise NotImplementedError
+
+
+class TextMatcher(Matcher):
+    type = "text"
+
+    def __init__(self, correct_answer, ignore_spaces=False):
+        self.ignore_spaces = bool(ignore_spaces)
+        self.expected = normalize_text(correct_answer, self.ignore_spaces)
+
+    def match(self, answer):
+        if normalize_text(answer, self.ignore_spaces) == self.expected:
+            return True, self.expected
+        return False, None
+
+
+class ExactMatcher(Matcher):
+    type = "exact"
+
+    def __init__(self, correct_answer):
+        self.expected = str(correct_answer).strip()
+
+    def match(self, answer):
+        if str(answer or "").strip() == self.expected:
+            return True, self.expected
+        return False, None
+
+
+class NumericMatcher(Matcher):
+    type = "numeric"
+
+    def __init__(self, correct_answer, value=None, tolerance=DEFAULT_TOLERANCE, relative=False):
+        self.expected = parse_number(correct_answer if value is None else value)
+        if self.expected is None:
+            raise ValueError(f"无法解析数值答案：{correct_answer if value is None else value}")
+        self.tolerance = float(tolerance)
+        if self.tolerance < 0:
+            raise ValueError("tolerance 不能为负数")
+        self.relative = bool(relative)
+
+    def match(self, answer):
+        value = parse_number(answer)
+        if value is None:
+            return False, None
+        allowed = self.tolerance * abs(self.expected) if self.relative else self.tolerance
+        if abs(value - self.expected) <= allowed:
+            return True, f"{value:g} ≈ {self.expected:g}"
+        return False, None
+
+
+class RegexMatcher(Matcher):
+    type = "regex"
+
+    def __init__(self, correct_answer, pattern=None, ignore_case=True):
+        try:
+            self.pattern = re.compile(pattern or re.escape(str(correct_answer)),
+                                      re.IGNORECASE if ignore_case else 0)
+        except re.error as e:
+            raise ValueError(f"正则表达式无效：{e}")
+
+    def match(self, answer):
+        if self.pattern.fullmatch(" ".join(normalize_unicode(answer).split())):
+            return True, self.pattern.pattern
+        return False, None
+
+
+class AlternativesMatcher(Matcher):
+    type = "alternatives"
+
+    def __init__(self, correct_answer, values=()):
+        if isinstance(values, str) or not isinstance(values, (list, tuple)):
+            raise ValueError("alternatives 的 values 必须是答案列表")
+        self.expected = {normalize_text(v): v for v in [*values, correct_answer]}
+
+    def match(self, answer):
+        normalized = normalize_text(answer)
+        if normalized in self.expected:
+            return True, self.expected[normalized]
+        return False, None
+
+
+class FuzzyMatcher(Matcher):
+    type = "fuzzy"
+
+    def __init__(self, correct_answer, max_distance=DEFAULT_MAX_DISTANCE):
+        self.expected = normalize_text(correct_answer)
+        self.max_distance = int(max_distance)
+        if self.max_distance < 0:
+            raise ValueError("max_distance 不能为负数")
+
+    def match(self, answer):
+        if within_distance(normalize_text(answer), self.expected, self.max_distance):
+            return True, f"编辑距离 ≤ {self.max_distance}"
+        return False, None
+
+
+MATCHER_TYPES = {cls.type: cls for cls in
+                 (TextMatcher, ExactMatcher, NumericMatcher, RegexMatcher, AlternativesMatcher, FuzzyMatcher)}
+
+
+def compile_matcher(correct_answer, spec=None):
+    """根据 answer_types 中的一项编译匹配器，配置无效时抛出 ValueError"""
+    if spec is None:
+        spec = {"type": DEFAULT_TYPE}
+    elif isinstance(spec, str):
+        spec = {"type": spec}
+    elif not isinstance(spec, dict):
+        raise ValueError("answer_types 的每一项必须是类型名或对象")
+
+    options = dict(spec)
+    matcher_type = options.pop("type", DEFAULT_TYPE)
+    matcher_class = MATCHER_TYPES.get(matcher_type)
+    if matcher_class is None:
+        raise ValueError(f"不支持的答案类型：{matcher_type}，可选 {', '.join(MATCHER_TYPES)}")
+    try:
+        return matcher_class(correct_answer, **options)
+    except TypeError:
+        raise ValueError(f"{matcher_type} 类型的参数无效：{', '.join(options) or '无'}")
+
+
+def compile_question(question):
+    """编译一道题所有填空的匹配器"""
+    answers = question.get("answers") or []
+    answer_types = question.get("answer_types") or []
+    if not isinstance(answer_types, list):
+        raise ValueError("answer_types 必须是列表")
+    if len(answer_types) > len(answers):
+        raise ValueError("answer_types 的数量不能多于答案数量")
+    return [compile_matcher(answer, answer_types[i] if i < len(answer_types) else None)
+            for i, answer in enumerate(answers)]
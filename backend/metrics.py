@@ -0,0 +1,195 @@
+"""请求指标统计
+
+记录每个请求的耗时、存储调用次数与耗时、响应大小，以 Prometheus 文本格式输出。
+指标保存在进程内，gunicorn 多 worker 部署时每个 worker 各自统计，由 Prometheus 分别抓取。
+"""
+import contextvars
+import functools
+import threading
+import time
+from bisect import bisect_left
+
+# 各类指标的分桶上界
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+DB_CALL_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _format_labels(labelnames, labels, extra=()):
+    pairs = list(zip(labelnames, labels)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+class Counter:
+    """只增计数器"""
+
+    type = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels=(), amount=1):
+        labels = tuple(labels)
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for labels, value in sorted(values.items()):
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+
+
+class Histogram:
+    """累计分桶直方图"""
+
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DURATION_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets) + (float("inf"),)
+        self._values = {}  # labels -> [各桶计数, 总和, 次数]
+        self._lock = threading.Lock()
+
+    def observe(self, value, labels=()):
+        labels = tuple(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [[0] * len(self.buckets), 0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def samples(self):
+        with self._lock:
+            values = {labels: (list(counts), total, count) for labels, (counts, total, count) in self._values.items()}
+        for labels, (counts, total, count) in sorted(values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = _format_labels(self.labelnames, labels, [("le", _format_value(bound))])
+                yield f"{self.name}_bucket{le} {cumulative}"
+            label_text = _format_labels(self.labelnames, labels)
+            yield f"{self.name}_sum{label_text} {_format_value(total)}"
+            yield f"{self.name}_count{label_text} {count}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        """Prometheus 文本格式（text/plain; version=0.0.4）"""
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+class RequestTracker:
+    """记录当前请求中的存储调用次数与耗时
+
+    统计对象保存在 contextvar 中：视图函数所在线程直接可见，
+    通过 contextvars.copy_context() 交给线程池并行执行的查询也会计入同一个请求。
+    不在请求中的调用（后台写入线程等）只计入存储调用直方图。
+    """
+
+    def __init__(self):
+        self._current = contextvars.ContextVar("request_tracker", default=None)
+
+    def begin(self):
+        self._current.set(_RequestStats())
+
+    def end(self):
+        """结束统计，返回 (存储调用次数, 存储耗时秒数)"""
+        stats = self._current.get()
+        if stats is None:
+            return 0, 0.0
+        self._current.set(None)
+        return stats.db_calls, stats.db_time
+
+    def record_db_call(self, seconds):
+        stats = self._current.get()
+        if stats is not None:
+            stats.add(seconds)
+
+
+class _RequestStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.db_calls = 0
+        self.db_time = 0.0
+
+    def add(self, seconds):
+        with self._lock:
+            self.db_calls += 1
+            self.db_time += seconds
+
+
+registry = Registry()
+tracker = RequestTracker()
+
+request_duration = registry.register(Histogram(
+    "http_request_duration_seconds", "请求处理耗时（秒）", ("method", "route")))
+request_db_calls = registry.register(Histogram(
+    "http_request_db_calls", "每个请求的存储调用次数", ("method", "route"), DB_CALL_BUCKETS))
+request_db_duration = registry.register(Histogram(
+    "http_request_db_duration_seconds", "每个请求在存储调用上花费的时间（秒）", ("method", "route")))
+response_size = registry.register(Histogram(
+    "http_response_size_bytes", "响应体大小（字节），流式响应不计入", ("method", "route"), SIZE_BUCKETS))
+requests_total = registry.register(Counter(
+    "http_requests_total", "请求数", ("method", "route", "status")))
+storage_duration = registry.register(Histogram(
+    "storage_call_duration_seconds", "存储层各方法的调用耗时（秒）", ("operation",)))
+
+
+def instrument_storage(storage, base_class):
+    """包装存储对象的公开方法，记录调用次数与耗时
+
+    只统计最外层调用，存储方法内部互相调用不重复计数。返回原对象。
+    """
+    local = threading.local()
+
+    def wrap(name, method):
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            if getattr(local, "depth", 0):
+                return method(*args, **kwargs)
+            local.depth = 1
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                local.depth = 0
+                storage_duration.observe(elapsed, (name,))
+                tracker.record_db_call(elapsed)
+        return wrapper
+
+    for name in dir(base_class):
+        if not name.startswith("_") and callable(getattr(base_class, name)):
+            setattr(storage, name, wrap(name, getattr(storage, name)))
+    return storage
@@ -0,0 +1,128 @@
+"""令牌桶限流
+
+每个 (路由, 限流维度, 标识) 对应一个令牌桶：容量为 capacity，每 period 秒补满，每个请求消耗一个令牌，
+桶空时拒绝并给出需要等待的秒数。限流在请求进入路由之前完成，被拒绝的请求不会访问数据库。
+
+单进程部署时令牌桶保存在内存中；gunicorn 多 worker 部署时设置 RATE_LIMIT_PATH，
+令牌桶保存在共享的 SQLite 文件中（与 live.py 的 EVENT_BUS_PATH 相同的做法），
+各 worker 共用同一份限额，每次检查只有一条读写事务。
+"""
+import sqlite3
+import threading
+import time
+
+# 内存中的令牌桶超过该数量时清理已经补满的桶
+MAX_MEMORY_BUCKETS = 10000
+# 共享文件中令牌桶的清理间隔（秒）
+PRUNE_INTERVAL = 60
+
+
+def parse_limits(value):
+    """解析限流配置
+
+    格式为 "路由=维度:次数/秒数;维度:次数/秒数,路由=..."，维度为 student 或 ip，如
+    "/api/student/submit=student:60/60;ip:3000/60,/api/teacher/login=ip:10/60"。
+    返回 {路由: {维度: (次数, 秒数)}}，格式错误时抛出 ValueError。
+    """
+    limits = {}
+    for item in (value or "").split(","):
+        if not item.strip():
+            continue
+        route, _, rules = item.partition("=")
+        route_limits = limits.setdefault(route.strip(), {})
+        for rule in rules.split(";"):
+            try:
+                scope, _, rate = rule.partition(":")
+                capacity, period = rate.split("/")
+                capacity, period = int(capacity), float(period)
+            except ValueError:
+                raise ValueError(f"限流配置格式错误：{item}")
+            if scope.strip() not in ("student", "ip") or capacity <= 0 or period <= 0:
+                raise ValueError(f"限流配置格式错误：{item}")
+            route_limits[scope.strip()] = (capacity, period)
+    return limits
+
+
+def _take(tokens, updated_at, now, capacity, period):
+    """补充令牌后尝试取一个，返回 (剩余令牌, 需等待的秒数)，等待秒数为 0 表示放行"""
+    rate = capacity / period
+    tokens = min(capacity, tokens + (now - updated_at) * rate)
+    if tokens >= 1:
+        return tokens - 1, 0.0
+    return tokens, (1 - tokens) / rate
+
+
+class MemoryLimiter:
+    """进程内的令牌桶"""
+
+    def __init__(self):
+        self._buckets = {}  # 键 -> (令牌数, 更新时间, 补满所需时间)
+        self._lock = threading.Lock()
+
+    def acquire(self, key, capacity, period):
+        """消耗一个令牌，返回需等待的秒数（0 表示放行）"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at, _ = self._buckets.get(key, (capacity, now, period))
+            tokens, retry_after = _take(tokens, updated_at, now, capacity, period)
+            self._buckets[key] = (tokens, now, period)
+            if len(self._buckets) > MAX_MEMORY_BUCKETS:
+                self._prune(now)
+        return retry_after
+
+    def _prune(self, now):
+        # 空闲时间超过一个周期的桶已经补满，删除后与新建的桶等价
+        for key in [k for k, (_, updated_at, period) in self._buckets.items() if now - updated_at >= period]:
+            del self._buckets[key]
+
+
+class SQLiteLimiter:
+    """保存在共享 SQLite 文件中的令牌桶，供多个 worker 共用"""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._last_prune = 0.0
+        with self._connection() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS rate_buckets ("
+                "key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL, expires_at REAL NOT NULL)"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS rate_buckets_expires ON rate_buckets (expires_at)")
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=OFF")
+            self._local.connection = connection
+        return connection
+
+    def acquire(self, key, capacity, period):
+        # 多进程之间使用墙上时间
+        now = time.time()
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            row = connection.execute("SELECT tokens, updated_at FROM rate_buckets WHERE key = ?", (key,)).fetchone()
+            tokens, updated_at = row if row else (capacity, now)
+            tokens, retry_after = _take(tokens, updated_at, now, capacity, period)
+            connection.execute(
+                "INSERT INTO rate_buckets (key, tokens, updated_at, expires_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET tokens = excluded.tokens, updated_at = excluded.updated_at, "
+                "expires_at = excluded.expires_at",
+                (key, tokens, now, now + period)
+            )
+            if now - self._last_prune >= PRUNE_INTERVAL:
+                self._last_prune = now
+                connection.execute("DELETE FROM rate_buckets WHERE expires_at < ?", (now,))
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        return retry_after
+
+
+def create_limiter(path=None):
+    return SQLiteLimiter(path) if path else MemoryLimiter()
@@ -0,0 +1,4 @@
+-- 在 Supabase SQL Editor 中执行
+-- 每个填空的匹配方式（text、exact、numeric、regex、alternatives、fuzzy），与 answers 一一对应，见 matchers.py
+-- 未设置时所有填空使用默认的 text 匹配
+alter table questions add column if not exists answer_types jsonb;
@@ -0,0 +1,86 @@
+-- 在 Supabase SQL Editor 中执行
+-- 按范围批量清空答题记录，供 /api/records/clear 通过 RPC 一次调用完成
+
+-- 根据 records 重新计算指定学生的总体统计，已无答题记录的学生删除其总体记录
+create or replace function rebuild_student_overall(p_student_ids text[])
+returns jsonb
+language plpgsql
+as $$
+declare
+    v_deleted int;
+    v_rebuilt int;
+begin
+    delete from student_overall_records o
+    where o.student_id::text = any(p_student_ids)
+      and not exists (select 1 from records r where r.student_id = o.student_id);
+    get diagnostics v_deleted = row_count;
+
+    update student_overall_records o set
+        total_correct = s.total_correct,
+        total_questions = s.total_questions,
+        total_time = s.total_time,
+        accuracy = s.total_correct * 100.0 / nullif(s.total_questions, 0),
+        last_submitted_at = s.last_submitted_at
+    from (
+        select student_id,
+               sum(correct_count) as total_correct,
+               sum(total_count) as total_questions,
+               coalesce(sum(time_used), 0) as total_time,
+               max(submitted_at) as last_submitted_at
+        from records
+        where student_id::text = any(p_student_ids)
+        group by student_id
+    ) s
+    where o.student_id = s.student_id;
+    get diagnostics v_rebuilt = row_count;
+
+    return jsonb_build_object('overall_deleted', v_deleted, 'overall_rebuilt', v_rebuilt);
+end;
+$$;
+
+-- 删除范围内的答题记录（参数均为空时清空全部），并修正受影响学生的总体统计
+-- p_session_id 需要先执行 sql/quiz_sessions.sql；参数列表有变化，先删除旧版本的函数
+drop function if exists clear_records(text[], timestamptz, timestamptz);
+
+create or replace function clear_records(
+    p_student_ids text[] default null,
+    p_since timestamptz default null,
+    p_until timestamptz default null,
+    p_session_id text default null
+)
+returns jsonb
+language plpgsql
+as $$
+declare
+    v_records_deleted int;
+    v_overall_deleted int;
+    v_students text[];
+begin
+    if p_student_ids is null and p_since is null and p_until is null and p_session_id is null then
+        delete from records where true;
+        get diagnostics v_records_deleted = row_count;
+        delete from student_overall_records where true;
+        get diagnostics v_overall_deleted = row_count;
+        return jsonb_build_object(
+            'records_deleted', v_records_deleted,
+            'overall_deleted', v_overall_deleted,
+            'overall_rebuilt', 0
+        );
+    end if;
+
+    with deleted as (
+        delete from records r
+        where (p_student_ids is null or r.student_id::text = any(p_student_ids))
+          and (p_since is null or r.submitted_at >= p_since)
+          and (p_until is null or r.submitted_at < p_until)
+          and (p_session_id is null or r.session_id::text = p_session_id)
+        returning r.student_id::text as student_id
+    )
+    select coalesce(array_agg(distinct student_id), '{}'), count(*)
+    into v_students, v_records_deleted
+    from deleted;
+
+    return jsonb_build_object('records_deleted', v_records_deleted)
+           || rebuild_student_overall(v_students);
+end;
+$$;
@@ -0,0 +1,157 @@
+-- 在 Supabase SQL Editor 中执行
+-- 每道题、每个填空的预聚合统计，提交答案时增量累加，看板只需读取 O(题目数) 行
+
+create table if not exists question_stats (
+    question_id text primary key,
+    attempts bigint not null default 0,
+    correct_count bigint not null default 0,
+    total_count bigint not null default 0,
+    time_sum double precision not null default 0,
+    time_sq_sum double precision not null default 0,
+    timed_attempts bigint not null default 0,
+    hint_count bigint not null default 0,
+    updated_at timestamptz not null default now()
+);
+
+create table if not exists blank_stats (
+    question_id text not null,
+    blank_index int not null,
+    attempts bigint not null default 0,
+    correct_count bigint not null default 0,
+    wrong_answers jsonb not null default '{}'::jsonb,  -- 错误答案 -> 出现次数
+    updated_at timestamptz not null default now(),
+    primary key (question_id, blank_index)
+);
+
+-- 错误答案的规范化，与 matchers.normalize_text（text 匹配、增量统计和班级分析使用）一致：
+-- NFKC、统一减号和句号、忽略大小写、合并连续空白；空答案为 ''。
+-- PostgreSQL 的 lower 与 Python 的 casefold 只在少数字符（如 ß）上不同
+create or replace function normalize_answer_text(p_answer text)
+returns text
+language sql
+immutable
+as $$
+    select btrim(regexp_replace(
+        lower(translate(normalize(coalesce(p_answer, ''), NFKC), '−–—。', '---.')),
+        '\s+', ' ', 'g'
+    ));
+$$;
+
+-- 合并两个 {答案: 次数} 计数对象
+create or replace function merge_answer_counts(a jsonb, b jsonb)
+returns jsonb
+language sql
+immutable
+as $$
+    select coalesce(jsonb_object_agg(key, total), '{}'::jsonb)
+    from (
+        select key, sum(value::bigint) as total
+        from (
+            select * from jsonb_each_text(coalesce(a, '{}'::jsonb))
+            union all
+            select * from jsonb_each_text(coalesce(b, '{}'::jsonb))
+        ) t
+        group by key
+    ) s;
+$$;
+
+-- 累加一批增量，p_deltas 结构：
+-- [{"question_id", "attempts", "correct_count", "total_count", "time_sum", "time_sq_sum", "timed_attempts",
+--   "hint_count", "blanks": [{"blank_index", "attempts", "correct_count", "wrong_answers": {答案: 次数}}]}]
+create or replace function apply_question_stats(p_deltas jsonb)
+returns void
+language plpgsql
+as $$
+declare
+    d jsonb;
+    b jsonb;
+begin
+    for d in select * from jsonb_array_elements(p_deltas) loop
+        insert into question_stats as s (
+            question_id, attempts, correct_count, total_count, time_sum, time_sq_sum, timed_attempts, hint_count
+        )
+        values (
+            d ->> 'question_id',
+            (d ->> 'attempts')::bigint,
+            (d ->> 'correct_count')::bigint,
+            (d ->> 'total_count')::bigint,
+            (d ->> 'time_sum')::double precision,
+            (d ->> 'time_sq_sum')::double precision,
+            (d ->> 'timed_attempts')::bigint,
+            (d ->> 'hint_count')::bigint
+        )
+        on conflict (question_id) do update set
+            attempts = s.attempts + excluded.attempts,
+            correct_count = s.correct_count + excluded.correct_count,
+            total_count = s.total_count + excluded.total_count,
+            time_sum = s.time_sum + excluded.time_sum,
+            time_sq_sum = s.time_sq_sum + excluded.time_sq_sum,
+            timed_attempts = s.timed_attempts + excluded.timed_attempts,
+            hint_count = s.hint_count + excluded.hint_count,
+            updated_at = now();
+
+        for b in select * from jsonb_array_elements(d -> 'blanks') loop
+            insert into blank_stats as s (question_id, blank_index, attempts, correct_count, wrong_answers)
+            values (
+                d ->> 'question_id',
+                (b ->> 'blank_index')::int,
+                (b ->> 'attempts')::bigint,
+                (b ->> 'correct_count')::bigint,
+                coalesce(b -> 'wrong_answers', '{}'::jsonb)
+            )
+            on conflict (question_id, blank_index) do update set
+                attempts = s.attempts + excluded.attempts,
+                correct_count = s.correct_count + excluded.correct_count,
+                wrong_answers = merge_answer_counts(s.wrong_answers, excluded.wrong_answers),
+                updated_at = now();
+        end loop;
+    end loop;
+end;
+$$;
+
+-- 统计与 records 不一致时，根据 records 全量重算
+create or replace function rebuild_question_stats()
+returns jsonb
+language plpgsql
+as $$
+declare
+    v_questions int;
+    v_blanks int;
+begin
+    delete from question_stats where true;
+    delete from blank_stats where true;
+
+    insert into question_stats (
+        question_id, attempts, correct_count, total_count, time_sum, time_sq_sum, timed_attempts, hint_count
+    )
+    select question_id::text,
+           count(*),
+           coalesce(sum(correct_count), 0),
+           coalesce(sum(total_count), 0),
+           coalesce(sum(time_used), 0),
+           coalesce(sum(time_used::double precision * time_used), 0),
+           count(time_used),
+           count(*) filter (where hint_used)
+    from records
+    group by question_id;
+    get diagnostics v_questions = row_count;
+
+    insert into blank_stats (question_id, blank_index, attempts, correct_count, wrong_answers)
+    select question_id, blank_index, sum(attempts), sum(correct_count),
+           coalesce(jsonb_object_agg(answer, wrong) filter (where answer is not null and wrong > 0), '{}'::jsonb)
+    from (
+        select r.question_id::text as question_id,
+               (c ->> 'index')::int as blank_index,
+               normalize_answer_text(c ->> 'student_answer') as answer,
+               count(*) as attempts,
+               count(*) filter (where (c ->> 'is_correct')::boolean) as correct_count,
+               count(*) filter (where not (c ->> 'is_correct')::boolean) as wrong
+        from records r, jsonb_array_elements(r.answer_comparison) c
+        group by 1, 2, 3
+    ) t
+    group by question_id, blank_index;
+    get diagnostics v_blanks = row_count;
+
+    return jsonb_build_object('questions', v_questions, 'blanks', v_blanks);
+end;
+$$;
@@ -0,0 +1,18 @@
+-- 在 Supabase SQL Editor 中执行
+-- 答题场次：教师从题库中选出有序的一组题目，开始时冻结题目快照，学生按快照答题和批改
+
+create table if not exists quiz_sessions (
+    id uuid primary key,
+    title text not null,
+    question_ids jsonb not null,
+    shuffle boolean not null default false,
+    status text not null default 'draft' check (status in ('draft', 'active', 'ended')),
+    snapshot jsonb,
+    created_at timestamptz not null default now(),
+    started_at timestamptz,
+    ended_at timestamptz
+);
+
+-- 答题记录所属的场次，不在场次中提交的记录为 null
+alter table records add column if not exists session_id uuid;
+create index if not exists records_session on records (session_id, submitted_at);
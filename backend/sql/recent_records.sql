@@ -0,0 +1,31 @@
+-- 在 Supabase SQL Editor 中执行
+-- 每个学生最近 N 条答题记录，供 /api/analysis/students 通过 RPC 一次调用完成，
+-- 不再按 OFFSET 分页读取整张 records 表
+
+-- 按学生取最近的记录，也用于学生分析和趋势的按学生查询
+create index if not exists records_student_submitted on records (student_id, submitted_at desc, id);
+
+-- 返回 {学生ID: [记录, ...]}，每个学生最多 p_limit 条，新记录在前；
+-- 返回单个 jsonb 值，不受 PostgREST 单次返回行数的限制
+create or replace function recent_records_by_student(p_limit int)
+returns jsonb
+language sql
+stable
+as $$
+    select coalesce(jsonb_object_agg(student_id, records), '{}'::jsonb)
+    from (
+        select student_id::text as student_id,
+               jsonb_agg(
+                   jsonb_build_object('id', id, 'student_id', student_id, 'accuracy', accuracy,
+                                      'submitted_at', submitted_at)
+                   order by submitted_at desc, id
+               ) as records
+        from (
+            select r.id, r.student_id, r.accuracy, r.submitted_at,
+                   row_number() over (partition by r.student_id order by r.submitted_at desc, r.id) as rn
+            from records r
+        ) ranked
+        where rn <= p_limit
+        group by student_id
+    ) grouped;
+$$;
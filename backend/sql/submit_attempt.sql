@@ -0,0 +1,57 @@
+-- 在 Supabase SQL Editor 中执行
+-- 原子地保存一次答题记录并累加学生总体统计，供 /api/student/submit 通过 RPC 一次调用完成
+-- 开启缓冲写入（SUBMIT_BUFFERED）时只调用 increment_student_overall，答题记录由后台批量写入
+
+-- 累加依赖 student_id 唯一
+create unique index if not exists student_overall_records_student_id_key
+    on student_overall_records (student_id);
+
+-- 累加学生总体统计；p_overall 为首次答题时要插入的总体记录，已存在则在原记录上累加
+create or replace function increment_student_overall(p_overall jsonb)
+returns jsonb
+language plpgsql
+as $$
+declare
+    v_overall student_overall_records;
+begin
+    insert into student_overall_records as o
+    select * from jsonb_populate_record(null::student_overall_records, p_overall)
+    on conflict (student_id) do update set
+        total_correct = o.total_correct + excluded.total_correct,
+        total_questions = o.total_questions + excluded.total_questions,
+        total_time = o.total_time + excluded.total_time,
+        accuracy = (o.total_correct + excluded.total_correct) * 100.0
+                   / nullif(o.total_questions + excluded.total_questions, 0),
+        last_submitted_at = excluded.last_submitted_at
+    returning * into v_overall;
+
+    return to_jsonb(v_overall);
+end;
+$$;
+
+-- 保存答题记录并累加总体统计
+create or replace function submit_attempt(p_record jsonb, p_overall jsonb)
+returns jsonb
+language plpgsql
+as $$
+begin
+    insert into records
+    select * from jsonb_populate_record(null::records, p_record);
+
+    return increment_student_overall(p_overall);
+end;
+$$;
+
+-- 一次写入整份答卷的答题记录并累加总体统计，供 /api/student/submit-batch 使用
+-- p_records 为答题记录数组，p_overall 为这些记录合计的总体统计
+create or replace function submit_attempts(p_records jsonb, p_overall jsonb)
+returns jsonb
+language plpgsql
+as $$
+begin
+    insert into records
+    select * from jsonb_populate_recordset(null::records, p_records);
+
+    return increment_student_overall(p_overall);
+end;
+$$;
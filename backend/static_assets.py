@@ -0,0 +1,158 @@
+"""前端静态资源
+
+全班同时打开页面时，同一份 index.html 会被请求几十上百次。这里把文件内容、ETag 和预压缩的
+gzip / brotli 版本缓存在内存中，每个请求只需一次 stat：
+- 按 Accept-Encoding 返回 br、gzip 或原文，并带 Vary: Accept-Encoding
+- 带 ETag，浏览器重新验证时返回 304，不再传输内容
+- assets/ 下的文件由 Vite 构建时按内容哈希命名，返回一年的 immutable 缓存；
+  其余文件（index.html）每次重新验证，s-maxage 允许 CDN/反向代理短时间缓存，
+  课堂上的集中访问由代理直接响应，不会到达 Python worker
+
+已存在同名 .br / .gz 文件（flask --app app compress-static 生成）时直接使用，否则首次请求时压缩。
+brotli 为可选依赖，未安装时只提供 gzip。
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+import threading
+from pathlib import Path
+
+from flask import Response, request
+
+# 文件名带内容哈希的目录（Vite 的 build.assetsDir）
+FINGERPRINTED_PREFIX = "assets/"
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# 小于该大小（字节）的文件压缩收益不大
+MIN_COMPRESS_SIZE = 1024
+COMPRESSIBLE_TYPES = {"application/javascript", "text/javascript", "application/json",
+                      "image/svg+xml", "application/xml", "application/manifest+json"}
+# 优先级从高到低
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+
+def _brotli_compress(data):
+    try:
+        import brotli
+    except ImportError:
+        return None
+    return brotli.compress(data, quality=11)
+
+
+def _compress(encoding, data):
+    if encoding == "gzip":
+        return gzip.compress(data, compresslevel=9, mtime=0)
+    return _brotli_compress(data)
+
+
+def _is_precompressed(path):
+    return path.endswith(tuple(suffix for _, suffix in ENCODINGS))
+
+
+def is_compressible(path):
+    if _is_precompressed(path):
+        return False
+    mimetype = mimetypes.guess_type(path)[0] or "application/octet-stream"
+    return mimetype.startswith("text/") or mimetype in COMPRESSIBLE_TYPES
+
+
+class _Asset:
+    def __init__(self, stamp, mimetype, etag, bodies):
+        self.stamp = stamp  # (mtime_ns, size)，文件变化后重新加载
+        self.mimetype = mimetype
+        self.etag = etag
+        self.bodies = bodies  # 编码 -> 内容，"identity" 为原文
+
+
+class StaticAssets:
+    """从 root 目录提供静态文件，内容与压缩结果按文件缓存"""
+
+    def __init__(self, root, shared_max_age=0):
+        self.root = Path(root).resolve()
+        self.shared_max_age = shared_max_age
+        self._assets = {}
+        self._lock = threading.Lock()
+
+    def _resolve(self, path):
+        # .br / .gz 只作为压缩版本使用，不单独提供
+        if _is_precompressed(path):
+            return None
+        full_path = (self.root / path).resolve()
+        if full_path != self.root and self.root not in full_path.parents:
+            return None
+        return full_path if full_path.is_file() else None
+
+    def _load(self, full_path, stamp):
+        data = full_path.read_bytes()
+        bodies = {"identity": data}
+        if len(data) >= MIN_COMPRESS_SIZE and is_compressible(full_path.name):
+            for encoding, suffix in ENCODINGS:
+                precompressed = full_path.with_name(full_path.name + suffix)
+                if precompressed.is_file() and precompressed.stat().st_mtime_ns >= stamp[0]:
+                    body = precompressed.read_bytes()
+                else:
+                    body = _compress(encoding, data)
+                if body is not None and len(body) < len(data):
+                    bodies[encoding] = body
+        mimetype = mimetypes.guess_type(full_path.name)[0] or "application/octet-stream"
+        return _Asset(stamp, mimetype, hashlib.sha256(data).hexdigest()[:20], bodies)
+
+    def get(self, path):
+        full_path = self._resolve(path)
+        if full_path is None:
+            return None
+        stat = full_path.stat()
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        asset = self._assets.get(full_path)
+        if asset is None or asset.stamp != stamp:
+            # 加锁避免同时到达的请求重复压缩同一个文件
+            with self._lock:
+                asset = self._assets.get(full_path)
+                if asset is None or asset.stamp != stamp:
+                    asset = self._load(full_path, stamp)
+                    self._assets[full_path] = asset
+        return asset
+
+    def cache_control(self, path):
+        if path.startswith(FINGERPRINTED_PREFIX):
+            return IMMUTABLE_CACHE_CONTROL
+        return f"public, max-age=0, s-maxage={self.shared_max_age}, must-revalidate"
+
+    def response(self, path):
+        """返回当前请求的响应，文件不存在时返回 None"""
+        asset = self.get(path)
+        if asset is None:
+            return None
+
+        encoding = "identity"
+        for candidate, _ in ENCODINGS:
+            if candidate in asset.bodies and request.accept_encodings[candidate]:
+                encoding = candidate
+                break
+
+        response = Response(asset.bodies[encoding], mimetype=asset.mimetype)
+        if encoding != "identity":
+            response.headers["Content-Encoding"] = encoding
+        if len(asset.bodies) > 1:
+            response.vary.add("Accept-Encoding")
+        # 不同编码的内容不同，强 ETag 也必须不同
+        response.set_etag(asset.etag if encoding == "identity" else f"{asset.etag}-{encoding}")
+        response.headers["Cache-Control"] = self.cache_control(path)
+        return response.make_conditional(request)
+
+
+def precompress(root):
+    """为 root 下可压缩的文件生成 .gz（以及安装了 brotli 时的 .br），返回生成的文件数"""
+    written = 0
+    for directory, _, filenames in os.walk(root):
+        for filename in filenames:
+            full_path = Path(directory) / filename
+            if not is_compressible(filename) or full_path.stat().st_size < MIN_COMPRESS_SIZE:
+                continue
+            data = full_path.read_bytes()
+            for encoding, suffix in ENCODINGS:
+                body = _compress(encoding, data)
+                if body is not None and len(body) < len(data):
+                    full_path.with_name(filename + suffix).write_bytes(body)
+                    written += 1
+    return written
@@ -0,0 +1,927 @@
+"""数据存储层
+
+所有路由通过 Storage 接口读写题目、答题场次、学生总体记录、答题详细记录、题目统计和题目图片，
+不直接依赖 Supabase：
+- SupabaseStorage：线上部署使用，数据库函数见 sql/ 目录
+- SQLiteStorage：本地离线上课、测试和压测使用，可以是文件数据库或 ":memory:"
+
+supabase SDK（连带 postgrest、httpx）导入耗时占应用启动的一半以上，只在首次访问数据库时导入并创建客户端，
+Serverless 冷启动和 SQLite 部署都不必承担；需要提前完成时调用 warm_up()。
+
+查询条件统一用 (列名, 操作, 值) 元组表示，操作为 eq、in、gt、gte、lt、lte。
+"""
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+from collections import Counter
+from datetime import datetime
+
+from matchers import normalize_text
+
+IMAGE_BUCKET = "question-images"
+# 每个学生最近记录（计算进步情况）返回的字段
+RECENT_RECORD_FIELDS = ["id", "student_id", "accuracy", "submitted_at"]
+# PostgreSQL 唯一约束冲突的错误码
+UNIQUE_VIOLATION = "23505"
+# 图片按内容命名，内容不变则地址不变，可以长期缓存（秒）
+IMAGE_CACHE_MAX_AGE = 31536000
+
+logger = logging.getLogger("quiz.storage")
+
+_COLUMN_PATTERN = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+
+def _check_column(name):
+    if not _COLUMN_PATTERN.match(name):
+        raise ValueError(f"无效的列名: {name}")
+    return name
+
+
+def _api_error():
+    """postgrest 的 APIError，延迟导入（except 子句只在出现异常时求值，此时客户端已经创建）"""
+    from postgrest.exceptions import APIError
+    return APIError
+
+
+class DuplicateRecord(Exception):
+    """答题记录的ID已存在（同一次作答重复提交），记录未写入，总体统计也未累加"""
+
+
+class Storage:
+    """存储接口"""
+
+    # ---------- 通用查询 ----------
+    def select(self, table, fields=None, filters=(), order=(), limit=None, offset=0):
+        """查询行，order 为 (列名, 是否倒序) 列表"""
+        raise NotImplementedError
+
+    def fetch_page(self, table, fields, order_column, desc=False, limit=1000, after=None, filters=()):
+        """按 (排序列, id) 做游标分页查询，after 为上一页最后一行的 (排序列的值, id)"""
+        raise NotImplementedError
+
+    def count(self, table, filters=()):
+        raise NotImplementedError
+
+    def delete(self, table, filters=()):
+        """删除满足条件的行（无条件时删除全部），返回删除数量"""
+        raise NotImplementedError
+
+    # ---------- 题目 ----------
+    def list_questions(self):
+        raise NotImplementedError
+
+    def insert_question(self, question):
+        """新增题目，返回保存后的题目"""
+        raise NotImplementedError
+
+    def upload_image(self, filename, data, content_type):
+        """保存题目图片，返回公开访问地址；同名文件内容相同，已存在时覆盖或跳过均可"""
+        raise NotImplementedError
+
+    # ---------- 答题场次 ----------
+    def insert_session(self, session):
+        raise NotImplementedError
+
+    def update_session(self, session_id, changes, status=None):
+        """更新场次，status 不为空时只在场次当前处于该状态时更新；返回更新后的场次，未更新时返回 None"""
+        raise NotImplementedError
+
+    # ---------- 答题记录 ----------
+    def get_overall(self, student_id):
+        """获取学生总体记录，不存在时返回 None"""
+        raise NotImplementedError
+
+    def record_attempt(self, detail_record, overall_record):
+        """原子地保存答题记录并累加学生总体统计，返回累加后的总体记录
+
+        overall_record 为学生首次答题时要插入的总体记录，已存在则在原记录上累加。
+        记录ID已存在时抛出 DuplicateRecord。
+        """
+        raise NotImplementedError
+
+    def record_attempts(self, detail_records, overall_record):
+        """原子地保存一次答题的多条记录并累加学生总体统计，返回累加后的总体记录
+
+        overall_record 为这些记录合计的总体统计。任一记录ID已存在时全部不写入并抛出 DuplicateRecord。
+        """
+        raise NotImplementedError
+
+    def increment_overall(self, overall_record):
+        """原子地累加学生总体统计，返回累加后的总体记录"""
+        raise NotImplementedError
+
+    def insert_records(self, records, ignore_duplicates=False):
+        """批量写入答题详细记录；ignore_duplicates 为真时跳过ID已存在的记录，否则抛出 DuplicateRecord"""
+        raise NotImplementedError
+
+    def recent_records_by_student(self, limit):
+        """每个学生最近 limit 条答题记录（RECENT_RECORD_FIELDS），返回 {学生ID: [记录, ...]}，新记录在前"""
+        raise NotImplementedError
+
+    def clear_records(self, scope):
+        """删除范围内的答题记录并修正受影响学生的总体统计
+
+        scope 包含 p_student_ids、p_since、p_until，以及可选的 p_session_id，均为空时清空全部。
+        返回 records_deleted、overall_deleted、overall_rebuilt。
+        """
+        raise NotImplementedError
+
+    def rebuild_student_overall(self, student_ids):
+        """根据答题记录重算指定学生的总体统计，返回 overall_deleted、overall_rebuilt"""
+        raise NotImplementedError
+
+    # ---------- 题目统计 ----------
+    def apply_question_stats(self, deltas):
+        """累加一批题目统计增量（结构见 sql/question_stats.sql）"""
+        raise NotImplementedError
+
+    def rebuild_question_stats(self):
+        """根据答题记录全量重算题目统计，返回 questions、blanks"""
+        raise NotImplementedError
+
+    def warm_up(self):
+        """完成首次访问前的初始化（如创建数据库客户端），避免由第一个请求承担"""
+
+    def check_connection(self):
+        """启动时检查存储是否可用"""
+
+
+# ==================== Supabase ====================
+class AtomicSubmitUnavailable(Exception):
+    """数据库未部署原子提交函数"""
+
+
+class SupabaseStorage(Storage):
+    """基于 Supabase（PostgREST + Storage）的存储"""
+
+    def __init__(self, url, key):
+        self.url = url
+        self._key = key
+        self._client = None
+        self._client_lock = threading.Lock()
+        self._missing_functions = set()  # 数据库中未部署的原子提交函数
+
+    @property
+    def client(self):
+        """Supabase 客户端，首次访问时导入 SDK 并创建"""
+        client = self._client
+        if client is None:
+            with self._client_lock:
+                if self._client is None:
+                    from supabase import create_client
+                    self._client = create_client(self.url, self._key)
+                client = self._client
+        return client
+
+    def warm_up(self):
+        # 访问属性即完成 SDK 导入和客户端创建
+        self.client
+
+    # ---------- 通用查询 ----------
+    def _query(self, table, fields, filters):
+        query = self.client.table(table).select(", ".join(fields) if fields else "*")
+        return self._apply_filters(query, filters)
+
+    @staticmethod
+    def _apply_filters(query, filters):
+        for column, op, value in filters:
+            query = query.in_(column, value) if op == "in" else getattr(query, op)(column, value)
+        return query
+
+    def select(self, table, fields=None, filters=(), order=(), limit=None, offset=0):
+        query = self._query(table, fields, filters)
+        if order:
+            query = query.order(",".join(f"{column}{'.desc' if desc else ''}" for column, desc in order))
+        if limit is not None:
+            query = query.limit(limit)
+        if offset:
+            query = query.offset(offset)
+        return query.execute().data
+
+    def fetch_page(self, table, fields, order_column, desc=False, limit=1000, after=None, filters=()):
+        direction = ".desc" if desc else ""
+        query = self._query(table, fields, filters).order(f"{order_column}{direction},id{direction}")
+
+        if after:
+            value, row_id = after
+            op = "lt" if desc else "gt"
+            # 等价于 (order_column, id) < / > (value, row_id)
+            query.params = query.params.add(
+                "or", f'({order_column}.{op}."{value}",and({order_column}.eq."{value}",id.{op}."{row_id}"))')
+
+        return query.limit(limit).execute().data
+
+    def count(self, table, filters=()):
+        query = self._apply_filters(self.client.table(table).select("id", count="exact"), filters)
+        return query.limit(1).execute().count or 0
+
+    def delete(self, table, filters=()):
+        from postgrest.types import ReturnMethod
+
+        # 只需要删除条数：return=minimal 不返回被删除的行，大量删除时不必把整张表传回来
+        query = self._apply_filters(
+            self.client.table(table).delete(count="exact", returning=ReturnMethod.minimal), filters)
+        if not filters:
+            # PostgREST 不允许无条件删除
+            query = query.not_.is_("id", "null")
+        # 响应体为空时 execute() 会把条数当作 0，这里直接发送请求，从 Content-Range（*/条数）读取条数
+        response = query.session.request(query.http_method, query.path, params=query.params, headers=query.headers)
+        if not response.is_success:
+            raise _api_error()(response.json())
+        total = response.headers.get("content-range", "").rpartition("/")[2]
+        return int(total) if total.isdigit() else 0
+
+    # ---------- 题目 ----------
+    def list_questions(self):
+        return self.client.table("questions").select("*").execute().data
+
+    def insert_question(self, question):
+        return self.client.table("questions").insert(question).execute().data[0]
+
+    def upload_image(self, filename, data, content_type):
+        bucket = self.client.storage.from_(IMAGE_BUCKET)
+        upload_response = bucket.upload(file=data, path=filename, file_options={
+            "content-type": content_type,
+            "cache-control": str(IMAGE_CACHE_MAX_AGE),
+            "upsert": "true"
+        })
+
+        if hasattr(upload_response, 'error') and upload_response.error:
+            raise Exception(f"图片上传失败: {upload_response.error}")
+
+        public_url_response = bucket.get_public_url(filename)
+        if hasattr(public_url_response, 'public_url'):
+            return public_url_response.public_url
+        if isinstance(public_url_response, str):
+            return public_url_response
+        return f"{self.url}/storage/v1/object/public/{IMAGE_BUCKET}/{filename}"
+
+    # ---------- 答题场次 ----------
+    def insert_session(self, session):
+        return self.client.table("quiz_sessions").insert(session).execute().data[0]
+
+    def update_session(self, session_id, changes, status=None):
+        query = self.client.table("quiz_sessions").update(changes).eq("id", session_id)
+        if status is not None:
+            query = query.eq("status", status)
+        rows = query.execute().data
+        return rows[0] if rows else None
+
+    # ---------- 答题记录 ----------
+    def get_overall(self, student_id):
+        rows = self.client.table("student_overall_records").select("*").eq("student_id", student_id).execute().data
+        return rows[0] if rows else None
+
+    def _call_submit_rpc(self, function_name, params):
+        """调用原子提交相关的数据库函数，函数不存在时抛出 AtomicSubmitUnavailable"""
+        if function_name in self._missing_functions:
+            raise AtomicSubmitUnavailable(function_name)
+        try:
+            return self.client.rpc(function_name, params).execute().data
+        except _api_error() as e:
+            if e.code == UNIQUE_VIOLATION:
+                raise DuplicateRecord(function_name) from e
+            if e.code != "PGRST202":
+                raise
+            logger.warning("数据库未部署 %s 函数，改用非原子的逐步写入", function_name)
+            self._missing_functions.add(function_name)
+            raise AtomicSubmitUnavailable(function_name)
+
+    def record_attempt(self, detail_record, overall_record):
+        # 优先调用数据库函数 submit_attempt（见 sql/submit_attempt.sql），一次往返内原子完成；
+        # 数据库尚未部署该函数时退回逐条读写
+        try:
+            return self._call_submit_rpc("submit_attempt", {
+                "p_record": detail_record,
+                "p_overall": overall_record
+            })
+        except AtomicSubmitUnavailable:
+            pass
+
+        # 先写入记录，重复提交时在累加之前失败
+        self.insert_records([detail_record])
+        return self._increment_overall_legacy(overall_record)
+
+    def record_attempts(self, detail_records, overall_record):
+        # 数据库函数 submit_attempts 一次往返内写入全部记录并累加；未部署时退回批量写入 + 累加
+        try:
+            return self._call_submit_rpc("submit_attempts", {
+                "p_records": detail_records,
+                "p_overall": overall_record
+            })
+        except AtomicSubmitUnavailable:
+            pass
+
+        self.insert_records(detail_records)
+        return self.increment_overall(overall_record)
+
+    def increment_overall(self, overall_record):
+        try:
+            return self._call_submit_rpc("increment_student_overall", {"p_overall": overall_record})
+        except AtomicSubmitUnavailable:
+            return self._increment_overall_legacy(overall_record)
+
+    def _increment_overall_legacy(self, overall_record):
+        """读取-修改-写回方式累加总体统计（非原子，并发提交时可能丢失累加）"""
+        student_id = overall_record["student_id"]
+        record = self.get_overall(student_id)
+
+        if not record:
+            # 创建新记录
+            self.client.table("student_overall_records").insert(overall_record).execute()
+            return overall_record
+
+        # 更新现有记录
+        new_total_correct = record["total_correct"] + overall_record["total_correct"]
+        new_total_questions = record["total_questions"] + overall_record["total_questions"]
+        new_total_time = record["total_time"] + overall_record["total_time"]
+
+        return self.client.table("student_overall_records").update({
+            "total_correct": new_total_correct,
+            "total_questions": new_total_questions,
+            "total_time": new_total_time,
+            "accuracy": (new_total_correct / new_total_questions) * 100 if new_total_questions else 0,
+            "last_submitted_at": overall_record["last_submitted_at"]
+        }).eq("student_id", student_id).execute().data[0]
+
+    def insert_records(self, records, ignore_duplicates=False):
+        # PostgREST 批量写入要求每行的字段相同，缺少的可选字段（如 session_id）补为 null
+        columns = set().union(*records) if records else set()
+        rows = [{column: record.get(column) for column in columns} for record in records]
+        try:
+            if ignore_duplicates:
+                self.client.table("records").upsert(rows, on_conflict="id", ignore_duplicates=True).execute()
+            else:
+                self.client.table("records").insert(rows).execute()
+        except _api_error() as e:
+            if e.code == UNIQUE_VIOLATION:
+                raise DuplicateRecord("records") from e
+            raise
+
+    def recent_records_by_student(self, limit):
+        # 窗口函数按学生取前 limit 条，一次往返（见 sql/recent_records.sql）
+        if "recent_records_by_student" not in self._missing_functions:
+            try:
+                return self.client.rpc("recent_records_by_student", {"p_limit": limit}).execute().data or {}
+            except _api_error() as e:
+                if e.code != "PGRST202":
+                    raise
+                logger.warning("数据库未部署 recent_records_by_student 函数，改为按游标分页读取全部记录")
+                self._missing_functions.add("recent_records_by_student")
+
+        # 未部署时按 (submitted_at, id) 游标倒序读取全部记录，不使用 OFFSET
+        grouped = {}
+        after = None
+        while True:
+            rows = self.fetch_page("records", RECENT_RECORD_FIELDS, "submitted_at", desc=True, after=after)
+            for row in rows:
+                student_records = grouped.setdefault(row["student_id"], [])
+                if len(student_records) < limit:
+                    student_records.append(row)
+            if len(rows) < 1000:
+                return grouped
+            after = (rows[-1]["submitted_at"], rows[-1]["id"])
+
+    def clear_records(self, scope):
+        # 集合式删除（见 sql/clear_records.sql）
+        try:
+            return self.client.rpc("clear_records", scope).execute().data
+        except _api_error() as e:
+            if e.code != "PGRST202":
+                raise
+            if any(scope.values()):
+                raise Exception("按范围清空需要先在数据库中执行 sql/clear_records.sql")
+
+        # 数据库未部署 clear_records 函数时，全部清空仍可用两次批量删除完成
+        logger.warning("数据库未部署 clear_records 函数，改用批量删除")
+        return {
+            "records_deleted": self.delete("records"),
+            "overall_deleted": self.delete("student_overall_records"),
+            "overall_rebuilt": 0
+        }
+
+    def rebuild_student_overall(self, student_ids):
+        return self.client.rpc("rebuild_student_overall", {"p_student_ids": list(student_ids)}).execute().data
+
+    # ---------- 题目统计 ----------
+    def apply_question_stats(self, deltas):
+        self.client.rpc("apply_question_stats", {"p_deltas": deltas}).execute()
+
+    def rebuild_question_stats(self):
+        return self.client.rpc("rebuild_question_stats", {}).execute().data
+
+    def check_connection(self):
+        try:
+            test_db = self.client.table("questions").select("id").limit(1).execute()
+            logger.info("Supabase 数据库连接正常，测试查询返回 %d 条记录", len(test_db.data))
+
+            try:
+                buckets = self.client.storage.list_buckets()
+                bucket_names = [bucket.name for bucket in buckets]
+                logger.info("可用存储桶: %s", bucket_names)
+
+                if IMAGE_BUCKET in bucket_names:
+                    try:
+                        files = self.client.storage.from_(IMAGE_BUCKET).list()
+                        logger.info("%s 存储桶存在，文件数量: %d", IMAGE_BUCKET, len(files))
+                    except Exception as bucket_error:
+                        logger.warning("存储桶访问测试失败: %s", bucket_error)
+                else:
+                    logger.warning("%s 存储桶不存在", IMAGE_BUCKET)
+
+            except Exception as storage_error:
+                logger.warning("存储桶列表获取失败: %s", storage_error)
+
+        except Exception as e:
+            logger.error("Supabase 连接测试失败: %s", e)
+
+
+# ==================== SQLite ====================
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS questions (
+    id TEXT PRIMARY KEY,
+    title TEXT NOT NULL,
+    answers TEXT NOT NULL,
+    answer_types TEXT,
+    image_url TEXT,
+    created_at TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS quiz_sessions (
+    id TEXT PRIMARY KEY,
+    title TEXT NOT NULL,
+    question_ids TEXT NOT NULL,
+    shuffle INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL DEFAULT 'draft',
+    snapshot TEXT,
+    created_at TEXT NOT NULL,
+    started_at TEXT,
+    ended_at TEXT
+);
+
+CREATE TABLE IF NOT EXISTS student_overall_records (
+    id TEXT PRIMARY KEY,
+    student_id TEXT NOT NULL UNIQUE,
+    student_name TEXT,
+    total_correct INTEGER NOT NULL DEFAULT 0,
+    total_questions INTEGER NOT NULL DEFAULT 0,
+    total_time INTEGER NOT NULL DEFAULT 0,
+    accuracy REAL,
+    last_submitted_at TEXT,
+    created_at TEXT
+);
+CREATE INDEX IF NOT EXISTS student_overall_records_last_submitted ON student_overall_records (last_submitted_at, id);
+CREATE INDEX IF NOT EXISTS student_overall_records_accuracy ON student_overall_records (accuracy);
+
+CREATE TABLE IF NOT EXISTS records (
+    id TEXT PRIMARY KEY,
+    student_id TEXT NOT NULL,
+    student_name TEXT,
+    question_id TEXT NOT NULL,
+    correct_count INTEGER NOT NULL,
+    total_count INTEGER NOT NULL,
+    accuracy REAL,
+    time_used INTEGER,
+    hint_used INTEGER NOT NULL DEFAULT 0,
+    answer_comparison TEXT,
+    submitted_at TEXT NOT NULL,
+    session_id TEXT
+);
+CREATE INDEX IF NOT EXISTS records_student_submitted ON records (student_id, submitted_at, id);
+CREATE INDEX IF NOT EXISTS records_question ON records (question_id);
+CREATE INDEX IF NOT EXISTS records_submitted ON records (submitted_at, id);
+
+CREATE TABLE IF NOT EXISTS question_stats (
+    question_id TEXT PRIMARY KEY,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    correct_count INTEGER NOT NULL DEFAULT 0,
+    total_count INTEGER NOT NULL DEFAULT 0,
+    time_sum REAL NOT NULL DEFAULT 0,
+    time_sq_sum REAL NOT NULL DEFAULT 0,
+    timed_attempts INTEGER NOT NULL DEFAULT 0,
+    hint_count INTEGER NOT NULL DEFAULT 0,
+    updated_at TEXT
+);
+
+CREATE TABLE IF NOT EXISTS blank_stats (
+    question_id TEXT NOT NULL,
+    blank_index INTEGER NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    correct_count INTEGER NOT NULL DEFAULT 0,
+    wrong_answers TEXT NOT NULL DEFAULT '{}',
+    updated_at TEXT,
+    PRIMARY KEY (question_id, blank_index)
+);
+"""
+
+# 以 JSON 文本保存的列、以整数保存的布尔列
+SQLITE_JSON_COLUMNS = {"answers", "answer_types", "answer_comparison", "wrong_answers", "question_ids", "snapshot"}
+# 建表之后新增的列，打开旧的数据库文件时补上
+SQLITE_ADDED_COLUMNS = {
+    "questions": {"answer_types": "TEXT"},
+    "records": {"session_id": "TEXT"}
+}
+# 依赖新增列的索引，补齐列之后再创建
+SQLITE_ADDED_INDEXES = """
+CREATE INDEX IF NOT EXISTS records_session ON records (session_id, submitted_at);
+"""
+SQLITE_BOOL_COLUMNS = {"hint_used", "shuffle"}
+
+_SQL_OPERATORS = {"eq": "=", "gt": ">", "gte": ">=", "lt": "<", "lte": "<="}
+
+
+class SQLiteStorage(Storage):
+    """基于 SQLite 的本地存储，图片保存在本地目录
+
+    所有操作共用一个连接并串行执行（SQLite 单次查询通常在亚毫秒级）；
+    文件数据库开启 WAL，多个 gunicorn worker 可同时使用同一个文件。
+    """
+
+    def __init__(self, path=":memory:", upload_dir="uploads", upload_url="/uploads"):
+        self.path = path
+        self.upload_dir = upload_dir
+        self.upload_url = upload_url.rstrip("/")
+        self._lock = threading.RLock()
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=10)
+        self._connection.row_factory = sqlite3.Row
+        # 全量重算题目统计时按与增量统计相同的方式归并错误答案
+        self._connection.create_function("normalize_text", 1, normalize_text, deterministic=True)
+        if path != ":memory:":
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.executescript(SQLITE_SCHEMA)
+        self._add_missing_columns()
+
+    # ---------- 内部工具 ----------
+    def _add_missing_columns(self):
+        for table, columns in SQLITE_ADDED_COLUMNS.items():
+            existing = {row["name"] for row in self._connection.execute(f"PRAGMA table_info({table})")}
+            for column, column_type in columns.items():
+                if column not in existing:
+                    self._connection.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+        self._connection.executescript(SQLITE_ADDED_INDEXES)
+
+    def _transaction(self):
+        return _SQLiteTransaction(self)
+
+    def _execute(self, sql, params=()):
+        with self._lock:
+            return self._connection.execute(sql, params)
+
+    @staticmethod
+    def _encode(row):
+        encoded = {}
+        for key, value in row.items():
+            _check_column(key)
+            if key in SQLITE_JSON_COLUMNS and value is not None:
+                value = json.dumps(value, ensure_ascii=False)
+            elif key in SQLITE_BOOL_COLUMNS:
+                value = 1 if value else 0
+            encoded[key] = value
+        return encoded
+
+    @staticmethod
+    def _decode(row):
+        decoded = dict(row)
+        for key in decoded.keys() & SQLITE_JSON_COLUMNS:
+            if decoded[key] is not None:
+                decoded[key] = json.loads(decoded[key])
+        for key in decoded.keys() & SQLITE_BOOL_COLUMNS:
+            decoded[key] = bool(decoded[key])
+        return decoded
+
+    def _insert(self, table, rows, ignore_duplicates=False):
+        if not rows:
+            return
+        encoded = [self._encode(row) for row in rows]
+        columns = list(dict.fromkeys(column for row in encoded for column in row))
+        verb = "INSERT OR IGNORE" if ignore_duplicates else "INSERT"
+        sql = f"{verb} INTO {_check_column(table)} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+        with self._lock:
+            self._connection.executemany(sql, [[row.get(c) for c in columns] for row in encoded])
+
+    @staticmethod
+    def _where(filters):
+        clauses = []
+        params = []
+        for column, op, value in filters:
+            _check_column(column)
+            if op == "in":
+                value = list(value)
+                if not value:
+                    clauses.append("0")
+                    continue
+                clauses.append(f"{column} IN ({', '.join('?' * len(value))})")
+                params.extend(value)
+            else:
+                clauses.append(f"{column} {_SQL_OPERATORS[op]} ?")
+                params.append(value)
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    @staticmethod
+    def _columns(fields):
+        return ", ".join(_check_column(f) for f in fields) if fields else "*"
+
+    # ---------- 通用查询 ----------
+    def select(self, table, fields=None, filters=(), order=(), limit=None, offset=0):
+        where, params = self._where(filters)
+        sql = f"SELECT {self._columns(fields)} FROM {_check_column(table)}{where}"
+        if order:
+            sql += " ORDER BY " + ", ".join(f"{_check_column(c)}{' DESC' if d else ''}" for c, d in order)
+        if limit is not None:
+            sql += " LIMIT ? OFFSET ?"
+            params += [limit, offset]
+        return [self._decode(row) for row in self._execute(sql, params).fetchall()]
+
+    def fetch_page(self, table, fields, order_column, desc=False, limit=1000, after=None, filters=()):
+        _check_column(order_column)
+        where, params = self._where(filters)
+        if after:
+            value, row_id = after
+            op = "<" if desc else ">"
+            keyset = f"({order_column} {op} ? OR ({order_column} = ? AND id {op} ?))"
+            where = f"{where} AND {keyset}" if where else f" WHERE {keyset}"
+            params += [value, value, row_id]
+        direction = " DESC" if desc else ""
+        sql = (f"SELECT {self._columns(fields)} FROM {_check_column(table)}{where} "
+               f"ORDER BY {order_column}{direction}, id{direction} LIMIT ?")
+        return [self._decode(row) for row in self._execute(sql, params + [limit]).fetchall()]
+
+    def count(self, table, filters=()):
+        where, params = self._where(filters)
+        return self._execute(f"SELECT COUNT(*) FROM {_check_column(table)}{where}", params).fetchone()[0]
+
+    def delete(self, table, filters=()):
+        where, params = self._where(filters)
+        return self._execute(f"DELETE FROM {_check_column(table)}{where}", params).rowcount
+
+    # ---------- 题目 ----------
+    def list_questions(self):
+        return self.select("questions", order=[("created_at", False)])
+
+    def insert_question(self, question):
+        self._insert("questions", [question])
+        return question
+
+    def upload_image(self, filename, data, content_type):
+        os.makedirs(self.upload_dir, exist_ok=True)
+        path = os.path.join(self.upload_dir, os.path.basename(filename))
+        if not os.path.exists(path):
+            # 先写临时文件再改名，并发上传同一张图片时不会读到写了一半的文件
+            temp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(temp_path, "wb") as f:
+                f.write(data)
+            os.replace(temp_path, path)
+        return f"{self.upload_url}/{filename}"
+
+    # ---------- 答题场次 ----------
+    def insert_session(self, session):
+        self._insert("quiz_sessions", [session])
+        return session
+
+    def update_session(self, session_id, changes, status=None):
+        encoded = self._encode(changes)
+        filters = [("id", "eq", session_id)]
+        if status is not None:
+            filters.append(("status", "eq", status))
+        where, params = self._where(filters)
+        assignments = ", ".join(f"{column} = ?" for column in encoded)
+        with self._transaction():
+            updated = self._execute(f"UPDATE quiz_sessions SET {assignments}{where}",
+                                    [*encoded.values(), *params]).rowcount
+            if not updated:
+                return None
+            return self.select("quiz_sessions", filters=[("id", "eq", session_id)])[0]
+
+    # ---------- 答题记录 ----------
+    def get_overall(self, student_id):
+        rows = self.select("student_overall_records", filters=[("student_id", "eq", student_id)])
+        return rows[0] if rows else None
+
+    def _increment_overall(self, overall_record):
+        record = self._encode(overall_record)
+        columns = list(record)
+        self._connection.execute(
+            f"INSERT INTO student_overall_records ({', '.join(columns)}) "
+            f"VALUES ({', '.join('?' * len(columns))}) "
+            "ON CONFLICT (student_id) DO UPDATE SET "
+            "total_correct = total_correct + excluded.total_correct, "
+            "total_questions = total_questions + excluded.total_questions, "
+            "total_time = total_time + excluded.total_time, "
+            "accuracy = (total_correct + excluded.total_correct) * 100.0 "
+            "           / NULLIF(total_questions + excluded.total_questions, 0), "
+            "last_submitted_at = excluded.last_submitted_at",
+            [record[c] for c in columns]
+        )
+        row = self._connection.execute("SELECT * FROM student_overall_records WHERE student_id = ?",
+                                       (overall_record["student_id"],)).fetchone()
+        return self._decode(row)
+
+    def record_attempt(self, detail_record, overall_record):
+        return self.record_attempts([detail_record], overall_record)
+
+    def record_attempts(self, detail_records, overall_record):
+        try:
+            with self._transaction():
+                self._insert("records", detail_records)
+                return self._increment_overall(overall_record)
+        except sqlite3.IntegrityError as e:
+            if "UNIQUE" not in str(e):
+                raise
+            raise DuplicateRecord("records") from e
+
+    def increment_overall(self, overall_record):
+        with self._transaction():
+            return self._increment_overall(overall_record)
+
+    def insert_records(self, records, ignore_duplicates=False):
+        try:
+            with self._transaction():
+                self._insert("records", records, ignore_duplicates)
+        except sqlite3.IntegrityError as e:
+            if "UNIQUE" not in str(e):
+                raise
+            raise DuplicateRecord("records") from e
+
+    def recent_records_by_student(self, limit):
+        # 窗口函数按学生取前 limit 条，使用 records_student_submitted 索引
+        rows = self._execute(
+            f"SELECT {', '.join(RECENT_RECORD_FIELDS)} FROM ("
+            f"SELECT {', '.join(RECENT_RECORD_FIELDS)}, "
+            "ROW_NUMBER() OVER (PARTITION BY student_id ORDER BY submitted_at DESC, id) AS rn FROM records"
+            ") WHERE rn <= ? ORDER BY student_id, submitted_at DESC, id", [limit]
+        ).fetchall()
+        grouped = {}
+        for row in rows:
+            grouped.setdefault(row["student_id"], []).append(self._decode(row))
+        return grouped
+
+    def clear_records(self, scope):
+        with self._transaction():
+            if not any(scope.values()):
+                return {
+                    "records_deleted": self.delete("records"),
+                    "overall_deleted": self.delete("student_overall_records"),
+                    "overall_rebuilt": 0
+                }
+
+            filters = records_scope_filters(scope)
+            where, params = self._where(filters)
+            student_ids = [row[0] for row in
+                           self._connection.execute(f"SELECT DISTINCT student_id FROM records{where}", params)]
+            result = {"records_deleted": self.delete("records", filters)}
+            result.update(self.rebuild_student_overall(student_ids))
+            return result
+
+    def rebuild_student_overall(self, student_ids):
+        student_ids = list(student_ids)
+        if not student_ids:
+            return {"overall_deleted": 0, "overall_rebuilt": 0}
+        placeholders = ", ".join("?" * len(student_ids))
+        with self._transaction():
+            deleted = self._connection.execute(
+                f"DELETE FROM student_overall_records WHERE student_id IN ({placeholders}) "
+                "AND NOT EXISTS (SELECT 1 FROM records r WHERE r.student_id = student_overall_records.student_id)",
+                student_ids
+            ).rowcount
+            rebuilt = self._connection.execute(
+                "UPDATE student_overall_records SET "
+                "total_correct = s.total_correct, total_questions = s.total_questions, "
+                "total_time = s.total_time, "
+                "accuracy = s.total_correct * 100.0 / NULLIF(s.total_questions, 0), "
+                "last_submitted_at = s.last_submitted_at "
+                "FROM (SELECT student_id, SUM(correct_count) AS total_correct, SUM(total_count) AS total_questions, "
+                "      COALESCE(SUM(time_used), 0) AS total_time, MAX(submitted_at) AS last_submitted_at "
+                f"      FROM records WHERE student_id IN ({placeholders}) GROUP BY student_id) AS s "
+                "WHERE student_overall_records.student_id = s.student_id",
+                student_ids
+            ).rowcount
+        return {"overall_deleted": deleted, "overall_rebuilt": rebuilt}
+
+    # ---------- 题目统计 ----------
+    def apply_question_stats(self, deltas):
+        now = datetime.now().isoformat()
+        with self._transaction():
+            for d in deltas:
+                self._connection.execute(
+                    "INSERT INTO question_stats (question_id, attempts, correct_count, total_count, time_sum, "
+                    "time_sq_sum, timed_attempts, hint_count, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT (question_id) DO UPDATE SET "
+                    "attempts = attempts + excluded.attempts, "
+                    "correct_count = correct_count + excluded.correct_count, "
+                    "total_count = total_count + excluded.total_count, "
+                    "time_sum = time_sum + excluded.time_sum, "
+                    "time_sq_sum = time_sq_sum + excluded.time_sq_sum, "
+                    "timed_attempts = timed_attempts + excluded.timed_attempts, "
+                    "hint_count = hint_count + excluded.hint_count, "
+                    "updated_at = excluded.updated_at",
+                    (d["question_id"], d["attempts"], d["correct_count"], d["total_count"], d["time_sum"],
+                     d["time_sq_sum"], d["timed_attempts"], d["hint_count"], now)
+                )
+                for b in d["blanks"]:
+                    row = self._connection.execute(
+                        "SELECT attempts, correct_count, wrong_answers FROM blank_stats "
+                        "WHERE question_id = ? AND blank_index = ?", (d["question_id"], b["blank_index"])
+                    ).fetchone()
+                    if row:
+                        wrong_answers = Counter(json.loads(row["wrong_answers"]))
+                        wrong_answers.update(b["wrong_answers"])
+                        attempts = row["attempts"] + b["attempts"]
+                        correct_count = row["correct_count"] + b["correct_count"]
+                    else:
+                        wrong_answers = Counter(b["wrong_answers"])
+                        attempts, correct_count = b["attempts"], b["correct_count"]
+                    self._connection.execute(
+                        "INSERT OR REPLACE INTO blank_stats (question_id, blank_index, attempts, correct_count, "
+                        "wrong_answers, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+                        (d["question_id"], b["blank_index"], attempts, correct_count,
+                         json.dumps(wrong_answers, ensure_ascii=False), now)
+                    )
+
+    def rebuild_question_stats(self):
+        now = datetime.now().isoformat()
+        with self._transaction():
+            self._connection.execute("DELETE FROM question_stats")
+            self._connection.execute("DELETE FROM blank_stats")
+            questions = self._connection.execute(
+                "INSERT INTO question_stats (question_id, attempts, correct_count, total_count, time_sum, "
+                "time_sq_sum, timed_attempts, hint_count, updated_at) "
+                "SELECT question_id, COUNT(*), COALESCE(SUM(correct_count), 0), COALESCE(SUM(total_count), 0), "
+                "COALESCE(SUM(time_used), 0), COALESCE(SUM(time_used * time_used * 1.0), 0), COUNT(time_used), "
+                "SUM(hint_used != 0), ? FROM records GROUP BY question_id", (now,)
+            ).rowcount
+
+            blanks = {}
+            rows = self._connection.execute(
+                "SELECT r.question_id, json_extract(c.value, '$.index') AS blank_index, "
+                "normalize_text(json_extract(c.value, '$.student_answer')) AS answer, "
+                "json_extract(c.value, '$.is_correct') AS is_correct, COUNT(*) AS n "
+                "FROM records r, json_each(r.answer_comparison) c GROUP BY 1, 2, 3, 4"
+            ).fetchall()
+            for row in rows:
+                blank = blanks.setdefault((row["question_id"], row["blank_index"]),
+                                          {"attempts": 0, "correct_count": 0, "wrong_answers": {}})
+                blank["attempts"] += row["n"]
+                if row["is_correct"]:
+                    blank["correct_count"] += row["n"]
+                else:
+                    blank["wrong_answers"][row["answer"]] = row["n"]
+            self._connection.executemany(
+                "INSERT INTO blank_stats (question_id, blank_index, attempts, correct_count, wrong_answers, "
+                "updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+                [(q, i, b["attempts"], b["correct_count"], json.dumps(b["wrong_answers"], ensure_ascii=False), now)
+                 for (q, i), b in blanks.items()]
+            )
+        return {"questions": questions, "blanks": len(blanks)}
+
+    def check_connection(self):
+        logger.info("使用本地 SQLite 存储: %s，题目数量: %d，答题记录数量: %d",
+                    self.path, self.count("questions"), self.count("records"))
+
+
+class _SQLiteTransaction:
+    """写事务：持有连接锁，BEGIN IMMEDIATE 防止多进程同时写入；可重入"""
+
+    def __init__(self, storage):
+        self.storage = storage
+        self.outermost = False
+
+    def __enter__(self):
+        self.storage._lock.acquire()
+        connection = self.storage._connection
+        if not connection.in_transaction:
+            connection.execute("BEGIN IMMEDIATE")
+            self.outermost = True
+        return connection
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if self.outermost:
+                self.storage._connection.execute("ROLLBACK" if exc_type else "COMMIT")
+        finally:
+            self.storage._lock.release()
+
+
+def records_scope_filters(scope):
+    """将记录范围（p_student_ids、p_since、p_until、p_session_id）转换为查询条件"""
+    filters = []
+    if scope.get("p_session_id"):
+        filters.append(("session_id", "eq", scope["p_session_id"]))
+    if scope.get("p_student_ids"):
+        filters.append(("student_id", "in", scope["p_student_ids"]))
+    if scope.get("p_since"):
+        filters.append(("submitted_at", "gte", scope["p_since"]))
+    if scope.get("p_until"):
+        filters.append(("submitted_at", "lt", scope["p_until"]))
+    return filters
+
+
+def create_storage(backend, **options):
+    """根据配置创建存储：supabase（默认）或 sqlite"""
+    if backend == "sqlite":
+        return SQLiteStorage(options.get("sqlite_path") or ":memory:",
+                             upload_dir=options.get("upload_dir") or "uploads")
+    return SupabaseStorage(options["supabase_url"], options["supabase_key"])
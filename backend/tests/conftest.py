@@ -0,0 +1,45 @@
+"""测试公共配置：导入 app 之前设置环境变量（app 导入时按环境变量创建存储），使用 SQLite"""
+import os
+import sys
+import tempfile
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+import pytest
+
+backend_dir = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(backend_dir))
+
+os.environ["STORAGE_BACKEND"] = "sqlite"
+os.environ["SQLITE_PATH"] = ":memory:"
+os.environ.setdefault("LOCAL_UPLOAD_DIR", tempfile.mkdtemp(prefix="quiz-test-"))
+os.environ["RATE_LIMIT_ENABLED"] = "false"
+os.environ["SUBMIT_BUFFERED"] = "false"
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+import app as quiz_app  # noqa: E402
+from storage import create_storage  # noqa: E402
+
+QUESTION_ANSWERS = ["甲", "乙", "丙"]
+
+
+@pytest.fixture
+def storage(tmp_path):
+    """换上全新的 SQLite 文件数据库，写入一道三个填空的题目（ID 为 storage.question_id）"""
+    storage = create_storage("sqlite", sqlite_path=str(tmp_path / "quiz.db"), upload_dir=str(tmp_path / "uploads"))
+    original = quiz_app.storage
+    quiz_app.storage = storage
+    question_id = str(uuid.uuid4())
+    storage.insert_question({
+        "id": question_id,
+        "title": "测试题目",
+        "answers": QUESTION_ANSWERS,
+        "image_url": None,
+        "created_at": datetime.now().isoformat()
+    })
+    quiz_app.invalidate_question_cache()
+    storage.question_id = question_id
+    yield storage
+    quiz_app.storage = original
+    quiz_app.invalidate_question_cache()
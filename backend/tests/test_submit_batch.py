@@ -0,0 +1,41 @@
+"""整份答卷提交：答题期间被删除的题目跳过，其余题目照常批改和保存
+
+运行（在 backend 目录下）：python -m pytest tests
+"""
+import uuid
+
+import app as quiz_app
+from conftest import QUESTION_ANSWERS
+
+
+def submit_batch(question_ids):
+    return quiz_app.app.test_client().post("/api/student/submit-batch", json={
+        "student_id": "b1",
+        "name": "整卷学生",
+        "submissions": [{"question_id": question_id, "answers": QUESTION_ANSWERS, "time_used": 5}
+                        for question_id in question_ids]
+    })
+
+
+def test_deleted_question_is_skipped_and_the_rest_is_saved(storage):
+    deleted_id = str(uuid.uuid4())
+
+    response = submit_batch([storage.question_id, deleted_id])
+
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body["skipped"] == [deleted_id]
+    assert [r["question_id"] for r in body["results"]] == [storage.question_id]
+    assert body["score"] == f"{len(QUESTION_ANSWERS)}/{len(QUESTION_ANSWERS)}"
+    assert storage.count("records", [("student_id", "eq", "b1")]) == 1
+    assert storage.get_overall("b1")["total_questions"] == len(QUESTION_ANSWERS)
+
+
+def test_all_questions_deleted_returns_404(storage):
+    deleted_id = str(uuid.uuid4())
+
+    response = submit_batch([deleted_id])
+
+    assert response.status_code == 404
+    assert response.get_json()["question_ids"] == [deleted_id]
+    assert storage.count("records", [("student_id", "eq", "b1")]) == 0
@@ -0,0 +1,94 @@
+"""并发提交时学生总体统计不丢失
+
+多个线程同时为同一个学生提交答案，总体记录的 total_questions / total_correct 必须与提交的
+总数完全一致（原子累加，不能出现读-改-写覆盖）。存储使用 SQLite 文件数据库。
+
+运行（在 backend 目录下）：python -m pytest tests
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import app as quiz_app
+from conftest import QUESTION_ANSWERS
+from storage import create_storage
+
+THREADS = 16
+SUBMITS_PER_THREAD = 25
+ANSWERS = QUESTION_ANSWERS
+
+
+def run_concurrently(task):
+    """THREADS 个线程同时开始，各执行 SUBMITS_PER_THREAD 次 task，返回所有响应的状态码"""
+    barrier = threading.Barrier(THREADS)
+
+    def worker(thread_index):
+        client = quiz_app.app.test_client()
+        barrier.wait()
+        return [task(client, thread_index, i) for i in range(SUBMITS_PER_THREAD)]
+
+    with ThreadPoolExecutor(THREADS) as executor:
+        return [status for statuses in executor.map(worker, range(THREADS)) for status in statuses]
+
+
+def test_concurrent_submits_keep_exact_totals(storage):
+    # 每次提交答对前两个填空
+    answers = ["甲", "乙", "错"]
+
+    def submit(client, thread_index, i):
+        return client.post("/api/student/submit", json={
+            "student_id": "s1",
+            "name": "并发学生",
+            "question_id": storage.question_id,
+            "answers": answers,
+            "time_used": 1
+        }).status_code
+
+    statuses = run_concurrently(submit)
+    submits = THREADS * SUBMITS_PER_THREAD
+
+    assert statuses == [200] * submits
+    overall = storage.get_overall("s1")
+    assert overall["total_questions"] == submits * len(ANSWERS)
+    assert overall["total_correct"] == submits * 2
+    assert overall["total_time"] == submits
+    assert storage.count("records", [("student_id", "eq", "s1")]) == submits
+
+
+def test_concurrent_batch_submits_keep_exact_totals(storage):
+    def submit_batch(client, thread_index, i):
+        return client.post("/api/student/submit-batch", json={
+            "student_id": "s2",
+            "name": "并发学生",
+            "submissions": [{"question_id": storage.question_id, "answers": ANSWERS, "time_used": 2}]
+        }).status_code
+
+    statuses = run_concurrently(submit_batch)
+    submits = THREADS * SUBMITS_PER_THREAD
+
+    assert statuses == [200] * submits
+    overall = storage.get_overall("s2")
+    assert overall["total_questions"] == submits * len(ANSWERS)
+    assert overall["total_correct"] == submits * len(ANSWERS)
+    assert storage.count("records", [("student_id", "eq", "s2")]) == submits
+
+
+def test_two_connections_to_same_database_keep_exact_totals(storage, tmp_path):
+    """两个存储对象（相当于两个 gunicorn worker）同时写同一个数据库文件"""
+    other = create_storage("sqlite", sqlite_path=str(tmp_path / "quiz.db"), upload_dir=str(tmp_path / "uploads"))
+
+    def submit(client, thread_index, i):
+        target = storage if thread_index % 2 else other
+        detail = quiz_app.build_detail_record("s3", "并发学生", storage.question_id, 1, 3, 1, False, [],
+                                              datetime.now().isoformat())
+        target.record_attempt(detail, quiz_app.build_overall_record("s3", "并发学生", [detail],
+                                                                    detail["submitted_at"]))
+        return 200
+
+    run_concurrently(submit)
+    submits = THREADS * SUBMITS_PER_THREAD
+
+    overall = storage.get_overall("s3")
+    assert overall["total_questions"] == submits * 3
+    assert overall["total_correct"] == submits
+    assert storage.count("records", [("student_id", "eq", "s3")]) == submits
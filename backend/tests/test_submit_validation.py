@@ -0,0 +1,43 @@
+"""提交数据校验：不合法的 time_used 在写入任何数据之前返回 400
+
+运行（在 backend 目录下）：python -m pytest tests
+"""
+import pytest
+
+import app as quiz_app
+
+INVALID_TIME_USED = ["abc", "5", -1, True, [3], float("inf")]
+
+
+def submit(storage, time_used):
+    return quiz_app.app.test_client().post("/api/student/submit", json={
+        "student_id": "v1",
+        "name": "校验学生",
+        "question_id": storage.question_id,
+        "answers": ["甲", "乙", "丙"],
+        "time_used": time_used
+    })
+
+
+def submit_batch(storage, time_used):
+    return quiz_app.app.test_client().post("/api/student/submit-batch", json={
+        "student_id": "v1",
+        "name": "校验学生",
+        "submissions": [{"question_id": storage.question_id, "answers": ["甲", "乙", "丙"], "time_used": time_used}]
+    })
+
+
+@pytest.mark.parametrize("send", [submit, submit_batch])
+@pytest.mark.parametrize("time_used", INVALID_TIME_USED)
+def test_invalid_time_used_is_rejected(storage, send, time_used):
+    response = send(storage, time_used)
+
+    assert response.status_code == 400
+    assert storage.get_overall("v1") is None
+    assert storage.count("records", [("student_id", "eq", "v1")]) == 0
+
+
+@pytest.mark.parametrize("send", [submit, submit_batch])
+@pytest.mark.parametrize("time_used", [None, 0, 12, 3.5])
+def test_valid_time_used_is_accepted(storage, send, time_used):
+    assert send(storage, time_used).status_code == 200
@@ -0,0 +1,52 @@
+"""只配置明文 TEACHER_PASSWORD（不设置 TEACHER_TOKEN_SECRET、TEACHER_PASSWORD_HASH）时教师可以登录
+
+签名密钥由密码的 PBKDF2 哈希派生，另一个实例按相同配置派生出的密钥也能验证令牌。
+
+运行（在 backend 目录下）：python -m pytest tests
+"""
+import pytest
+
+import app as quiz_app
+import auth
+
+USERNAME = "teacher"
+PASSWORD = "明文密码-123"
+
+
+def plaintext_tokens():
+    return auth.TokenManager(quiz_app.teacher_signing_key(), quiz_app.TEACHER_TOKEN_TTL)
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(quiz_app, "TEACHER_USERNAME", USERNAME)
+    monkeypatch.setattr(quiz_app, "TEACHER_PASSWORD", PASSWORD)
+    monkeypatch.setattr(quiz_app, "TEACHER_PASSWORD_HASH", None)
+    monkeypatch.setattr(quiz_app, "TEACHER_TOKEN_SECRET", None)
+    monkeypatch.setattr(quiz_app, "teacher_tokens", plaintext_tokens())
+    return quiz_app.app.test_client()
+
+
+def test_login_with_plaintext_password_only(client):
+    response = client.post("/api/teacher/login", json={"username": USERNAME, "password": PASSWORD})
+
+    assert response.status_code == 200
+    token = response.get_json()["token"]
+    assert client.get("/api/records/queue", headers={"Authorization": token}).status_code == 200
+    # 另一个实例（Serverless、gunicorn 多 worker）按相同配置派生出相同的密钥
+    assert plaintext_tokens().verify(token) is not None
+
+
+def test_login_with_wrong_plaintext_password(client):
+    response = client.post("/api/teacher/login", json={"username": USERNAME, "password": "wrong"})
+
+    assert response.status_code == 401
+
+
+def test_signing_key_is_not_derived_from_password_alone():
+    """签名密钥不能按 HMAC 的速度由明文密码穷举出来"""
+    key = auth.derive_password_signing_key(USERNAME, PASSWORD)
+
+    assert key != auth.derive_signing_key(None, USERNAME, PASSWORD)
+    assert key == auth.derive_password_signing_key(USERNAME, PASSWORD)
+    assert key != auth.derive_password_signing_key(USERNAME, "另一个密码")
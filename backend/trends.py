@@ -0,0 +1,145 @@
+"""学生答题趋势
+
+每个学生的答题记录按提交顺序保存为一条时间序列：正确率、用时、是否使用提示各占一个 array 列
+（float32 / float32 / int8，每条记录 9 字节），几千条记录的学生也只占几十 KB。
+连对次数在追加记录时维护，趋势统计只读取最近两个窗口的数据，计算量为 O(window)，
+不需要把完整的答题历史返回给前端。
+
+提交时间早于已读到的最新记录、但稍后才写入的记录（缓冲写入队列、其他实例、并发提交）
+不能只靠 (submitted_at, id) 游标发现：每次增量加载从最新提交时间往前重叠一段时间重新读取，
+按记录ID去重，迟到的记录按到达顺序追加。
+"""
+import math
+from array import array
+from datetime import datetime, timedelta
+
+# 正确率达到该值视为全对，计入连对次数
+FULL_MARK = 100
+
+
+class StudentSeries:
+    """一个学生按提交顺序的答题序列"""
+
+    def __init__(self):
+        self.accuracy = array("f")
+        self.time_used = array("f")  # 未记录用时为 NaN
+        self.hint_used = array("b")
+        self.current_streak = 0
+        self.longest_streak = 0
+        self.latest = None  # 已读到的最新提交时间
+        self._recent_ids = {}  # 重叠窗口内已追加的记录ID -> 提交时间，用于去重
+
+    def __len__(self):
+        return len(self.accuracy)
+
+    def since(self, overlap):
+        """增量加载的起始提交时间（最新提交时间往前 overlap 秒），尚未加载过时返回 None
+
+        同时丢弃早于该时间的去重记录，去重集合只保留重叠窗口内的ID。
+        """
+        if self.latest is None:
+            return None
+        try:
+            since = (datetime.fromisoformat(self.latest) - timedelta(seconds=overlap)).isoformat()
+        except ValueError:
+            since = self.latest
+        self._recent_ids = {record_id: submitted_at for record_id, submitted_at in self._recent_ids.items()
+                            if submitted_at >= since}
+        return since
+
+    def append(self, record):
+        """追加一条答题记录，ID已追加过时跳过并返回 False"""
+        record_id, submitted_at = str(record["id"]), str(record["submitted_at"])
+        if record_id in self._recent_ids:
+            return False
+        self._recent_ids[record_id] = submitted_at
+        if self.latest is None or submitted_at > self.latest:
+            self.latest = submitted_at
+
+        accuracy = record.get("accuracy") or 0
+        time_used = record.get("time_used")
+        self.accuracy.append(accuracy)
+        self.time_used.append(math.nan if time_used is None else time_used)
+        self.hint_used.append(1 if record.get("hint_used") else 0)
+
+        if accuracy >= FULL_MARK:
+            self.current_streak += 1
+            self.longest_streak = max(self.longest_streak, self.current_streak)
+        else:
+            self.current_streak = 0
+        return True
+
+
+def _round(value):
+    return None if value is None else round(value, 2)
+
+
+def _mean(values):
+    values = [v for v in values if not math.isnan(v)]
+    return sum(values) / len(values) if values else None
+
+
+def _slope(values):
+    """按答题次序（0, 1, 2, ...）做最小二乘直线拟合，返回每次答题的变化量，跳过 NaN"""
+    points = [(x, y) for x, y in enumerate(values) if not math.isnan(y)]
+    if len(points) < 2:
+        return None
+    mean_x = sum(x for x, _ in points) / len(points)
+    mean_y = sum(y for _, y in points) / len(points)
+    denominator = sum((x - mean_x) ** 2 for x, _ in points)
+    return sum((x - mean_x) * (y - mean_y) for x, y in points) / denominator
+
+
+def _rolling(values, window, count):
+    """最后 count 个位置上、各自向前 window 条记录的移动平均（滑动求和）"""
+    averages = []
+    total = 0.0
+    for i, value in enumerate(values):
+        total += value
+        if i >= window:
+            total -= values[i - window]
+        if i >= len(values) - count:
+            averages.append(round(total / min(i + 1, window), 2))
+    return averages
+
+
+def summarize(series, window):
+    """最近 window 条记录的趋势：移动平均、与上一个窗口的差值、线性回归斜率、连对次数
+
+    只读取最近 2 * window 条记录。
+    """
+    size = len(series)
+    start = max(0, size - window)
+    previous_start = max(0, start - window)
+
+    accuracy = series.accuracy[start:]
+    previous_accuracy = series.accuracy[previous_start:start]
+    time_used = series.time_used[start:]
+    hint_used = series.hint_used[start:]
+
+    recent_average = _mean(accuracy)
+    previous_average = _mean(previous_accuracy)
+    change = None if recent_average is None or previous_average is None else recent_average - previous_average
+
+    return {
+        "attempts": size,
+        "window": len(accuracy),
+        "accuracy": {
+            "rolling_average": _round(recent_average),
+            "previous_average": _round(previous_average),
+            "change": _round(change),
+            "slope": _round(_slope(accuracy)),
+            "rolling": _rolling(series.accuracy[previous_start:], window, len(accuracy)),
+        },
+        "time_used": {
+            "rolling_average": _round(_mean(time_used)),
+            "slope": _round(_slope(time_used)),
+        },
+        "hint_rate": _round(sum(hint_used) * 100 / len(hint_used)) if hint_used else None,
+        "streaks": {"current": series.current_streak, "longest": series.longest_streak},
+        "recent": {
+            "accuracy": [round(v, 2) for v in accuracy],
+            "time_used": [None if math.isnan(v) else round(v, 2) for v in time_used],
+            "hint_used": [bool(v) for v in hint_used],
+        },
+    }